@@ -7,7 +7,7 @@
 # Description: python script for  Interpretation of Pathogenetic Benign
 #########################################################################
 
-import copy,logging,os,io,re,time,sys,platform,optparse,gzip,glob
+import copy,logging,os,io,re,time,sys,platform,optparse,gzip,glob,pickle,struct,mmap,array,bisect,operator,locale,threading,hashlib
 
 prog="InterVar"
 
@@ -62,8 +62,10 @@ is_exclude_snps_exist=False
 
 if platform.python_version() < '3.0.0' :
     import ConfigParser
+    import Queue as queue
 else:
     import configparser
+    import queue
 
 paras = {}
 
@@ -90,30 +92,785 @@ class myGzipFile(gzip.GzipFile):
         self.close() 
 
 
+#variant keys packed into 64 bits: chromosome 6 bits, position 32 bits, ref and alt allele 13 bits each
+CHROM_CODES=dict((str(i),i) for i in range(1,23))
+CHROM_CODES.update({'X':23,'Y':24,'M':25,'MT':26})
+CHROM_NAMES=dict((code,chrom) for chrom,code in CHROM_CODES.items())
+ALLELE_CODES={'-':0}
+ALLELE_BASES={'A':0,'C':1,'G':2,'T':3}
+
+#the same codes for the chromosome names before the "chr" prefix is removed
+STRIPPED_CHROM_CODES=dict(CHROM_CODES)
+for chrom,code in CHROM_CODES.items():
+    for prefix in ['chr','Chr','cHr','chR','CHr','ChR','cHR','CHR']:
+        STRIPPED_CHROM_CODES[prefix+chrom]=code
+
+def site_code(chrom_code,start):
+    '''
+    (chromosome,position) of a variant as one integer for the Bloom filters,
+    None when the position is not a plain number
+    '''
+    if chrom_code is None or not start.isdigit() or start[0]=='0' or len(start)>9:
+        return(None)
+    return((chrom_code<<32)|int(start))
+
+def allele_code(allele):
+    '''
+    2 bits per base after a leading 1 bit, so alleles of different length
+    never collide; '-' is 0. None for alleles longer than 6 bases or not ACGT
+    '''
+    code=ALLELE_CODES.get(allele)
+    if code is None and len(allele)<=6:
+        code=1
+        for nt in allele:
+            if nt not in ALLELE_BASES:
+                return(None)
+            code=(code<<2)|ALLELE_BASES[nt]
+        ALLELE_CODES[allele]=code
+    return(code)
+
+def allele_name(code):
+    if code==0:
+        return('-')
+    allele=''
+    while code>1:
+        allele='ACGT'[code&3]+allele
+        code=code>>2
+    return(allele)
+
+def pack_variant(chrom,start,end,ref,alt):
+    '''
+    The 64 bits key of a variant, None when it can not be packed exactly: start
+    and end differ, unknown chromosome, position not a plain number, long alleles
+    '''
+    if start != end:
+        return(None)
+    chrom_code=CHROM_CODES.get(chrom)
+    if chrom_code is None or not start.isdigit() or start[0]=='0' or len(start)>9:
+        return(None)
+    ref_code=allele_code(ref)
+    alt_code=allele_code(alt)
+    if ref_code is None or alt_code is None:
+        return(None)
+    return((chrom_code<<58)|(int(start)<<26)|(ref_code<<13)|alt_code)
+
+def unpack_variant(key):
+    pos=str((key>>26)&0xffffffff)
+    return((CHROM_NAMES[key>>58],pos,pos,allele_name((key>>13)&0x1fff),allele_name(key&0x1fff)))
+
+class VariantKeyTable(object):
+    '''
+    Variant-keyed dataset, keyed by the (chrom,start,end,ref,alt) tuple like a
+    dict. Packed keys are kept in a sorted array('Q') with an index into the
+    interned values, the few keys which can not be packed go to a plain dict.
+    Call finish() after the last add().
+    '''
+    def __init__(self):
+        self.keys=array.array('Q')
+        self.value_index=array.array('I')
+        self.values=[]
+        self.overflow={}
+        self.pending={}
+        self.bloom=bytearray(8)
+        self.bloom_mask=63
+        self.overflow_sites=set()
+        self.stats=[0,0,0] # lookups, passed the Bloom filter, found
+        self.cursor=0
+        self.chrom_offsets={}
+
+    def add(self,key,value):
+        packed=pack_variant(*key)
+        if packed is None:
+            self.overflow[key]=value
+        else:
+            self.pending[packed]=value
+
+    def finish(self):
+        '''
+        Sort the packed keys into the arrays in one pass, the values interned
+        in the order of their first key
+        '''
+        pending=self.pending
+        order=sorted(pending)
+        interned=dict((value,i) for (i,value) in enumerate(self.values))
+        index=[interned.setdefault(value,len(interned)) for value in map(pending.__getitem__,order)]
+        self.values=list(interned)
+        self.keys=array.array('Q',order)
+        self.value_index=array.array('I',index)
+        self.pending={}
+        self.build_bloom()
+        return(self)
+
+    def build_bloom(self):
+        '''
+        Bloom filter of the (chromosome,position) sites, about 10 bits and 3
+        hashes per site; the sites which have no site_code() are kept in a set
+        '''
+        codes=set(packed>>26 for packed in self.keys)
+        self.overflow_sites=set()
+        for key in self.overflow:
+            code=site_code(CHROM_CODES.get(key[0]),key[1])
+            if code is None:
+                self.overflow_sites.add((key[0],key[1]))
+            else:
+                codes.add(code)
+        bits=64
+        while bits<10*len(codes):
+            bits=bits*2
+        bloom=bytearray(bits//8)
+        mask=bits-1
+        # bloom_bits inlined, it is called once per site
+        for code in codes:
+            h1=(code*0x9E3779B97F4A7C15)>>17
+            h2=((code*0xC2B2AE3D27D4EB4F)>>23)|1
+            bit=h1&mask
+            bloom[bit>>3]|=1<<(bit&7)
+            bit=(h1+h2)&mask
+            bloom[bit>>3]|=1<<(bit&7)
+            bit=(h1+2*h2)&mask
+            bloom[bit>>3]|=1<<(bit&7)
+        self.bloom=bloom
+        self.bloom_mask=mask
+
+    def bloom_bits(self,code):
+        h1=(code*0x9E3779B97F4A7C15)>>17
+        h2=((code*0xC2B2AE3D27D4EB4F)>>23)|1
+        mask=self.bloom_mask
+        return((h1&mask,(h1+h2)&mask,(h1+2*h2)&mask))
+
+    def lookup(self,chrom,start,end,ref,alt,strip_chr=False):
+        '''
+        table[(chrom,start,end,ref,alt)] behind the Bloom filter: a row whose
+        site is not in the table raises KeyError before its key is built.
+        strip_chr removes the "chr" of chrom like the readers did
+        '''
+        stats=self.stats
+        stats[0]+=1
+        if strip_chr:
+            chrom_code=STRIPPED_CHROM_CODES.get(chrom)
+            if chrom_code is None:
+                chrom=re.sub("[Cc][Hh][Rr]","",chrom)
+                chrom_code=CHROM_CODES.get(chrom)
+                strip_chr=False
+        else:
+            chrom_code=CHROM_CODES.get(chrom)
+        code=site_code(chrom_code,start)
+        if code is not None:
+            bloom=self.bloom
+            for bit in self.bloom_bits(code):
+                if not bloom[bit>>3]&(1<<(bit&7)):
+                    raise KeyError((chrom,start,end,ref,alt))
+        if strip_chr:
+            chrom=re.sub("[Cc][Hh][Rr]","",chrom)
+        if code is None and (chrom,start) not in self.overflow_sites:
+            raise KeyError((chrom,start,end,ref,alt))
+        stats[1]+=1
+        value=self[(chrom,start,end,ref,alt)]
+        stats[2]+=1
+        return(value)
+
+    def find(self,packed):
+        if kb_merge:
+            return(self.find_merge(packed))
+        i=bisect.bisect_left(self.keys,packed)
+        if i<len(self.keys) and self.keys[i]==packed:
+            return(i)
+        return(-1)
+
+    def find_merge(self,packed):
+        '''
+        find() for input sorted by position: search forward from the last key
+        found, in steps doubling from 1, so only the keys near the current
+        variant are touched. A key behind the cursor restarts the walk from
+        the first key of its chromosome
+        '''
+        keys=self.keys
+        n=len(keys)
+        lo=self.cursor
+        if lo>0 and keys[lo-1]>=packed:
+            chrom=packed>>58
+            lo=self.chrom_offsets.get(chrom)
+            if lo is None:
+                lo=bisect.bisect_left(keys,chrom<<58)
+                self.chrom_offsets[chrom]=lo
+        hi=lo
+        step=1
+        while hi<n and keys[hi]<packed:
+            lo=hi+1
+            hi=hi+step
+            step=step*2
+        i=bisect.bisect_left(keys,packed,lo,min(hi,n))
+        self.cursor=i
+        if i<n and keys[i]==packed:
+            return(i)
+        return(-1)
+
+    def get(self,key,default=None):
+        packed=pack_variant(*key)
+        if packed is None:
+            return(self.overflow.get(key,default))
+        i=self.find(packed)
+        if i<0:
+            return(default)
+        return(self.values[self.value_index[i]])
+
+    def __getitem__(self,key):
+        packed=pack_variant(*key)
+        if packed is None:
+            return(self.overflow[key])
+        i=self.find(packed)
+        if i<0:
+            raise KeyError(key)
+        return(self.values[self.value_index[i]])
+
+    def __contains__(self,key):
+        return(self.get(key) is not None)
+
+    def __len__(self):
+        return(len(self.keys)+len(self.overflow))
+
+    def get_batch(self,keys,default=None):
+        '''
+        Look up a chunk of variants at once: the packed keys are sorted and
+        found by one forward walk over the table
+        '''
+        out=[default]*len(keys)
+        packed=[]
+        for i,key in enumerate(keys):
+            k=pack_variant(*key)
+            if k is None:
+                out[i]=self.overflow.get(key,default)
+            else:
+                packed.append((k,i))
+        packed.sort()
+        table_keys=self.keys
+        n=len(table_keys)
+        lo=0
+        for k,i in packed:
+            lo=bisect.bisect_left(table_keys,k,lo)
+            if lo<n and table_keys[lo]==k:
+                out[i]=self.values[self.value_index[lo]]
+        return(out)
+
+    def items(self):
+        for i in range(len(self.keys)):
+            yield (unpack_variant(self.keys[i]),self.values[self.value_index[i]])
+        for item in self.overflow.items():
+            yield item
+
+    def chrom_windows(self):
+        '''
+        The (first,last+1) key of each chromosome, the keys are sorted by chromosome
+        '''
+        windows={}
+        for chrom in CHROM_NAMES:
+            lo=bisect.bisect_left(self.keys,chrom<<58)
+            hi=bisect.bisect_left(self.keys,(chrom+1)<<58)
+            if hi>lo:
+                windows[chrom]=(lo,hi)
+        return(windows)
+
+    def to_bytes(self):
+        '''
+        The table for the snapshot: the counts, the keys and the value index,
+        the Bloom filter, the values by kb_values() and then the pickled
+        overflow dict and sites, the few keys pack_variant() can not pack
+        '''
+        values=kb_values(self.values)
+        rest=pickle.dumps((self.overflow,self.overflow_sites),pickle.HIGHEST_PROTOCOL)
+        return(b''.join([array.array('Q',[len(self.keys),len(values),len(self.bloom),len(rest)]).tobytes(),self.keys.tobytes(),
+            self.value_index.tobytes(),b'\0'*(-4*len(self.keys) % 8),bytes(self.bloom),values,rest]))
+
+    @classmethod
+    def from_buffer(cls,kb_mmap,start):
+        '''
+        The table over a snapshot mmap, keys, value index and values are not
+        copied, a value is decoded when it is looked up
+        '''
+        table=cls()
+        (count,values_len,bloom_len,rest_len)=struct.unpack_from('=QQQQ',kb_mmap,start)
+        view=memoryview(kb_mmap)
+        keys_start=start+32
+        index_start=keys_start+8*count
+        bloom_start=index_start+4*count+(-4*count % 8)
+        values_start=bloom_start+bloom_len
+        rest_start=values_start+values_len
+        table.keys=view[keys_start:index_start].cast('Q')
+        table.value_index=view[index_start:index_start+4*count].cast('I')
+        table.bloom=view[bloom_start:values_start]
+        table.bloom_mask=8*bloom_len-1
+        table.values=BufferValues(kb_mmap,values_start)
+        (table.overflow,table.overflow_sites)=kb_loads(kb_mmap[rest_start:rest_start+rest_len])
+        return(table)
+
+def kb_value(value):
+    '''
+    A value of the variant datasets as bytes: str, tuple of str and tuple of
+    tuples of str (the PS1 sites) are text, each item followed by a 0x1f
+    and each inner item by a 0x1e byte; other values are pickled
+    '''
+    if isinstance(value,str):
+        return(b's'+value.encode('utf-8'))
+    if isinstance(value,tuple) and all(isinstance(item,str) for item in value):
+        return(b't'+''.join(item+'\x1f' for item in value).encode('utf-8'))
+    if isinstance(value,tuple) and all(isinstance(item,tuple) and all(isinstance(x,str) for x in item) for item in value):
+        return(b'p'+''.join(''.join(x+'\x1e' for x in item)+'\x1f' for item in value).encode('utf-8'))
+    return(b'k'+pickle.dumps(value,pickle.HIGHEST_PROTOCOL))
+
+def kb_value_loads(data):
+    kind=data[:1]
+    if kind==b'k':
+        return(kb_loads(data[1:]))
+    text=data[1:].decode('utf-8')
+    if kind==b's':
+        return(text)
+    if kind==b't':
+        return(tuple(text.split('\x1f')[:-1]))
+    return(tuple(tuple(item.split('\x1e')[:-1]) for item in text.split('\x1f')[:-1]))
+
+def kb_values(values):
+    '''
+    The values of a VariantKeyTable for BufferValues: the count, the value
+    offsets (count+1) and the kb_value() bytes, zero padded to 8 bytes
+    '''
+    values=[kb_value(value) for value in values]
+    offsets=array.array('Q',[0])
+    for value in values:
+        offsets.append(offsets[-1]+len(value))
+    blob=b''.join([array.array('Q',[len(values)]).tobytes(),offsets.tobytes()]+values)
+    return(blob+b'\0'*(-len(blob) % 8))
+
+class BufferValues(object):
+    '''
+    The values written by kb_values() in a buffer, e.g. the mmap of the
+    snapshot: values[i] decodes the i-th value only
+    '''
+    def __init__(self,buf,start):
+        (self.count,)=struct.unpack_from('=Q',buf,start)
+        self.value_offsets=memoryview(buf)[start+8:start+16+8*self.count].cast('Q')
+        self.values_start=start+16+8*self.count
+        self.buf=buf
+
+    def __getitem__(self,i):
+        return(kb_value_loads(self.buf[self.values_start+self.value_offsets[i]:self.values_start+self.value_offsets[i+1]]))
+
+    def __len__(self):
+        return(self.count)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+def kb_keys(keys):
+    '''
+    Sorted str keys for BufferKeys: the count, the key offsets (count+1) and
+    the key bytes, zero padded to 8 bytes
+    '''
+    keys=[key.encode('utf-8') for key in keys]
+    offsets=array.array('Q',[0])
+    for key in keys:
+        offsets.append(offsets[-1]+len(key))
+    blob=b''.join([array.array('Q',[len(keys)]).tobytes(),offsets.tobytes()]+keys)
+    return(blob+b'\0'*(-len(blob) % 8))
+
+class BufferKeys(object):
+    '''
+    The sorted keys written by kb_keys() in a buffer, e.g. the mmap of the
+    snapshot: get() is the position of a key, found by binary search, and
+    end the offset following the keys
+    '''
+    def __init__(self,buf,start):
+        (self.count,)=struct.unpack_from('=Q',buf,start)
+        view=memoryview(buf)
+        offsets_start=start+8
+        self.keys_start=offsets_start+8*(self.count+1)
+        self.key_offsets=view[offsets_start:self.keys_start].cast('Q')
+        self.end=self.keys_start+self.key_offsets[self.count]
+        self.end=self.end+(-(self.end-start) % 8)
+        self.buf=buf
+
+    def key(self,i):
+        return(self.buf[self.keys_start+self.key_offsets[i]:self.keys_start+self.key_offsets[i+1]])
+
+    def get(self,key,default=None):
+        key=key.encode('utf-8')
+        lo=0
+        hi=self.count
+        while lo<hi:
+            mid=(lo+hi)//2
+            if self.key(mid)<key:
+                lo=mid+1
+            else:
+                hi=mid
+        if lo<self.count and self.key(lo)==key:
+            return(lo)
+        return(default)
+
+    def __contains__(self,key):
+        return(self.get(key) is not None)
+
+    def __len__(self):
+        return(self.count)
+
+    def items(self):
+        for i in range(self.count):
+            yield (self.key(i).decode('utf-8'),i)
+
+class SortedCodes(object):
+    '''
+    A set of integers held as a sorted array, e.g. a view of the snapshot
+    '''
+    def __init__(self,codes):
+        self.codes=codes
+
+    def __contains__(self,code):
+        i=bisect.bisect_left(self.codes,code)
+        return(i<len(self.codes) and self.codes[i]==code)
+
+    def __len__(self):
+        return(len(self.codes))
+
+    def __iter__(self):
+        return(iter(self.codes))
+
+def kb_array(typecode,values):
+    blob=array.array(typecode,values).tobytes()
+    return(blob+b'\0'*(-len(blob) % 8))
+
+def buffer_array(buf,start,typecode,count):
+    '''
+    The array written by kb_array() as a view of the buffer, and the offset following it
+    '''
+    size=array.array(typecode).itemsize*count
+    return((memoryview(buf)[start:start+size].cast(typecode),start+size+(-size % 8)))
+
+class CanonicalTranscripts(object):
+    '''
+    knownGeneCanonical for PVS1: the exon count and the 3' end cutoff (end-50)
+    of each canonical transcript in integer arrays, found through the index of
+    the transcript ids
+    '''
+    def __init__(self):
+        self.index={}
+        self.exons=array.array('I')
+        self.tails=array.array('q')
+
+    def add(self,trans_id,exons,end):
+        self.index[trans_id]=len(self.exons)
+        self.exons.append(exons)
+        self.tails.append(end-50)
+
+    def to_bytes(self):
+        '''
+        The transcript ids by kb_keys() and the arrays in their order, for from_buffer()
+        '''
+        ids=sorted(self.index)
+        return(kb_keys(ids)+kb_array('I',[self.exons[self.index[trans_id]] for trans_id in ids])
+            +kb_array('q',[self.tails[self.index[trans_id]] for trans_id in ids]))
+
+    @classmethod
+    def from_buffer(cls,buf,start):
+        '''
+        The transcripts over the mmap of the snapshot, nothing is copied
+        '''
+        table=cls()
+        table.index=BufferKeys(buf,start)
+        (table.exons,start)=buffer_array(buf,table.index.end,'I',len(table.index))
+        (table.tails,start)=buffer_array(buf,start,'q',len(table.index))
+        return(table)
+
+    def last_exon_or_tail(self,trans_id,exon,start):
+        '''
+        True when the variant is in the last exon of the transcript or, for a
+        float start, closer than 50 bp to its end
+        '''
+        i=self.index.get(trans_id)
+        if i is None:
+            return(False)
+        if exon=="exon%d" % self.exons[i]:
+            return(True)
+        return(start is not None and start>self.tails[i])
+
+    def get(self,trans_id,default=None):
+        i=self.index.get(trans_id)
+        if i is None:
+            return(default)
+        return((self.exons[i],self.tails[i]+50))
+
+    def __getitem__(self,trans_id):
+        i=self.index.get(trans_id)
+        if i is None:
+            raise KeyError(trans_id)
+        return((self.exons[i],self.tails[i]+50))
+
+    def __contains__(self,trans_id):
+        return(trans_id in self.index)
+
+    def __len__(self):
+        return(len(self.index))
+
+    def items(self):
+        for trans_id,i in self.index.items():
+            yield (trans_id,(self.exons[i],self.tails[i]+50))
+
+class OrphaDetails(object):
+    '''
+    The Orpha column text of orpha.txt by Orpha number, kept as the byte
+    offset and length in the file and read from its mmap on demand
+    '''
+    def __init__(self,path=None):
+        self.path=path
+        self.spans={}
+        self.text=None
+
+    def __getstate__(self):
+        return((self.path,self.spans))
+
+    def __setstate__(self,state):
+        (self.path,self.spans)=state
+        self.text=None
+
+    def close(self):
+        if self.text is not None:
+            self.text.close()
+            self.text=None
+
+    def add(self,orpha,offset,length):
+        self.spans[orpha]=(offset<<24)|length
+
+    def to_bytes(self):
+        '''
+        The Orpha numbers by kb_keys(), the spans in their order and the path, for from_buffer()
+        '''
+        orphas=sorted(self.spans)
+        path=self.path.encode('utf-8')
+        return(kb_keys(orphas)+kb_array('Q',[self.spans[orpha] for orpha in orphas])+kb_array('Q',[len(path)])+path)
+
+    @classmethod
+    def from_buffer(cls,buf,start):
+        '''
+        The spans over the mmap of the snapshot, nothing is copied
+        '''
+        orphas=BufferKeys(buf,start)
+        (spans,start)=buffer_array(buf,orphas.end,'Q',len(orphas))
+        (path_len,)=struct.unpack_from('=Q',buf,start)
+        table=cls(bytes(buf[start+8:start+8+path_len]).decode('utf-8'))
+        table.spans=BufferSpans(orphas,spans)
+        return(table)
+
+    def get(self,orpha,default=None):
+        span=self.spans.get(orpha)
+        if span is None:
+            return(default)
+        if self.text is None:
+            with open(self.path,"rb") as fh:
+                self.text=mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)
+        return(self.text[span>>24:(span>>24)+(span&0xffffff)].decode('utf-8'))
+
+    def __getitem__(self,orpha):
+        if orpha not in self.spans:
+            raise KeyError(orpha)
+        return(self.get(orpha))
+
+    def __contains__(self,orpha):
+        return(orpha in self.spans)
+
+    def __len__(self):
+        return(len(self.spans))
+
+    def items(self):
+        for orpha,span in self.spans.items():
+            yield (orpha,self.get(orpha))
+
+class BufferSpans(object):
+    '''
+    The spans of OrphaDetails over the snapshot: the Orpha numbers as
+    BufferKeys and the spans as a view in their order
+    '''
+    def __init__(self,orphas,spans):
+        self.orphas=orphas
+        self.spans=spans
+
+    def get(self,orpha,default=None):
+        i=self.orphas.get(orpha)
+        if i is None:
+            return(default)
+        return(self.spans[i])
+
+    def __contains__(self,orpha):
+        return(orpha in self.orphas)
+
+    def __len__(self):
+        return(len(self.orphas))
+
+    def items(self):
+        for orpha,i in self.orphas.items():
+            yield (orpha,self.spans[i])
+
+class DomainIndex(object):
+    '''
+    PM1_domains_with_benigns: the "chromosome<tab>gene" pairs and the
+    Interpro_domain strings are interned to ids, each domain with benign
+    variants is one integer (gene id<<32|domain id) in a set
+    '''
+    def __init__(self):
+        self.gene_ids={}
+        self.domain_ids={}
+        self.pairs=set()
+
+    def add(self,chrom,gene,domain):
+        gene_id=self.gene_ids.setdefault(chrom+'\t'+gene,len(self.gene_ids))
+        domain_id=self.domain_ids.setdefault(domain,len(self.domain_ids))
+        self.pairs.add((gene_id<<32)|domain_id)
+
+    def to_bytes(self):
+        '''
+        The genes and the domains by kb_keys(), their ids renumbered in key
+        order, and the sorted pairs, for from_buffer()
+        '''
+        genes=sorted(self.gene_ids)
+        domains=sorted(self.domain_ids)
+        gene_ids=dict((self.gene_ids[gene],i) for i,gene in enumerate(genes))
+        domain_ids=dict((self.domain_ids[domain],i) for i,domain in enumerate(domains))
+        pairs=sorted((gene_ids[pair>>32]<<32)|domain_ids[pair&0xffffffff] for pair in self.pairs)
+        return(kb_keys(genes)+kb_keys(domains)+kb_array('Q',[len(pairs)])+kb_array('Q',pairs))
+
+    @classmethod
+    def from_buffer(cls,buf,start):
+        '''
+        The index over the mmap of the snapshot, nothing is copied
+        '''
+        table=cls()
+        table.gene_ids=BufferKeys(buf,start)
+        table.domain_ids=BufferKeys(buf,table.gene_ids.end)
+        start=table.domain_ids.end
+        (count,)=struct.unpack_from('=Q',buf,start)
+        (pairs,start)=buffer_array(buf,start+8,'Q',count)
+        table.pairs=SortedCodes(pairs)
+        return(table)
+
+    def has_benign(self,chrom,gene,domain):
+        domain_id=self.domain_ids.get(domain)
+        if domain_id is None:
+            return(False)
+        gene_id=self.gene_ids.get(chrom+'\t'+gene)
+        if gene_id is None:
+            return(False)
+        return(((gene_id<<32)|domain_id) in self.pairs)
+
+    def get(self,key,default=None):
+        if self.has_benign(*key):
+            return("1")
+        return(default)
+
+    def __getitem__(self,key):
+        if not self.has_benign(*key):
+            raise KeyError(key)
+        return("1")
+
+    def __contains__(self,key):
+        return(self.has_benign(*key))
+
+    def __len__(self):
+        return(len(self.pairs))
+
+    def items(self):
+        genes=dict((gene_id,tuple(key.split('\t'))) for key,gene_id in self.gene_ids.items())
+        domains=dict((domain_id,domain) for domain,domain_id in self.domain_ids.items())
+        for pair in self.pairs:
+            yield (genes[pair>>32]+(domains[pair&0xffffffff],),"1")
+
+class WindowedTable(VariantKeyTable):
+    '''
+    VariantKeyTable holding the keys of one chromosome at a time: the keys of
+    the chromosome of a lookup are read from the snapshot when the sorted input
+    reaches it, the previous chromosome is freed. The values (as the bytes of
+    kb_values()), the overflow keys and the Bloom filter stay in memory
+    '''
+    def __init__(self,path,start,windows):
+        VariantKeyTable.__init__(self)
+        self.path=path
+        self.windows=windows
+        self.window=None
+        self.window_loads=0
+        fh=open(path,"rb")
+        try:
+            fh.seek(start)
+            (self.count,values_len,bloom_len,rest_len)=struct.unpack('=QQQQ',fh.read(32))
+            self.keys_start=start+32
+            self.index_start=self.keys_start+8*self.count
+            bloom_start=self.index_start+4*self.count+(-4*self.count % 8)
+            fh.seek(bloom_start)
+            self.bloom=bytearray(fh.read(bloom_len))
+            self.bloom_mask=8*bloom_len-1
+            self.values=BufferValues(fh.read(values_len),0)
+            (self.overflow,self.overflow_sites)=kb_loads(fh.read(rest_len))
+        finally:
+            fh.close()
+
+    def load_window(self,chrom):
+        self.keys=array.array('Q')
+        self.value_index=array.array('I')
+        self.cursor=0
+        self.chrom_offsets={}
+        self.window=chrom
+        if chrom not in self.windows:
+            return
+        (lo,hi)=self.windows[chrom]
+        fh=open(self.path,"rb")
+        try:
+            fh.seek(self.keys_start+8*lo)
+            self.keys.frombytes(fh.read(8*(hi-lo)))
+            fh.seek(self.index_start+4*lo)
+            self.value_index.frombytes(fh.read(4*(hi-lo)))
+        finally:
+            fh.close()
+        self.window_loads=self.window_loads+1
+
+    def find(self,packed):
+        if packed>>58 != self.window:
+            self.load_window(packed>>58)
+        return(VariantKeyTable.find(self,packed))
+
+    def __len__(self):
+        return(self.count+len(self.overflow))
+
+    def get_batch(self,keys,default=None):
+        out=[default]*len(keys)
+        for i in sorted(range(len(keys)),key=lambda i: pack_variant(*keys[i]) or 0):
+            out[i]=self.get(keys[i],default)
+        return(out)
+
+    def items(self):
+        for chrom in sorted(self.windows):
+            self.load_window(chrom)
+            for i in range(len(self.keys)):
+                yield (unpack_variant(self.keys[i]),self.values[self.value_index[i]])
+        for item in self.overflow.items():
+            yield item
+
+
 #begin read some important datsets/list firstly;
 lof_genes_dict={}
-aa_changes_dict={}
-domain_benign_dict={}
+aa_sites_dict=VariantKeyTable()
+domain_benign_dict=DomainIndex()
 mim2gene_dict={}
 mim2gene_dict2={}
 morbidmap_dict={}
 morbidmap_dict2={}
 PP2_genes_dict={}
 BP1_genes_dict={}
-PS4_snps_dict={}
-exclude_snps_dict={}
-user_evidence_dict={}
+PS4_snps_dict=VariantKeyTable()
+exclude_snps_dict=VariantKeyTable()
+user_evidence_dict=VariantKeyTable()
 mim_recessive_dict={}
 mim_domin_dict={}
 mim_adultonset_dict={}
 mim_pheno_dict={}
 mim_orpha_dict={}
-orpha_dict={}
-BS2_snps_recess_dict={}
-BS2_snps_domin_dict={}
-knownGeneCanonical_dict={}
-knownGeneCanonical_st_dict={}
-knownGeneCanonical_ed_dict={}
+orpha_dict=OrphaDetails()
+BS2_snps_dict=VariantKeyTable()
+knownGeneCanonical_dict=CanonicalTranscripts()
 
 def flip_ACGT(acgt):
     nt="";
@@ -131,28 +888,236 @@ def flip_ACGT(acgt):
         nt="X"
     return(nt)
 
-def read_datasets():
-    start_time = time.time()
-#0. read the user specified evidence file
-    global is_user_evidence_exist
-    if os.path.isfile(paras['evidence_file']):
+def bs2_alleles(ref,alt):
+    '''
+    BS2_hom_het matches a SNV on either strand, the SNVs are stored and looked
+    up on the strand with the smaller (ref,alt)
+    '''
+    flip_ref=flip_ACGT(ref)
+    flip_alt=flip_ACGT(alt)
+    if flip_ref and flip_alt:
+        return(min((ref,alt),(flip_ref,flip_alt)))
+    return((ref,alt))
+
+#binary snapshot of the InterVar datasets, one per buildver, see build_kb()
+KB_MAGIC=b'IVKB'
+KB_VERSION=13
+
+def kb_signature():
+    '''
+    The size and mtime in nanoseconds of every source file of the snapshot, a
+    changed file means the snapshot is stale and read_datasets() rebuilds it
+    '''
+    sources={}
+    for source,names,reader,users in KB_SOURCES:
+        path=paras[source]
         try:
-            fh=open(paras['evidence_file'], "r")
-            is_user_evidence_exist = True
-            strs = fh.read()
-            for line2 in strs.split('\n'):
-                cls2=line2.split('\t')
-                if len(cls2)>1:
-                    keys=cls2[0]+"_"+cls2[1]+"_"+cls2[2]+"_"+cls2[3]
-                    keys=re.sub("[Cc][Hh][Rr]","",keys)
-                    #print("%s" %keys)
-                    user_evidence_dict[keys]=cls2[4].upper()
-        except IOError:
-            is_user_evidence_exist = False
-            print("Error: can\'t read the user specified evidence file %s" % paras['evidence_file'])
-        else:
-            fh.close()    
+            st=os.stat(path)
+            sources[source]=(path,st.st_size,getattr(st,'st_mtime_ns',int(st.st_mtime*1e9)))
+        except OSError:
+            sources[source]=(path,-1,-1)
+    return({'version':KB_VERSION,'buildver':paras['buildver'],'byteorder':sys.byteorder,'sources':sources})
+
+class KbUnpickler(pickle.Unpickler):
+    '''
+    The snapshot pickles the dataset classes as classes of __main__ when it is
+    built by running Intervar.py and of Intervar when it is built from an
+    import, they are found here under either name
+    '''
+    def find_class(self,module,name):
+        if module in KB_MODULES:
+            return(globals()[name])
+        return(pickle.Unpickler.find_class(self,module,name))
+
+KB_MODULES=('__main__','Intervar')
+KB_BUFFER_CLASSES=('CanonicalTranscripts','OrphaDetails','DomainIndex') # held in place in the snapshot in mmap mode
+
+def kb_loads(data):
+    return(KbUnpickler(io.BytesIO(data)).load())
+
+def read_kb_header(fh):
+    if fh.read(len(KB_MAGIC)) != KB_MAGIC:
+        return(None)
+    (header_len,)=struct.unpack('<Q',fh.read(8))
+    header=pickle.loads(fh.read(header_len)) # the header is zero padded to 8 bytes
+    header['data_start']=len(KB_MAGIC)+8+header_len
+    return(header)
+
+def kb_snapshot_paths():
+    '''
+    The snapshot in the dataset dir, then its copy in the user cache dir which
+    is written instead when the dataset dir is read-only
+    '''
+    path=paras['kb_snapshot']
+    cache_dir=os.environ.get('XDG_CACHE_HOME',os.path.join(os.path.expanduser('~'),'.cache'))
+    name=hashlib.md5(os.path.abspath(path).encode('utf-8')).hexdigest()[:12]+'_'+os.path.basename(path)
+    return([path,os.path.join(cache_dir,'intervar',name)])
+
+def open_kb_snapshot():
+    '''
+    Check the snapshot matches the current buildver and source files, the
+    datasets are then read from it by load_dataset() on their first use.
+    kb_stale is the snapshot found out of date, if any
+    '''
+    global kb_index,kb_stale
+    kb_stale=None
+    for path in kb_snapshot_paths():
+        if not os.path.isfile(path):
+            continue
+        try:
+            fh=open(path,"rb")
+            try:
+                header=read_kb_header(fh)
+            finally:
+                fh.close()
+        except (IOError,EOFError,struct.error,pickle.UnpicklingError):
+            print("Warning: can\'t read the dataset snapshot %s" % path)
+            continue
+        if header is None or header['signature'] != kb_signature():
+            if kb_stale is None:
+                kb_stale=path
+            continue
+        kb_index=(path,header['data_start'],header['index'])
+        kb_stale=None
+        return(True)
+    return(False)
+
+def kb_table(dataset):
+    '''
+    The str->str dict as a sorted key table for MmapTable: the count, the key
+    and value offsets (count+1 each) and then the key and value bytes
+    '''
+    items=sorted((key.encode('utf-8'),value.encode('utf-8')) for key,value in dataset.items())
+    key_offsets=array.array('Q',[0])
+    value_offsets=array.array('Q',[0])
+    for key,value in items:
+        key_offsets.append(key_offsets[-1]+len(key))
+        value_offsets.append(value_offsets[-1]+len(value))
+    return(b''.join([array.array('Q',[len(items)]).tobytes(),key_offsets.tobytes(),value_offsets.tobytes()]
+        +[key for key,value in items]+[value for key,value in items]))
+
+def save_kb_snapshot():
+    index={}
+    blobs=[]
+    offset=0
+    for source,names,reader,users in KB_SOURCES:
+        blob=pickle.dumps(tuple(globals()[name] for name in names),pickle.HIGHEST_PROTOCOL)
+        blobs.append(blob)
+        index[source]=(offset,len(blob))
+        offset=offset+len(blob)
+        for name in names:
+            dataset=globals()[name]
+            if isinstance(dataset,VariantKeyTable):
+                kind='variant'
+                blob=b'\0'*(-offset % 8)+dataset.to_bytes()
+            elif hasattr(dataset,'to_bytes'):
+                kind=type(dataset).__name__
+                blob=b'\0'*(-offset % 8)+dataset.to_bytes()
+            elif not isinstance(dataset,dict):
+                kind='pickle'
+                blob=b'\0'*(-offset % 8)+pickle.dumps(dataset,pickle.HIGHEST_PROTOCOL)
+            else:
+                kind='str'
+                blob=b'\0'*(-offset % 8)+kb_table(dataset)
+            blobs.append(blob)
+            index['table:'+name]=(offset+(-offset % 8),len(blob)-(-offset % 8),kind)
+            if kind=='variant':
+                index['windows:'+name]=dataset.chrom_windows()
+            offset=offset+len(blob)
+    header=pickle.dumps({'signature':kb_signature(),'index':index},pickle.HIGHEST_PROTOCOL)
+    header=header+b'\0'*(-(len(KB_MAGIC)+8+len(header)) % 8)
+    for path in kb_snapshot_paths():
+        tmp_path=path+".tmp%d" % os.getpid()
+        try:
+            if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+                os.makedirs(os.path.dirname(os.path.abspath(path)))
+            fw=open(tmp_path,"wb")
+            try:
+                fw.write(KB_MAGIC)
+                fw.write(struct.pack('<Q',len(header)))
+                fw.write(header)
+                for blob in blobs:
+                    fw.write(blob)
+            finally:
+                fw.close()
+            os.rename(tmp_path,path)
+        except (IOError,OSError):
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+            continue
+        if path != paras['kb_snapshot']:
+            print("Notice: can\'t write the dataset snapshot %s, it is kept in the user cache as %s" % (paras['kb_snapshot'],path))
+        return(True)
+    print("Warning: can\'t write the dataset snapshot %s nor its copy in the user cache %s, the datasets will be parsed at every run"
+        % tuple(kb_snapshot_paths()))
+    return(False)
+
+class MmapTable(object):
+    '''
+    Read-only str->str mapping over a table written by kb_table(), the lookup
+    is a binary search in the mmap of the snapshot, nothing is copied to the
+    heap so concurrent InterVar runs share the pages of the page cache
+    '''
+    def __init__(self,kb_mmap,start):
+        (self.count,)=struct.unpack_from('=Q',kb_mmap,start)
+        view=memoryview(kb_mmap)
+        offsets_start=start+8
+        offsets_end=offsets_start+8*(self.count+1)
+        self.key_offsets=view[offsets_start:offsets_end].cast('Q')
+        self.value_offsets=view[offsets_end:offsets_end+8*(self.count+1)].cast('Q')
+        self.keys_start=offsets_end+8*(self.count+1)
+        self.values_start=self.keys_start+self.key_offsets[self.count]
+        self.kb_mmap=kb_mmap
+
+    def find(self,key):
+        key=key.encode('utf-8')
+        key_offsets=self.key_offsets
+        keys_start=self.keys_start
+        kb_mmap=self.kb_mmap
+        lo=0
+        hi=self.count
+        while lo<hi:
+            mid=(lo+hi)//2
+            if kb_mmap[keys_start+key_offsets[mid]:keys_start+key_offsets[mid+1]]<key:
+                lo=mid+1
+            else:
+                hi=mid
+        if lo<self.count and kb_mmap[keys_start+key_offsets[lo]:keys_start+key_offsets[lo+1]]==key:
+            return(lo)
+        return(-1)
+
+    def get(self,key,default=None):
+        i=self.find(key)
+        if i<0:
+            return(default)
+        return(self.kb_mmap[self.values_start+self.value_offsets[i]:self.values_start+self.value_offsets[i+1]].decode('utf-8'))
 
+    def __getitem__(self,key):
+        i=self.find(key)
+        if i<0:
+            raise KeyError(key)
+        return(self.kb_mmap[self.values_start+self.value_offsets[i]:self.values_start+self.value_offsets[i+1]].decode('utf-8'))
+
+    def __contains__(self,key):
+        return(self.find(key)>=0)
+
+    def __len__(self):
+        return(self.count)
+
+def build_kb():
+    '''
+    Parse all the InterVar datasets and write the snapshot, used by --build_kb
+    '''
+    paras['kb_snapshot_rebuild']=True
+    try:
+        read_datasets()
+    finally:
+        del paras['kb_snapshot_rebuild']
+    if open_kb_snapshot():
+        print("Notice: The dataset snapshot for %s is [ %s ]" % (paras['buildver'],kb_index[0]))
+    return
+
+def read_lof_genes():
 #1.LOF gene list       
     try:               
         fh = open(paras['lof_genes'], "r")
@@ -168,40 +1133,56 @@ def read_datasets():
         return
     else:
         fh.close()    
+    return
 
+
+def read_ps1_aa():
 #2. AA change list
+    global aa_sites_dict
+    aa_sites={}
     try:
         fh = open(paras['ps1_aa'], "r")
         strs = fh.read()
         for line2 in strs.split('\n'):
             cls2=line2.split('\t')
             if len(cls2)>1 :
-                keys=cls2[0]+"_"+cls2[1]+"_"+cls2[2]+"_"+cls2[4]
-                keys=re.sub("[Cc][Hh][Rr]","",keys)
-                aa_changes_dict[keys]=cls2[6]
+                keys=(re.sub("[Cc][Hh][Rr]","",cls2[0]),cls2[1],cls2[2],"","")
+                aa_sites.setdefault(keys,{})[cls2[4]]=cls2[6]
     except IOError:
         print("Error: can\'t read the  amino acid change file %s" % paras['ps1_aa'])
         print("Error: Please download it from the source website")
         sys.exit()
     else:
         fh.close()    
+    # one entry per site: the (alt, alt amino acid) pairs of the known pathogenic changes
+    aa_sites_dict=VariantKeyTable()
+    for keys,alts in aa_sites.items():
+        aa_sites_dict.add(keys,tuple(sorted(alts.items())))
+    aa_sites_dict.finish()
+    return
+
 
+def read_pm1_domain():
 #3. Domain with benign 
+    global domain_benign_dict
+    domain_benign_dict=DomainIndex()
     try:
         fh = open(paras['pm1_domain'], "r")
         strs = fh.read()
         for line2 in strs.split('\n'):
             cls2=line2.split('\t')
             if len(cls2)>1:
-                keys=cls2[0]+"_"+cls2[1]+": "+cls2[2]
-                domain_benign_dict[keys]="1"
+                domain_benign_dict.add(cls2[0],cls2[1],cls2[2])
     except IOError:
         print("Error: can\'t read the PM1 domain  file %s" % paras['pm1_domain'])
         print("Error: Please download it from the source website")
         sys.exit()
     else:
         fh.close()   
+    return
+
 
+def read_mim2gene():
 #4. OMIM mim2gene.txt file 
     try:
         fh = open(paras['mim2gene'], "r")
@@ -221,7 +1202,10 @@ def read_datasets():
         sys.exit()
     else:
         fh.close()   
+    return
 
+
+def read_pp2_genes():
 #5.PP2 gene list       
     try:               
         fh = open(paras['pp2_genes'], "r")
@@ -237,7 +1221,10 @@ def read_datasets():
         return
     else:
         fh.close()    
+    return
+
 
+def read_bp1_genes():
 #5.BP1 gene list       
     try:               
         fh = open(paras['bp1_genes'], "r")
@@ -253,6 +1240,8 @@ def read_datasets():
         return
     else:
         fh.close()    
+    return
+
 
 #6.morbidmap from OMIM  for BP5 ,  multifactorial disorders  list
 #The reviewers suggeset to disable the OMIM morbidmap for BP5 
@@ -277,7 +1266,11 @@ def read_datasets():
         fh.close()    
     '''
 
+
+def read_ps4_snps():
 #7.prevalence of the variant with OR>5 for PS4 ,  the dataset is from gwasdb jjwanglab.org/gwasdb
+    global PS4_snps_dict
+    PS4_snps=VariantKeyTable()
     try:               
         fh = open(paras['ps4_snps'], "r")
         str = fh.read()
@@ -285,17 +1278,22 @@ def read_datasets():
             cls2=line2.split('\t')
             # PS4_snps_dict
             if len(cls2[0])>=1:  # 
-                keys=cls2[0]+"_"+cls2[1]+"_"+cls2[1]+"_"+cls2[3]+"_"+cls2[4]
-                keys=re.sub("[Cc][Hh][Rr]","",keys)
-                PS4_snps_dict[ keys ]='1'  # key as gene name
+                keys=(re.sub("[Cc][Hh][Rr]","",cls2[0]),cls2[1],cls2[1],cls2[3],cls2[4])
+                PS4_snps.add(keys,'1')  # key as gene name
     except IOError:
         print("Error: can\'t read the snp list file for PS4 %s" % paras['ps4_snps'])
         print("Error: Please download it from the source website")
         sys.exit()
     else:
         fh.close()    
+    PS4_snps_dict=PS4_snps.finish()
+    return
+
 
+def read_exclude_snps():
 #8. read the user specified SNP list, the variants will pass the frequency check.
+    global exclude_snps_dict
+    exclude_snps=VariantKeyTable()
     if os.path.isfile(paras['exclude_snps']):
         try:
             fh=open(paras['exclude_snps'], "r")
@@ -304,15 +1302,19 @@ def read_datasets():
             for line2 in strs.split('\n'):
                 cls2=line2.split('\t')
                 if len(cls2)>1:
-                    keys=cls2[0]+"_"+cls2[1]+"_"+cls2[2]+"_"+cls2[3]
-                    keys=re.sub("[Cc][Hh][Rr]","",keys)
-                    exclude_snps_dict[keys]="1"
+                    keys=(re.sub("[Cc][Hh][Rr]","",cls2[0]),cls2[1],cls2[1],cls2[2],cls2[3])
+                    exclude_snps.add(keys,"1")
         except IOError:
             is_exclude_snps_exist = False
             print("Error: can\'t read the user specified SNP list file %s" % paras['exclude_snps'])
         else:
             fh.close()    
-#9. OMIM mim_recessive.txt file mim_domin  mim_adultonset 
+    exclude_snps_dict=exclude_snps.finish()
+    return
+
+
+def read_mim_recessive():
+#9. OMIM mim_recessive.txt file 
     try:
         fh = open(paras['mim_recessive'], "r")
         strs = fh.read()
@@ -326,6 +1328,11 @@ def read_datasets():
         sys.exit()
     else:
         fh.close()   
+    return
+
+
+def read_mim_domin():
+#9. OMIM mim_domin.txt file
     try:
         fh = open(paras['mim_domin'], "r")
         strs = fh.read()
@@ -339,6 +1346,11 @@ def read_datasets():
         sys.exit()
     else:
         fh.close()   
+    return
+
+
+def read_mim_adultonset():
+#9. OMIM mim_adultonset.txt file
     try:
         fh = open(paras['mim_adultonset'], "r")
         strs = fh.read()
@@ -352,55 +1364,52 @@ def read_datasets():
         sys.exit()
     else:
         fh.close()   
+    return
 
 
-
-
+def read_knowngenecanonical():
 #10. knownGeneCanonical exon file  # caution the build ver, now it is hg19
+    global knownGeneCanonical_dict
+    knownGeneCanonical_dict=CanonicalTranscripts()
     try:
         fh = open(paras['knowngenecanonical'], "r")
         strs = fh.read()
         for line2 in strs.split('\n'):
             cls2=line2.split(' ')
             if len(cls2)>1:
-                keys=cls2[0]
-                knownGeneCanonical_dict[keys]=cls2[1]
-                knownGeneCanonical_st_dict[keys]=cls2[2]
-                knownGeneCanonical_ed_dict[keys]=cls2[3]
-                #print("%s %s" %(keys,knownGeneCanonical_dict[keys]))
+                try:
+                    knownGeneCanonical_dict.add(cls2[0],int(cls2[1]),int(cls2[3]))
+                except ValueError: # the header line
+                    pass
     except IOError:
         print("Error: can\'t read the knownGeneCanonical  file %s" % paras['knowngenecanonical'])
         print("Error: Please download it from the source website")
         sys.exit()
     else:
         fh.close()   
+    return
 
+
+def read_bs2_snps():
 #11.BS2 variants of recessive homo, domin heter
+    global BS2_snps_dict
+    BS2_snps=VariantKeyTable()
     try:              
         with myGzipFile(paras['bs2_snps'], "rb") as fh:
-
-            #fh = open(paras['bs2_snps'], "r")
-            strs = fh.read().decode()
-            for line2 in strs.split('\n'):
-                cls2=line2.split(' ')
-                # PS4_snps_dict
+            for line2 in fh:
+                cls2=line2.decode().rstrip('\n').split(' ')
                 if len(cls2[0])>=1:  #
-                    keys=cls2[0]+"_"+cls2[1]+"_"+cls2[1]+"_"+cls2[2]+"_"+cls2[3]
-                    #keys=re.sub("[Cc][Hh][Rr]","",keys)
-                    BS2_snps_recess_dict[ keys ]=cls2[4]  # key as snp info
-                    BS2_snps_domin_dict[ keys ]=cls2[5]  # key as snp info
-                    keys=cls2[0]+"_"+cls2[1]+"_"+cls2[1]+"_"+flip_ACGT(cls2[2])+"_"+flip_ACGT(cls2[3])
-                    #keys=re.sub("[Cc][Hh][Rr]","",keys)
-                    BS2_snps_recess_dict[ keys ]=cls2[4]  # key as snp info
-                    BS2_snps_domin_dict[ keys ]=cls2[5]  # key as snp info
-
+                    (ref,alt)=bs2_alleles(cls2[2],cls2[3])
+                    BS2_snps.add((cls2[0],cls2[1],cls2[1],ref,alt),(cls2[4],cls2[5]))  # recessive homo, domin heter
     except IOError:
         print("Error: can\'t read the snp list file for BS2 %s" % paras['bs2_snps'])
         print("Error: Please download it from the source website")
         sys.exit()
-    else:
-        fh.close()    
+    BS2_snps_dict=BS2_snps.finish()
+    return
+
 
+def read_mim_pheno():
 #12. OMIM mim_pheno.txt file
 #mim_pheno = %(database_intervar)s/mim_pheno.txt
 #mim_orpha = %(database_intervar)s/mim_orpha.txt
@@ -420,10 +1429,10 @@ def read_datasets():
         sys.exit()
     else:
         fh.close()   
+    return
 
 
-
-
+def read_mim_orpha():
 #13. OMIM mim_orpha.txt file 
     try:
         fh = open(paras['mim_orpha'], "r")
@@ -440,23 +1449,309 @@ def read_datasets():
         sys.exit()
     else:
         fh.close()   
+    return
 
+
+def read_orpha():
 #14.  orpha.txt file 
+    global orpha_dict
+    orpha_dict=OrphaDetails(paras['orpha'])
     try:
-        fh = open(paras['orpha'], "r")
-        strs = fh.read()
-        for line2 in strs.split('\n'):
-            cls2=line2.split('\t')
+        fh = open(paras['orpha'], "rb")
+        offset=0
+        for line2 in fh:
+            cls2=line2.rstrip(b'\n').split(b'\t')
             if len(cls2)>1:
-                keys=cls2[0]
-                orpha_dict[keys]=cls2[1]
-                #print("%s %s" %(keys,mim_orpha_dict[keys]))
+                orpha_dict.add(cls2[0].decode('utf-8'),offset+len(cls2[0])+1,len(cls2[1]))
+            offset=offset+len(line2)
     except IOError:
         print("Error: can\'t read the Orpha  file %s" % paras['orpha'])
         print("Error: Please download it from InterVar source website")
         sys.exit()
     else:
         fh.close()   
+    return
+
+
+#the InterVar datasets: the source file in paras, the dicts filled by its reader and
+#the criteria/output columns which use it. A dataset is read on its first use.
+KB_SOURCES=[
+    ('lof_genes',('lof_genes_dict',),read_lof_genes,('check_PVS1','gene_record')),
+    ('ps1_aa',('aa_sites_dict',),read_ps1_aa,('check_PS1_PM5',)),
+    ('pm1_domain',('domain_benign_dict',),read_pm1_domain,('check_PM1',)),
+    ('mim2gene',('mim2gene_dict','mim2gene_dict2'),read_mim2gene,('check_PM2','check_BS2','OMIM','gene_record')),
+    ('pp2_genes',('PP2_genes_dict',),read_pp2_genes,('check_PP2','gene_record')),
+    ('bp1_genes',('BP1_genes_dict',),read_bp1_genes,('check_BP1','gene_record')),
+    ('ps4_snps',('PS4_snps_dict',),read_ps4_snps,('check_PS4',)),
+    ('exclude_snps',('exclude_snps_dict',),read_exclude_snps,('assign',)),
+    ('mim_recessive',('mim_recessive_dict',),read_mim_recessive,('check_PM2','check_BS2','gene_record')),
+    ('mim_domin',('mim_domin_dict',),read_mim_domin,('check_BS2','gene_record')),
+    ('mim_adultonset',('mim_adultonset_dict',),read_mim_adultonset,('check_BS2','gene_record')),
+    ('knowngenecanonical',('knownGeneCanonical_dict',),read_knowngenecanonical,('check_PVS1',)),
+    ('bs2_snps',('BS2_snps_dict',),read_bs2_snps,('check_BS2',)),
+    ('mim_pheno',('mim_pheno_dict',),read_mim_pheno,('Phenotype_MIM',)),
+    ('mim_orpha',('mim_orpha_dict',),read_mim_orpha,('OrphaNumber',)),
+    ('orpha',('orpha_dict',),read_orpha,('Orpha',)),
+]
+loaded_datasets=set()
+ready_users=set()
+kb_index=None
+kb_stale=None
+kb_mmap=None
+kb_merge=False
+gene_records={}
+omim_annotations={}
+encoded_annotations={} # the columns of omim_annotation encoded for IntervarWriter
+OMIM_ANNOTATIONS_MAX=20000
+
+def load_dataset(source):
+    global kb_mmap
+    for source2,names,reader,users in KB_SOURCES:
+        if source2 != source:
+            continue
+        if kb_index is not None:
+            path,data_start,index=kb_index
+            try:
+                if re.findall('window',paras.get('kb_mode','memory'),flags=re.IGNORECASE) and all(index['table:'+name][2]=='variant' for name in names):
+                    for name in names:
+                        globals()[name]=WindowedTable(path,data_start+index['table:'+name][0],index['windows:'+name])
+                elif re.findall('mmap|merge',paras.get('kb_mode','memory'),flags=re.IGNORECASE) and hasattr(memoryview,'cast'):
+                    if kb_mmap is None:
+                        fh=open(path,"rb")
+                        kb_mmap=mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)
+                        fh.close()
+                    for name in names:
+                        offset,length,kind=index['table:'+name]
+                        if kind=='variant':
+                            globals()[name]=VariantKeyTable.from_buffer(kb_mmap,data_start+offset)
+                        elif kind in KB_BUFFER_CLASSES:
+                            globals()[name]=globals()[kind].from_buffer(kb_mmap,data_start+offset)
+                        elif kind=='pickle':
+                            globals()[name]=kb_loads(kb_mmap[data_start+offset:data_start+offset+length])
+                        else:
+                            globals()[name]=MmapTable(kb_mmap,data_start+offset)
+                else:
+                    offset,length=index[source]
+                    fh=open(path,"rb")
+                    fh.seek(data_start+offset)
+                    datasets=kb_loads(fh.read(length))
+                    fh.close()
+                    for name,dataset in zip(names,datasets):
+                        globals()[name]=dataset
+            except (IOError,EOFError,KeyError,ValueError,mmap.error,pickle.UnpicklingError):
+                print("Warning: can\'t read %s from the dataset snapshot %s, read the source file" % (source,path))
+                reader()
+        else:
+            reader()
+        loaded_datasets.add(source)
+    return
+
+def need_datasets(user):
+    '''
+    Read the datasets used by a check_* function or an output column, once
+    '''
+    if user in ready_users:
+        return
+    for source,names,reader,users in KB_SOURCES:
+        if user in users and source not in loaded_datasets:
+            load_dataset(source)
+    ready_users.add(user)
+    return
+
+def print_bloom_stats():
+    '''
+    How many lookups of the variant datasets the Bloom filters answered; a
+    false positive passed the filter but was not in the dataset
+    '''
+    for name in ['PS4_snps_dict','BS2_snps_dict','exclude_snps_dict','user_evidence_dict']:
+        (lookups,passed,found)=globals()[name].stats
+        if lookups>found:
+            print("Notice: Bloom filter of %s: %d lookups, %d passed, %d found, false positive rate %.4f"
+                % (name,lookups,passed,found,float(passed-found)/(lookups-found)))
+    return
+
+class GeneRecord(object):
+    '''
+    The gene-level evidence of a (Gene, Gene.ensGene) pair, looked up once per
+    gene instead of once per variant. The MIM number is resolved as each user
+    did it: PM2 takes the ensembl id over the symbol, BS2 the ensembl id only
+    and the OMIM column the symbol over the ensembl id. The flags are the raw
+    dataset values, None when the key is missing.
+    '''
+    __slots__=('lof','pp2','bp1','pm2_mim','pm2_recessive','bs2_mim','bs2_adultonset','bs2_recessive','bs2_domin','omim')
+
+    def __init__(self,gene,ens_gene):
+        self.lof=lof_genes_dict.get(gene)
+        self.pp2=PP2_genes_dict.get(gene)
+        self.bp1=BP1_genes_dict.get(gene)
+        mim2=mim2gene_dict2.get(gene)
+        mim1=mim2gene_dict.get(ens_gene)
+        self.pm2_mim=0
+        if mim2 is not None:
+            self.pm2_mim=mim2
+        if mim1 is not None:
+            self.pm2_mim=mim1
+        self.pm2_recessive=None
+        if self.pm2_mim != 0:
+            self.pm2_recessive=mim_recessive_dict.get(self.pm2_mim)
+        self.bs2_mim=mim1
+        self.bs2_adultonset=None
+        self.bs2_recessive=None
+        self.bs2_domin=None
+        if mim1 is not None:
+            self.bs2_adultonset=mim_adultonset_dict.get(mim1)
+            self.bs2_recessive=mim_recessive_dict.get(mim1)
+            self.bs2_domin=mim_domin_dict.get(mim1)
+        self.omim="."
+        if mim1 is not None:
+            self.omim=mim1
+        if mim2 is not None:
+            self.omim=mim2
+
+def gene_record(gene,ens_gene):
+    try:
+        return(gene_records[(gene,ens_gene)])
+    except KeyError:
+        need_datasets('gene_record')
+        record=GeneRecord(gene,ens_gene)
+        gene_records[(gene,ens_gene)]=record
+        return(record)
+
+def omim_annotation(OMIM):
+    '''
+    The Phenotype_MIM, OrphaNumber and Orpha columns of a MIM number, built
+    once and kept in a memo of at most OMIM_ANNOTATIONS_MAX numbers
+    '''
+    try:
+        return(omim_annotations[OMIM])
+    except KeyError:
+        pass
+    Pheno_MIM=mim_pheno_dict.get(OMIM,".")
+    orpha="";
+    orpha_details="";
+    # .;442835;;306;;.;
+    for ort2 in Pheno_MIM.split(';'):
+        ort3=mim_orpha_dict.get(ort2,".")
+        if(ort3 !="."):
+            orpha=ort3+orpha
+    for ort4 in orpha.split(';'):
+        if len(ort4)>0:
+             orpha_details=orpha_details+orpha_dict.get(ort4,".")+"~"
+    if len(omim_annotations)>=OMIM_ANNOTATIONS_MAX:
+        omim_annotations.clear()
+    omim_annotations[OMIM]=(Pheno_MIM,orpha,orpha_details)
+    return(omim_annotations[OMIM])
+
+EVIDENCE_CRITERIA=[('PS',5),('PM',7),('PP',6),('BS',5),('BP',8)]
+
+def compile_evidence(evds):
+    '''
+    The evidence of a variant, e.g. PVS1=1;PP1=1;PM3=1;grade_PP1=2 as
+    (overrides,grades): the (slot,index,value) assignments to PVS1 (slot 0),
+    BA1 (slot 1) and the PS PM PP BS BP lists (slots 2-6), the last one of
+    each criterion, and the changes of the PS PM PP BS BP sums by the grades
+    '''
+    assigned={}
+    grades=[0,0,0,0,0]
+    for evd in evds.split(';'):
+        evd_t=evd.split('=')
+        if len(evd_t)<=1:
+            continue
+        if not re.findall('grade', evd_t[0], flags=re.IGNORECASE):
+            if int(evd_t[1])<=1:
+                if(evd_t[0]=="PVS1"): assigned[(0,0)]=evd_t[1]
+                if(evd_t[0]=="BA1"): assigned[(1,0)]=evd_t[1]
+                for slot,(name,count) in enumerate(EVIDENCE_CRITERIA):
+                    t=evd_t[0].find(name)
+                    if t!=-1:
+                        tt3=int(evd_t[0][t+2:t+3])
+                        if(t<len(evd_t[0])-2 and tt3<=count ): assigned[(slot+2,tt3-1)]=int(evd_t[1])
+        elif int(evd_t[1])<=3:
+            #10  104353782   G   A   PVS1=1;PP1=1;PM3=1;grade_PP1=2;
+            grade=int(evd_t[1])
+            for slot,(name,count) in enumerate(EVIDENCE_CRITERIA):
+                t=evd_t[0].find(name)
+                if t!=-1:
+                    tt3=int(evd_t[0][t+2:t+3])
+                    grades[slot]=grades[slot]-1
+                    if(t<len(evd_t[0])-2 and tt3<=count ):
+                        if name[0]=='P': # PS PM PP to strong, moderate or supporting
+                            if grade>=1:
+                                grades[grade-1]=grades[grade-1]+1
+                        elif grade==1: # BS BP to strong or supporting
+                            grades[3]=grades[3]+1
+                        elif grade==3:
+                            grades[4]=grades[4]+1
+    overrides=tuple((slot,i,value) for (slot,i),value in sorted(assigned.items()))
+    return((overrides,tuple(grades)))
+
+def evidence_actions(evidence):
+    '''
+    The compiled evidence of a user_evidence_dict value; a value which could
+    not be compiled is kept as the string and fails here, on its variant
+    '''
+    if isinstance(evidence,str):
+        return(compile_evidence(evidence))
+    return(evidence)
+
+def read_datasets():
+    start_time = time.time()
+#0. read the user specified evidence file
+    global is_user_evidence_exist,user_evidence_dict
+    user_evidence=VariantKeyTable()
+    if os.path.isfile(paras['evidence_file']):
+        try:
+            fh=open(paras['evidence_file'], "r")
+            is_user_evidence_exist = True
+            for line2 in fh:
+                cls2=line2.rstrip('\n').split('\t')
+                if len(cls2)>1:
+                    keys=(re.sub("[Cc][Hh][Rr]","",cls2[0]),cls2[1],cls2[1],cls2[2],cls2[3])
+                    evds=cls2[4].upper()
+                    try:
+                        evds=compile_evidence(evds)
+                    except ValueError:
+                        pass
+                    user_evidence.add(keys,evds)
+        except IOError:
+            is_user_evidence_exist = False
+            print("Error: can\'t read the user specified evidence file %s" % paras['evidence_file'])
+        else:
+            fh.close()    
+    user_evidence_dict=user_evidence.finish()
+
+
+#the datasets below are read on their first use, from the snapshot when it is up to date
+    global kb_index,kb_mmap,kb_merge
+    kb_index=None
+    kb_mmap=None
+    kb_merge=bool(re.findall('merge',paras.get('kb_mode','memory'),flags=re.IGNORECASE))
+    loaded_datasets.clear()
+    ready_users.clear()
+    gene_records.clear()
+    omim_annotations.clear()
+    encoded_annotations.clear()
+    global freq_kernel
+    freq_kernel=None
+    rebuild=paras.get('kb_snapshot_rebuild',False)
+    if not rebuild and not open_kb_snapshot():
+        if kb_stale is None:
+            print("Notice: the datasets are read from their files on first use, run InterVar with --build_kb to build the dataset snapshot")
+        else:
+            print("Notice: the dataset snapshot %s is out of date, it is rebuilt from the dataset files" % kb_stale)
+            rebuild=True
+    if rebuild:
+        for source,names,reader,users in KB_SOURCES:
+            reader()
+            loaded_datasets.add(source)
+        if save_kb_snapshot() and not paras.get('kb_snapshot_rebuild',False) and open_kb_snapshot():
+            # the run goes on like any run with an up to date snapshot, the datasets are read from it on their first use
+            for source,names,reader,users in KB_SOURCES:
+                for name in names:
+                    if hasattr(globals()[name],'close'):
+                        globals()[name].close()
+                    globals()[name]=type(globals()[name])()
+            loaded_datasets.clear()
 
     print("read_datasets() took %s seconds", time.time() - start_time)
 #end read datasets
@@ -676,49 +1971,67 @@ def check_gdi_rvis_LOF(anvfile):
 
 
 
+def otherinfo_position(cls):
+    '''
+    The position of the Gene column when otherinfo is on: before the last
+    column of the header named like otherinfo, else before the second one
+    '''
+    otherinf_pos=1
+    for ii in range(0,len(cls)):
+        if  re.findall('otherinfo',cls[ii], flags=re.IGNORECASE) :
+            otherinf_pos=ii
+    return(otherinf_pos)
+
+def gene_lines(fh):
+    '''
+    The lines of the annovar output with the Gene column added, as .grl_p has
+    them: the header with CLNSIG as CLINSIG, the genes of a line kept in one
+    line (they are split one by one in my_inter_var), "chr" removed and a tab
+    at the end, the lines without tab are skipped
+    '''
+    otherinfo=re.findall('true',paras['otherinfo'], flags=re.IGNORECASE)
+    sum=0
+    otherinf_pos=1
+    line_sum=0;
+    for line in fh:
+        line=line.rstrip('\n')
+        if line_sum==0:
+            line=re.sub("CLNSIG","CLINSIG",line)
+        cls=line.split('\t')
+        if len(cls)>1:
+            if sum==0 and otherinfo :
+                otherinf_pos=otherinfo_position(cls)
+                 
+            gene_name=cls[6]
+            if cls[6] == 'Gene.refGene':
+                gene_name='Gene'
+            sum=sum+1
+            if not otherinfo :
+                line_out=line+"\t"+gene_name
+            else:
+                cls.insert(otherinf_pos,gene_name)
+                line_out='\t'.join(cls)
+
+            if sum >1: line_out=re.sub("^[Cc][Hh][Rr]","",line_out)
+            yield(line_out+"\t")
+        line_sum=line_sum+1
+
+
 def check_genes(anvfile):
-#check with multiple genes, so one gene by one gene  to annote
+#write the lines of gene_lines to .grl_p, my_inter_var reads them from the annovar output itself
     newoutfile=anvfile+".grl_p"
     try:
         fh = open(anvfile, "r")
         fw = open(newoutfile, "w")
-        strs = fh.read()
         sum=0
-        otherinf_pos=1
-        line_sum=0;
-        for line in strs.split('\n'):
-            if line_sum==0:
-                line=re.sub("CLNSIG","CLINSIG",line)
-            cls=line.split('\t')
-            if len(cls)>1:
-                if sum==0 and re.findall('true',paras['otherinfo'], flags=re.IGNORECASE) :
-                    for ii in range(0,len(cls)):
-                        if  re.findall('otherinfo',cls[ii], flags=re.IGNORECASE) :
-                            otherinf_pos=ii
-                     
-                gene_name=cls[6]
-                if cls[6] == 'Gene.refGene':
-                    gene_name='Gene'
-#some with multiple genes, so one gene by one gene  to annote
-                sum=sum+1
-                #for gg in gene_name.split(','):
-                for gg in re.split("[,;]",gene_name):
-                    if not re.findall('true',paras['otherinfo'], flags=re.IGNORECASE) :
-                        line_out=line+"\t"+gg
-                    else:
-                        line_out=cls[0]
-                        for ii in range(1,len(cls)):
-                            if ii != otherinf_pos :
-                                line_out=line_out+"\t"+cls[ii]
-                            if ii == otherinf_pos :
-                                line_out=line_out+"\t"+gg+"\t"+cls[ii]
-                            
-                    if sum >1: line_out=re.sub("^[Cc][Hh][Rr]","",line_out)
-                            
-                    #line_out=line+"\t"+gg
-                    # re.sub("[Cc][Hh][Rr]","",keys)
-                    fw.write("%s\t\n" % line_out)
-            line_sum=line_sum+1
+        lines_out=[]
+        for line_out in gene_lines(fh):
+            sum=sum+1
+            lines_out.append(line_out+"\n")
+            if len(lines_out)>=CHUNK_ROWS:
+                fw.write(''.join(lines_out))
+                lines_out=[]
+        fw.write(''.join(lines_out))
 
     except IOError:
         print("Error: can\'t read/write the annovar output file %s %s" % (anvfile,newoutfile))
@@ -739,7 +2052,7 @@ def sum_of_list(list):
         sum=sum+i
     return(sum)
 
-def classfyv2(PVS1,PS,PM,PP,BA1,BS,BP,Allels_flgs,cls):
+def classfyv2(PVS1,PS,PM,PP,BA1,BS,BP,Allels_flgs,cls,grades=(0,0,0,0,0)):
     BPS=["Pathogenic","Likely pathogenic","Benign","Likely benign","Uncertain significance"]
 
     BP7 = BP[6]
@@ -753,78 +2066,12 @@ def classfyv2(PVS1,PS,PM,PP,BA1,BS,BP,Allels_flgs,cls):
 
     #print("Before up/down grade, the sum of PS %s, PM %s,PP %s,BS %s,BP %s" %(PS_sum,PM_sum,PP_sum,BS_sum,BP_sum));
     #begin process the user's flexible grade  to get the final interpretation
-    if is_user_evidence_exist:
-        keys=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['Ref']]+"_"+cls[Allels_flgs['Alt']]
-        keys=re.sub("[Cc][Hh][Rr]","",keys)
-        try:
-            evds=user_evidence_dict[keys] #PS1=1;PM1=1;BA1=1;PVS1 PP BS BP
-            for evd in evds.split(';'):
-                evd_t=evd.split('=')
-                if(len(evd_t)>1 and  re.findall('grade', evd_t[0], flags=re.IGNORECASE) ):
-                    #10  104353782   G   A   PVS1=1;PP1=1;PM3=1;grade_PP1=2;
-                    if int(evd_t[1])<=3:
-                        #print ("%s %s %s " %(keys,evd_t[1],evd_t[0]))
-                        if(evd_t[0].find('PS')!=-1): 
-                            t=evd_t[0].find('PS'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            PS_sum=PS_sum-1
-                            if(t<len(evd_t[0])-2 and tt3<=5 ):
-                                if int(evd_t[1]) ==1 :
-                                    PS_sum=PS_sum+1
-                                if int(evd_t[1]) ==2 :
-                                    PM_sum=PM_sum+1
-                                if int(evd_t[1]) ==3 :
-                                    PP_sum=PP_sum+1
-                        if(evd_t[0].find('PM')!=-1):
-                            t=evd_t[0].find('PM'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            PM_sum=PM_sum-1
-                            if(t<len(evd_t[0])-2 and tt3<=7 ):
-                                if int(evd_t[1]) ==1 :
-                                    PS_sum=PS_sum+1
-                                if int(evd_t[1]) ==2 :
-                                    PM_sum=PM_sum+1
-                                if int(evd_t[1]) ==3 :
-                                    PP_sum=PP_sum+1
-                        if(evd_t[0].find('PP')!=-1): 
-                            t=evd_t[0].find('PP'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            PP_sum=PP_sum-1
-                            if(t<len(evd_t[0])-2 and tt3<=6 ):
-                                if int(evd_t[1]) ==1 :
-                                    PS_sum=PS_sum+1
-                                if int(evd_t[1]) ==2 :
-                                    PM_sum=PM_sum+1
-                                if int(evd_t[1]) ==3 :
-                                    PP_sum=PP_sum+1
-                        if(evd_t[0].find('BS')!=-1): 
-                            t=evd_t[0].find('BS'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            BS_sum=BS_sum-1
-                            if(t<len(evd_t[0])-2 and tt3<=5 ):
-                                if int(evd_t[1]) ==1 :
-                                    BS_sum=BS_sum+1
-                                if int(evd_t[1]) ==3 :
-                                    BP_sum=BP_sum+1
-                        if(evd_t[0].find('BP')!=-1):
-                            t=evd_t[0].find('BP'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            BP_sum=BP_sum-1
-                            if(t<len(evd_t[0])-2 and tt3<=8 ):
-                                if int(evd_t[1]) ==1 :
-                                    BS_sum=BS_sum+1
-                                if int(evd_t[1]) ==3 :
-                                    BP_sum=BP_sum+1
-                    
-        except KeyError:
-            pass
-        else:
-            pass
+    (PS_grade,PM_grade,PP_grade,BS_grade,BP_grade)=grades
+    PS_sum=PS_sum+PS_grade
+    PM_sum=PM_sum+PM_grade
+    PP_sum=PP_sum+PP_grade
+    BS_sum=BS_sum+BS_grade
+    BP_sum=BP_sum+BP_grade
 
     # end process the user's flexible grade
 
@@ -985,7 +2232,7 @@ def classfyv2(PVS1,PS,PM,PP,BA1,BS,BP,Allels_flgs,cls):
 
     return(BPS[4]) # Uncertain significance
 
-def classfy(PVS1,PS,PM,PP,BA1,BS,BP,Allels_flgs,cls):
+def classfy(PVS1,PS,PM,PP,BA1,BS,BP,Allels_flgs,cls,grades=(0,0,0,0,0)):
     BPS=["Pathogenic","Likely pathogenic","Benign","Likely benign","Uncertain significance"]
     PAS_out=-1
     BES_out=-1
@@ -999,78 +2246,12 @@ def classfy(PVS1,PS,PM,PP,BA1,BS,BP,Allels_flgs,cls):
 
     #print("Before up/down grade, the sum of PS %s, PM %s,PP %s,BS %s,BP %s" %(PS_sum,PM_sum,PP_sum,BS_sum,BP_sum));
     #begin process the user's flexible grade  to get the final interpretation
-    if is_user_evidence_exist:
-        keys=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['Ref']]+"_"+cls[Allels_flgs['Alt']]
-        keys=re.sub("[Cc][Hh][Rr]","",keys)
-        try:
-            evds=user_evidence_dict[keys] #PS1=1;PM1=1;BA1=1;PVS1 PP BS BP
-            for evd in evds.split(';'):
-                evd_t=evd.split('=')
-                if(len(evd_t)>1 and  re.findall('grade', evd_t[0], flags=re.IGNORECASE) ):
-                    #10  104353782   G   A   PVS1=1;PP1=1;PM3=1;grade_PP1=2;
-                    if int(evd_t[1])<=3:
-                        #print ("%s %s %s " %(keys,evd_t[1],evd_t[0]))
-                        if(evd_t[0].find('PS')!=-1): 
-                            t=evd_t[0].find('PS'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            PS_sum=PS_sum-1
-                            if(t<len(evd_t[0])-2 and tt3<=5 ):
-                                if int(evd_t[1]) ==1 :
-                                    PS_sum=PS_sum+1
-                                if int(evd_t[1]) ==2 :
-                                    PM_sum=PM_sum+1
-                                if int(evd_t[1]) ==3 :
-                                    PP_sum=PP_sum+1
-                        if(evd_t[0].find('PM')!=-1):
-                            t=evd_t[0].find('PM'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            PM_sum=PM_sum-1
-                            if(t<len(evd_t[0])-2 and tt3<=7 ):
-                                if int(evd_t[1]) ==1 :
-                                    PS_sum=PS_sum+1
-                                if int(evd_t[1]) ==2 :
-                                    PM_sum=PM_sum+1
-                                if int(evd_t[1]) ==3 :
-                                    PP_sum=PP_sum+1
-                        if(evd_t[0].find('PP')!=-1): 
-                            t=evd_t[0].find('PP'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            PP_sum=PP_sum-1
-                            if(t<len(evd_t[0])-2 and tt3<=6 ):
-                                if int(evd_t[1]) ==1 :
-                                    PS_sum=PS_sum+1
-                                if int(evd_t[1]) ==2 :
-                                    PM_sum=PM_sum+1
-                                if int(evd_t[1]) ==3 :
-                                    PP_sum=PP_sum+1
-                        if(evd_t[0].find('BS')!=-1): 
-                            t=evd_t[0].find('BS'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            BS_sum=BS_sum-1
-                            if(t<len(evd_t[0])-2 and tt3<=5 ):
-                                if int(evd_t[1]) ==1 :
-                                    BS_sum=BS_sum+1
-                                if int(evd_t[1]) ==3 :
-                                    BP_sum=BP_sum+1
-                        if(evd_t[0].find('BP')!=-1):
-                            t=evd_t[0].find('BP'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            BP_sum=BP_sum-1
-                            if(t<len(evd_t[0])-2 and tt3<=8 ):
-                                if int(evd_t[1]) ==1 :
-                                    BS_sum=BS_sum+1
-                                if int(evd_t[1]) ==3 :
-                                    BP_sum=BP_sum+1
-                    
-        except KeyError:
-            pass
-        else:
-            pass
+    (PS_grade,PM_grade,PP_grade,BS_grade,BP_grade)=grades
+    PS_sum=PS_sum+PS_grade
+    PM_sum=PM_sum+PM_grade
+    PP_sum=PP_sum+PP_grade
+    BS_sum=BS_sum+BS_grade
+    BP_sum=BP_sum+BP_grade
 
     # end process the user's flexible grade
 
@@ -1110,39 +2291,28 @@ def classfy(PVS1,PS,PM,PP,BA1,BS,BP,Allels_flgs,cls):
 
     return(BPS[BPS_out])
 
-def check_PVS1(line,Funcanno_flgs,Allels_flgs,lof_genes_dict):
+def check_PVS1(row,lof_genes_dict):
     '''
     Certain types of variants (e.g., nonsense, frameshift, canonical
     +- 1 or 2 splice sites, initiation codon, single exon or multiexon
     deletion) in a gene where LOF is a known mechanism of disease
     '''
-    cls=line.split('\t')
-    funcs_tmp=["nonsense","frameshift","splic","stopgain"]
-    funcs_tmp2="nonframe"
-    funcs_tmp3="splic"
-    line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
+    need_datasets('check_PVS1')
     PVS=0
     PVS_t1=0
     PVS_t2=0
     PVS_t3=0
     dbscSNV_cutoff=0.6    #either score(ada and rf) >0.6 as splicealtering
     # Funcanno_flgs={'Func.refGene':0,'ExonicFunc.refGene':0
-    for fc in funcs_tmp:
-        if line_tmp.find(fc)>=0 and line_tmp.find(funcs_tmp2)<0 :
-            PVS_t1=1
-            break
+    if row.func_class&FUNC_LOF and not row.func_class&FUNC_NONFRAME:
+        PVS_t1=1
     # wait to check LOF genes use the LoFtool_percentile,but  how to know is the disese mechanism
-    try:
-        if lof_genes_dict[ cls[Funcanno_flgs['Gene']] ] == '1' :
-            PVS_t2=1
-    except KeyError:
-        PVS_t2=0
-    else:
-        pass
+    if gene_record(row.gene,row.ens_gene).lof == '1' :
+        PVS_t2=1
     #print("PVSt1= %d PVSt2= %d" % (PVS_t1,PVS_t2) )
     # begin check the site is really affect the splicing
     try:
-        if float(cls[Funcanno_flgs['dbscSNV_RF_SCORE']])>dbscSNV_cutoff or float(cls[Funcanno_flgs['dbscSNV_ADA_SCORE']])>dbscSNV_cutoff:
+        if float(row.dbscsnv_rf)>dbscSNV_cutoff or float(row.dbscsnv_ada)>dbscSNV_cutoff:
             PVS_t3=1
     except ValueError:
         pass
@@ -1150,88 +2320,74 @@ def check_PVS1(line,Funcanno_flgs,Allels_flgs,lof_genes_dict):
         pass
     if PVS_t1 !=0 and PVS_t2 != 0 :
         PVS=1
-        if line_tmp.find(funcs_tmp3)>=0 and PVS_t3 !=1:
+        if row.func_class&FUNC_SPLIC and PVS_t3 !=1:
             PVS=0
     #begin check it in the AAChange.knownGene for the major/Canonical isoform, not 1/last exon
     #SUFU:uc001kvy.2:exon6:c.G716A:p.R239Q
-    line_tmp2=cls[Funcanno_flgs['AAChange.knownGene']]
-    #for cls0 in line_tmp2.split(','):
-    for cls0 in re.split("[,;]",line_tmp2):
-        cls0_1=cls0.split(':')
-        if len(cls0_1)>1:
-            trans_id=cls0_1[1]
-            exon=cls0_1[2]
-            try:
-                exon_lth="exon"+knownGeneCanonical_dict[trans_id]
-                #if exon==exon_lth or exon =="exon1": # not 1 or last exon
-                if exon==exon_lth: # relax for only last exon
+    if PVS !=0 :
+        line_tmp2=row.aachange_known
+        try:
+            start=float(row.start)
+        except ValueError:
+            start=None
+        for cls0 in re.split("[,;]",line_tmp2):
+            cls0_1=cls0.split(':')
+            if len(cls0_1)>1:
+                trans_id=cls0_1[1]
+                exon=cls0_1[2]
+                # relax for only last exon, or close 3' of gene 50 bp.
+                if knownGeneCanonical_dict.last_exon_or_tail(trans_id,exon,start):
                     PVS=0
-                try:
-                    if (float(knownGeneCanonical_ed_dict[trans_id])-float( cls[Allels_flgs['Start']]  ))<50: # means close  3' of gene 50 bp.
-                        PVS=0
-                except ValueError:
-                    pass
-                else:
-                    pass
-
-            except KeyError:
-                pass
-            else:
-                pass
+                    break
 
 
 
     return(PVS)
 
-def check_PS1(line,Funcanno_flgs,Allels_flgs,aa_changes_dict):
+def check_PS1_PM5(row,aa_sites_dict):
     '''
     PS1 Same amino acid change as a previously established pathogenic variant regardless of nucleotide change
     Example: Val->Leu caused by either G>C or G>T in the same codon
+    PM5 Novel missense change at an amino acid residue where a different missense change determined to be
+    pathogenic has been seen before;Example: Arg156His is pathogenic; now you observe Arg156Cys
     AAChange.refGene
     NOD2:NM_001293557:exon3:c.C2023T:p.R675W,NOD2:NM_022162:exon4:c.C2104T:p.R702W
+    Both come from the pathogenic changes known at the site, looked up once
     '''
-    
+    need_datasets('check_PS1_PM5')
+
     PS1=0
     PS1_t1=0
     PS1_t2=0
     PS1_t3=0
+    PM5=0
+    PM5_t2=0
+    PM5_t3=0
     dbscSNV_cutoff=0.6    #either score(ada and rf) >0.6 as splicealtering
-    cls=line.split('\t')
-    funcs_tmp=["missense","nonsynony"]
     ACGTs=["A","C","G","T"]
-    line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
-    for fc in funcs_tmp:
-        if line_tmp.find(fc)>=0 :
-            PS1_t1=1;
-            # need to wait to check Same amino acid change as a previously pathogenic variant
-            line_tmp2=cls[Funcanno_flgs['AAChange.refGene']]
-            #cls0=line_tmp2.split(',')
-            cls0=re.split("[,;]",line_tmp2)
-            cls0_1=cls0[0].split(':')
-            aa=cls0_1[4]
-            aa_last=aa[len(aa)-1:]
-            keys_tmp2=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['End']]+"_"+cls[Allels_flgs['Alt']]
-            try:
-                if  aa_changes_dict[keys_tmp2]:
-                    PS1_t2=0
-            except KeyError:
-                for nt in ACGTs:
-                    if nt != cls[Allels_flgs['Alt']] and nt != cls[Allels_flgs['Ref']]:
-                        keys_tmp3=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['End']]+"_"+nt
-                        try:
-                            if aa_changes_dict[keys_tmp3] == aa_last:
-                                PS1_t2=1
-                        except KeyError:
-                            pass
-                        else:
-                            pass
-
-            else:
-                pass
+    if row.func_class&FUNC_MISSENSE:
+        PS1_t1=1
+    if PS1_t1 !=0 :
+        line_tmp2=row.aachange
+        cls0=re.split("[,;]",line_tmp2)
+        cls0_1=cls0[0].split(':')
+        aa=cls0_1[4]
+        aa_last=aa[len(aa)-1:]
+        alt=row.alt
+        alts=dict(aa_sites_dict.get((row.chrom,row.start,row.end,"",""),()))
+        if alt not in alts: # the same nucleotide change is not known, check the other changes of the codon
+            PM5_t2=1
+            for nt in ACGTs:
+                if nt != alt and nt != row.ref and nt in alts:
+                    if alts[nt]:
+                        PM5_t3=1
+                    if alts[nt] == aa_last: # same amino acid change
+                        PS1_t2=1
+                        PM5_t2=0
     try:
-        if float(cls[Funcanno_flgs['dbscSNV_RF_SCORE']])>dbscSNV_cutoff or float(cls[Funcanno_flgs['dbscSNV_ADA_SCORE']])>dbscSNV_cutoff: # means alter the splicing
+        if float(row.dbscsnv_rf)>dbscSNV_cutoff or float(row.dbscsnv_ada)>dbscSNV_cutoff: # means alter the splicing
             PS1_t3=1
-        if cls[Funcanno_flgs['dbscSNV_RF_SCORE']] == "." or cls[Funcanno_flgs['dbscSNV_ADA_SCORE']] == ".": # absent also means not in splicing
+        if row.dbscsnv_rf == "." or row.dbscsnv_ada == ".": # absent also means not in splicing
             PS1_t3=0
     except ValueError:
         pass
@@ -1242,9 +2398,11 @@ def check_PS1(line,Funcanno_flgs,Allels_flgs,aa_changes_dict):
         PS1=1
         if PS1_t3 ==1: # remove the splicing affect 
             PS1=0
-    return(PS1)
+    if PS1_t1 !=0 and PM5_t2 != 0 and PM5_t3 !=0 :
+        PM5=1
+    return(PS1,PM5)
 
-def check_PS2(line,Funcanno_flgs,Allels_flgs):
+def check_PS2(row):
     '''
     De novo (both maternity and paternity confirmed) in a patient with the disease and no family history
     '''
@@ -1252,7 +2410,7 @@ def check_PS2(line,Funcanno_flgs,Allels_flgs):
     return(PS2)
 
 
-def check_PS3(line,Funcanno_flgs,Allels_flgs):
+def check_PS3(row):
     '''
     Well-established in vitro or in vivo functional studies supportive of a damaging effect on the gene or gene
     product
@@ -1273,16 +2431,15 @@ def check_PS3(line,Funcanno_flgs,Allels_flgs):
     return(PS3)
 
 
-def check_PS4(line,Funcanno_flgs,Allels_flgs):
+def check_PS4(row):
     '''
     The prevalence of the variant in affected individuals is significantly increased compared with the prevalence
     in controls; OR>5 in all the gwas, the dataset is from gwasdb jjwanglab.org/gwasdb
     '''
+    need_datasets('check_PS4')
     PS4=0
-    cls=line.split('\t')
-    keys_tmp2=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['End']]+"_"+cls[Allels_flgs['Ref']]+"_"+cls[Allels_flgs['Alt']]
     try:
-        if PS4_snps_dict[keys_tmp2] == "1":
+        if PS4_snps_dict.lookup(row.chrom,row.start,row.end,row.ref,row.alt) == "1":
             PS4=1
     except KeyError:
         pass
@@ -1291,30 +2448,21 @@ def check_PS4(line,Funcanno_flgs,Allels_flgs):
     return(PS4)
 
 
-def check_PM1(line,Funcanno_flgs,Allels_flgs,domain_benign_dict):
+def check_PM1(row,domain_benign_dict):
     '''
     Located in a mutational hot spot and/or critical and well-established functional domain (e.g., active site of
     an enzyme) without benign variation
     '''
+    need_datasets('check_PM1')
     PM1=0
     PM1_t1=0
     PM1_t2=0
-    cls=line.split('\t')
-    funcs_tmp=["missense","nonsynony"]
-    line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
-    for fc in funcs_tmp:
-        if line_tmp.find(fc)>=0 :
-            PM1_t1=1;
+    if row.func_class&FUNC_MISSENSE:
+        PM1_t1=1
         # need to wait to check whether in hot spot  or  functional domain/without benign variation
-    if cls[Funcanno_flgs['Interpro_domain']]!= '.' :
-        keys_tmp2=cls[Allels_flgs['Chr']]+"_"+cls[Funcanno_flgs['Gene']]+": "+cls[Funcanno_flgs['Interpro_domain']]
-        try:
-            if domain_benign_dict[keys_tmp2] =="1":
-                PM1_t2=0
-        except KeyError:
+    if row.interpro!= '.' :
+        if not domain_benign_dict.has_benign(row.chrom,row.gene,row.interpro):
             PM1_t2=1
-        else:
-            pass
 
     if PM1_t1==1 and PM1_t2==1 :
         PM1=1
@@ -1322,59 +2470,32 @@ def check_PM1(line,Funcanno_flgs,Allels_flgs,domain_benign_dict):
     return(PM1)
 
 
-def check_PM2(line,Freqs_flgs,Allels_flgs,Funcanno_flgs,mim2gene_dict,mim2gene_dict2):
+def check_PM2(row,mim2gene_dict,mim2gene_dict2):
     '''
     Absent from controls (or at extremely low frequency if recessive) (Table 6) in Exome Sequencing Project,
     1000 Genomes Project, or Exome Aggregation Consortium
     '''
+    need_datasets('check_PM2')
     PM2=0
-    cutoff_maf=0.005  # extremely low frequency
-    cls=line.split('\t')
     tt=1;
-    for key in Freqs_flgs.keys():
-        if(cls[Freqs_flgs[key]]!='.'): # absent in all three controls
-            tt=tt*0;
+    if not row.freqs_absent: # absent in all three controls
+        tt=0;
     if tt==1:
         PM2=1
 
     if tt==0:  # means some controls has frequency and it is not absent; then need to check it is recessive or not
-        tt2=1;
-        mim_num=0;
-        try:
-            mim_num=mim2gene_dict2[cls[Funcanno_flgs['Gene']]]
-        except KeyError:
-            pass
-        else:
-            pass
-
-        try:
-            mim_num=mim2gene_dict[ cls[Funcanno_flgs['Gene.ensGene']] ]
-        except KeyError:
-            pass
-        else:
-            pass
+        gene=gene_record(row.gene,row.ens_gene)
+        mim_num=gene.pm2_mim
 
         if int(mim_num) >0: # it has  mim, check the dom or recess and freq
-            try:
-                if mim_recessive_dict[mim_num]=="1": # it is recessive
-                    for key in Freqs_flgs.keys():
-                        #print "test PM2 not really absent"
-                        try:
-                            if(cls[Freqs_flgs[key]]!='.' and float(cls[Freqs_flgs[key]])>=cutoff_maf): 
-                                tt2=tt2*0;
-                        except ValueError:
-                            pass
-                        else:
-                            pass
-
-                    if tt2==1:
-                        PM2=1
-                    if tt2==0:
-                        PM2=0
-            except KeyError: # means it is not recessive
+            if gene.pm2_recessive is None: # means it is not recessive
                 PM2=0
-            else:
-                pass
+            elif gene.pm2_recessive=="1": # it is recessive
+                tt2=frequency_criteria(row)[2] # none of the controls >= 0.005, extremely low frequency
+                if tt2==1:
+                    PM2=1
+                if tt2==0:
+                    PM2=0
 
 
         if mim_num ==0: # it has no mim, also treat as dom and not absent
@@ -1385,31 +2506,27 @@ def check_PM2(line,Freqs_flgs,Allels_flgs,Funcanno_flgs,mim2gene_dict,mim2gene_d
 
 
 
-def check_PM3(line,Funcanno_flgs,Allels_flgs):
+def check_PM3(row):
     '''
     For recessive disorders, detected in trans with a pathogenic variant
     '''
     PM3=0
     return(PM3)
 
-def check_PM4(line,Funcanno_flgs,Allels_flgs):
+def check_PM4(row):
     '''
     Protein length changes as a result of in-frame deletions/insertions in a nonrepeat region or stop-loss variants
     '''
     PM4=0
     PM4_t1=0
     PM4_t2=0
-    cls=line.split('\t')
     #funcs_tmp=["cds-indel","stop-loss"]
-    funcs_tmp=["nonframeshift insertion","nonframeshift deletion","stoploss"]
-    line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
-    for fc in funcs_tmp:
-        if line_tmp.find(fc)>=0 :
-            PM4_t1=1
+    if row.func_class&(FUNC_INFRAME_INDEL|FUNC_STOPLOSS):
+        PM4_t1=1
         # need to wait to check  in a nonrepeat region
-    if cls[Funcanno_flgs['rmsk']] == '.':
+    if row.rmsk == '.':
         PM4_t2=1
-    if cls[Funcanno_flgs['rmsk']] != '.' and  line_tmp.find("stoploss")>=0 :
+    if row.rmsk != '.' and  row.func_class&FUNC_STOPLOSS :
         PM4_t2=1
 
     if PM4_t1 !=0 and PM4_t2 != 0 :
@@ -1417,69 +2534,14 @@ def check_PM4(line,Funcanno_flgs,Allels_flgs):
 
     return(PM4)
 
-def check_PM5(line,Funcanno_flgs,Allels_flgs,aa_changes_dict):
-    '''
-    Novel missense change at an amino acid residue where a different missense change determined to be
-    pathogenic has been seen before;Example: Arg156His is pathogenic; now you observe Arg156Cys
-    NOD2:NM_001293557:exon3:c.C2023T:p.R675W,NOD2:NM_022162:exon4:c.C2104T:p.R702W
-    '''
-    PM5=0
-    PM5_t1=0
-    PM5_t2=0
-    PM5_t3=0
-    cls=line.split('\t')
-    funcs_tmp=["missense","nonsynony"]
-    line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
-    ACGTs=["A","C","G","T"]
-
-    for fc in funcs_tmp:
-        if line_tmp.find(fc)>=0 :
-            PM5_t1=1;
-        # need to wait to check no-Same amino acid change as a previously pathogenic variant
-            line_tmp2=cls[Funcanno_flgs['AAChange.refGene']]
-            #cls0=line_tmp2.split(',')
-            cls0=re.split("[,;]",line_tmp2)
-            cls0_1=cls0[0].split(':')
-            aa=cls0_1[4]
-            aa_last=aa[len(aa)-1:]
-            #keys_tmp2=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['End']]+"_"+cls[Allels_flgs['Ref']]+"_"+cls[Allels_flgs['Alt']]
-            keys_tmp2=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['End']]+"_"+cls[Allels_flgs['Alt']]
-            #print("%s %s %s" %(aa,aa_last,keys_tmp2))
-            try:
-                if  aa_changes_dict[keys_tmp2] :
-                    PM5_t2=0
-                    #print("PM5 %s %s" %(aa_changes_dict[keys_tmp2],aa_last))
-            except KeyError:
-                PM5_t2=1
-                PM5_t3=0
-                for nt in ACGTs:
-                    if nt != cls[Allels_flgs['Alt']] and  nt != cls[Allels_flgs['Ref']]:
-                        keys_tmp3=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['End']]+"_"+nt
-                        try:
-                            if aa_changes_dict[keys_tmp3]:
-                                PM5_t3=1
-                            if aa_changes_dict[keys_tmp3] == aa_last:
-                                PM5_t2=0*PM5_t2
-                        except KeyError:
-                            pass
-                        else:
-                            pass
-
-            else:
-                pass
-
-    if PM5_t1 !=0 and PM5_t2 != 0 and PM5_t3 !=0 :
-        PM5=1
-    return(PM5)
-
-def check_PM6(line,Funcanno_flgs,Allels_flgs):
+def check_PM6(row):
     '''
     Assumed de novo, but without confirmation of paternity and maternity
     '''
     PM6=0
     return(PM6)
 
-def check_PP1(line,Funcanno_flgs,Allels_flgs):
+def check_PP1(row):
     '''
     Cosegregation with disease in multiple affected family members in a gene definitively 
     known to cause the disease
@@ -1487,29 +2549,24 @@ def check_PP1(line,Funcanno_flgs,Allels_flgs):
     PP1=0
     return(PP1)
 
-def check_PP2(line,Funcanno_flgs,Allels_flgs,PP2_genes_dict):
+def check_PP2(row,PP2_genes_dict):
     '''
     Missense variant in a gene that has a low rate of benign missense variation and in which 
     missense variants are a common mechanism of disease
     '''
+    need_datasets('check_PP2')
     PP2=0
-    cls=line.split('\t')
-    funcs_tmp=["missense","nonsynony"]
-    line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
-    for fc in funcs_tmp:
-        if line_tmp.find(fc)>=0 :
+    if row.func_class&FUNC_MISSENSE:
         # need to check whether gene has a low rate of benign missense variation.....
-            try:
-                if PP2_genes_dict[ cls[Funcanno_flgs['Gene']] ] == '1' :
-                    PP2=1
-            except KeyError:
-                PP2=0
-            else:
-                pass
+        pp2=gene_record(row.gene,row.ens_gene).pp2
+        if pp2 is None:
+            PP2=0
+        elif pp2 == '1' :
+            PP2=1
 
     return(PP2)
 
-def check_PP3(line,Funcanno_flgs,Allels_flgs):
+def check_PP3(row):
     '''
     Multiple lines of computational evidence support a deleterious effect on the gene or gene product
     (conservation, evolutionary, splicing impact, etc.)
@@ -1525,23 +2582,19 @@ def check_PP3(line,Funcanno_flgs,Allels_flgs):
     cutoff_conserv=2 # for GERP++_RS
     dbscSNV_cutoff=0.6    #either score(ada and rf) >0.6 as splicealtering
     
-    cls=line.split('\t')
    
     try:
         #if float(cls[Funcanno_flgs['SIFT_score']]) < sift_cutoff:
-        if float(cls[Funcanno_flgs['MetaSVM_score']]) >  metasvm_cutoff:
+        if float(row.metasvm) >  metasvm_cutoff:
             PP3_t1=1
     except ValueError:  # the sift absent means many:  synonymous indel  stop, but synonymous also is no impact
-        funcs_tmp=["synon","coding-synon"]
-        line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
-        for fc in funcs_tmp:
-            if line_tmp.find(fc)<0 :
-                PP3_t1=1
+        if not row.func_class&FUNC_SYNON or not row.func_class&FUNC_CODING_SYNON:
+            PP3_t1=1
     else:
         pass
     try:
         #if float(cls[Funcanno_flgs['phyloP46way_placental']])> PhyloP_cutoff:
-        if float(cls[Funcanno_flgs['GERP++_RS']])> cutoff_conserv:
+        if float(row.gerp)> cutoff_conserv:
             PP3_t2=1
     except ValueError:  
         # absent means there are gaps in the multiple alignment,so cannot have the score,not conserved
@@ -1549,7 +2602,7 @@ def check_PP3(line,Funcanno_flgs,Allels_flgs):
     else:
         pass
     try:
-        if float(cls[Funcanno_flgs['dbscSNV_RF_SCORE']])>dbscSNV_cutoff or float(cls[Funcanno_flgs['dbscSNV_ADA_SCORE']])>dbscSNV_cutoff:
+        if float(row.dbscsnv_rf)>dbscSNV_cutoff or float(row.dbscsnv_ada)>dbscSNV_cutoff:
             PP3_t3=1
     except ValueError:
         pass
@@ -1561,7 +2614,7 @@ def check_PP3(line,Funcanno_flgs,Allels_flgs):
     
     return(PP3)
 
-def check_PP4(line,Funcanno_flgs,Allels_flgs):
+def check_PP4(row):
     '''
     Patient's phenotype or family history is highly specific for a disease with a single genetic etiology
     '''
@@ -1569,15 +2622,14 @@ def check_PP4(line,Funcanno_flgs,Allels_flgs):
     return(PP4)
 
 
-def check_PP5(line,Funcanno_flgs,Allels_flgs):
+def check_PP5(row):
     '''
     Reputable source recently reports variant as pathogenic, but the evidence is not available to the laboratory
     to perform an independent evaluation
     '''
     PP5=0
-    cls=line.split('\t')
 
-    line_tmp2=cls[Funcanno_flgs['CLINSIG']]
+    line_tmp2=row.clinsig
     if line_tmp2 != '.':
         cls3=line_tmp2.split(';')
         clinvar_bp=cls3[0]
@@ -1586,111 +2638,59 @@ def check_PP5(line,Funcanno_flgs,Allels_flgs):
                 PP5=1
     return(PP5)
 
-def check_BA1(line,Freqs_flgs,Allels_flgs):
+def check_BA1(row):
     '''
     BA1 Allele frequency is >5% in Exome Sequencing Project, 1000 Genomes Project, or Exome Aggregation Consortium
     '''
-    BA1=0
-    cls=line.split('\t')
-    Freqs_3pops={'1000g2015aug_all':0,'esp6500siv2_all':0,'gnomAD_genome_ALL':0}
-    for key in Freqs_3pops.keys():
-        try:
-            if float(cls[Freqs_flgs[key]])>0.05: BA1=1
-
-        except ValueError:
-            pass
-        else:
-            pass
-
+    BA1=frequency_criteria(row)[0]
     return(BA1)
 
-def check_BS1(line,Freqs_flgs,Allels_flgs):
+def check_BS1(row):
     '''
     Allele frequency is greater than expected for disorder (see Table 6)
     > 1% in ESP6500all ExAc? need to check more 
+    the disorder cutoff of each population comes from the config, see frequency_kernel
     '''
-    BS1=0
-    cutoff=0.005 # disorder cutoff
-    try:
-        cutoff=float(paras['disorder_cutoff']) # user's disorder cutoff
-        #print("Warning: Customized  disease cutoff %s in config.ini" % (cutoff)) 
-    except ValueError:
-        cutoff=0.005
-    else:
-        pass
-    cls=line.split('\t')
-    #print("Warning: Current effective disease cutoff %s" % (cutoff)) 
-    for key in Freqs_flgs.keys():
-        try:
-            if cls[Freqs_flgs[key]] !='.':
-                if float(cls[Freqs_flgs[key]]  )>=cutoff : BS1=1
-        except ValueError:
-            pass
-        else:
-            pass
-
+    BS1=frequency_criteria(row)[1]
     return(BS1)
 
-def check_BS2(line,Freqs_flgs,Allels_flgs,Funcanno_flgs):
+def check_BS2(row,genotypes=None):
     '''
     Observed in a healthy adult individual for a recessive (homozygous), dominant (heterozygous), or X-linked
     (hemizygous) disorder, with full penetrance expected at an early age
-    check gnomAD_genome_ALL
+    check gnomAD_genome_ALL; genotypes is the (recess,domin) of BS2_snps_dict
+    when it is already looked up, (None,None) for a variant not in it
     '''
+    need_datasets('check_BS2')
     BS2=0
-    cls=line.split('\t')
-    keys=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['End']]+"_"+cls[Allels_flgs['Ref']]+"_"+cls[Allels_flgs['Alt']]
-    try:
-        mim1=mim2gene_dict[ cls[Funcanno_flgs['Gene.ensGene']] ]
-        try:
-            if mim_adultonset_dict[mim1] == "1": # means adult oneset disorder
-                BS2=0;
-        except KeyError: # means not adult onset, begin to check recessive or domiant ,the genotype from 1000 genome
-            try:
-                if mim_recessive_dict[mim1] == "1": # means recessive disorder: check snps as homo
-                    try:
-                        if BS2_snps_recess_dict[ keys ]=="1":  # key as snp info
-                            BS2=1
-                    except KeyError:
-                        pass
-                    else:
-                        pass
-            except KeyError:
-                pass
-            else:
-                pass
-
-
-            try:
-                if mim_domin_dict[mim1] == "1": # means dominant disorder: check snps as heter
-                    BS2=0
-                    try:
-                        if BS2_snps_domin_dict[ keys ]=="1":  # key as snp info
-                            BS2=1
-                    except KeyError:
-                        pass
-                    else:
-                        pass
-            except KeyError:
-                pass
-            else:
-                pass
-
-
-
-
-        else:
-
-            pass
-
-    except KeyError: # means no information of recessive or domiant so BS2=0
+    gene=gene_record(row.gene,row.ens_gene)
+    if gene.bs2_mim is None: # means no information of recessive or domiant so BS2=0
         BS2=0
-    else:
-        pass
+    elif gene.bs2_adultonset is not None:
+        if gene.bs2_adultonset == "1": # means adult oneset disorder
+            BS2=0;
+    else: # means not adult onset, begin to check recessive or domiant ,the genotype from 1000 genome
+        recess=domin=None
+        if gene.bs2_recessive == "1" or gene.bs2_domin == "1":
+            if genotypes is not None:
+                (recess,domin)=genotypes
+            else:
+                (ref,alt)=bs2_alleles(row.ref,row.alt)
+                try:
+                    (recess,domin)=BS2_snps_dict.lookup(row.chrom,row.start,row.end,ref,alt)
+                except KeyError:
+                    pass
+        if gene.bs2_recessive == "1": # means recessive disorder: check snps as homo
+            if recess=="1":  # key as snp info
+                BS2=1
+        if gene.bs2_domin == "1": # means dominant disorder: check snps as heter
+            BS2=0
+            if domin=="1":  # key as snp info
+                BS2=1
 
     return(BS2)
 
-def check_BS3(line,Funcanno_flgs,Allels_flgs):
+def check_BS3(row):
     '''
     Well-established in vitro or in vivo functional studies show no damaging effect on protein function or splicing
     '''
@@ -1707,36 +2707,31 @@ def check_BS3(line,Funcanno_flgs,Allels_flgs):
     '''
     return(BS3)
 
-def check_BS4(line,Funcanno_flgs,Allels_flgs):
+def check_BS4(row):
     '''
     Lack of segregation in affected members of a family
     '''
     BS4=0
     return(BS4)
 
-def check_BP1(line,Funcanno_flgs,Allels_flgs,BP1_genes_dict):
+def check_BP1(row,BP1_genes_dict):
     '''
     Missense variant in a gene for which primarily truncating variants are known to cause disease
     truncating:  stop_gain / frameshift deletion/  nonframshift deletion
     We defined Protein truncating variants  (4) (table S1) as single-nucleotide variants (SNVs) predicted to introduce a premature stop codon or to disrupt a splice site, small insertions or deletions (indels) predicted to disrupt a transcript reading frame, and larger deletions 
     '''
+    need_datasets('check_BP1')
     BP1=0
-    cls=line.split('\t')
-    funcs_tmp=["missense","nonsynony"]
-    line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
-    for fc in funcs_tmp:
-        if line_tmp.find(fc)>=0 :
+    if row.func_class&FUNC_MISSENSE:
         # need to wait to check whether truncating is the only cause disease
-            try:
-                if BP1_genes_dict[ cls[Funcanno_flgs['Gene']] ] == '1' :
-                    BP1=1
-            except KeyError:
-                BP1=0
-            else:
-                pass
+        bp1=gene_record(row.gene,row.ens_gene).bp1
+        if bp1 is None:
+            BP1=0
+        elif bp1 == '1' :
+            BP1=1
     return(BP1)
 
-def check_BP2(line,Funcanno_flgs,Allels_flgs):
+def check_BP2(row):
     '''
     Observed in trans with a pathogenic variant for a fully penetrant dominant gene/disorder or observed 
     in cis with a pathogenic variant in any inheritance pattern
@@ -1744,7 +2739,7 @@ def check_BP2(line,Funcanno_flgs,Allels_flgs):
     BP2=0
     return(BP2)
 
-def check_BP3(line,Funcanno_flgs,Allels_flgs):
+def check_BP3(row):
     '''
     In-frame deletions/insertions in a repetitive region without a known function
     if the repetitive region is in the domain, this BP3 should not be applied.
@@ -1752,22 +2747,18 @@ def check_BP3(line,Funcanno_flgs,Allels_flgs):
     BP3=0
     BP3_t1=0
     BP3_t2=0
-    cls=line.split('\t')
     #funcs_tmp=["cds-indel","stop-loss"]
-    funcs_tmp=["nonframeshift insertion","nonframeshift deletion","nonframeshift substitution"]
-    line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
-    for fc in funcs_tmp:
-        if line_tmp.find(fc)>=0 :
-            BP3_t1=1;
+    if row.func_class&(FUNC_INFRAME_INDEL|FUNC_NONFRAME_SUB):
+        BP3_t1=1
         # need to wait to check  in a repeat region
-    if cls[Funcanno_flgs['rmsk']] != '.' and  cls[Funcanno_flgs['Interpro_domain']]== '.' : # repeat and not in domain
+    if row.rmsk != '.' and  row.interpro== '.' : # repeat and not in domain
         BP3_t2=1
 
     if BP3_t1 !=0 and BP3_t2 != 0 :
         BP3=1
     return(BP3)
 
-def check_BP4(line,Funcanno_flgs,Allels_flgs):
+def check_BP4(row):
     '''
     Multiple lines of computational evidence suggest no impact on gene or gene product (conservation, 
     evolutionary,splicing impact, etc.)
@@ -1782,23 +2773,18 @@ def check_BP4(line,Funcanno_flgs,Allels_flgs):
     cutoff_conserv=2 # for GERP++_RS
     dbscSNV_cutoff=0.6    #either score(ada and rf) >0.6 as splicealtering
     
-    cls=line.split('\t')
     try: 
         #if float(cls[Funcanno_flgs['SIFT_score']]) >= sift_cutoff:
-        if float(cls[Funcanno_flgs['MetaSVM_score']]) <  metasvm_cutoff:
+        if float(row.metasvm) <  metasvm_cutoff:
             BP4_t1=1
     except ValueError:  # the sift absent means many:  synonymous indel  stop, but synonymous also is no impact
-        funcs_tmp=["synon","coding-synon"]
-        funcs_tmp2="nonsynon"
-        line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
-        for fc in funcs_tmp:
-            if line_tmp.find(fc)>=0 and line_tmp.find(funcs_tmp2)<0 :
-                BP4_t1=1
+        if row.func_class&FUNC_SYNON and not row.func_class&FUNC_NONSYNON:
+            BP4_t1=1
     else:
         pass
     try:
         #if float(cls[Funcanno_flgs['phyloP46way_placental']]) <= PhyloP_cutoff:
-        if float(cls[Funcanno_flgs['GERP++_RS']]) <= cutoff_conserv:
+        if float(row.gerp) <= cutoff_conserv:
             BP4_t2=1
     except ValueError:
         # absent means there are gaps in the multiple alignment,so cannot have the score,not conserved
@@ -1806,7 +2792,7 @@ def check_BP4(line,Funcanno_flgs,Allels_flgs):
     else:
         pass
     try:
-        if float(cls[Funcanno_flgs['dbscSNV_RF_SCORE']]) <=dbscSNV_cutoff and float(cls[Funcanno_flgs['dbscSNV_ADA_SCORE']]) <=dbscSNV_cutoff:
+        if float(row.dbscsnv_rf) <=dbscSNV_cutoff and float(row.dbscsnv_ada) <=dbscSNV_cutoff:
             BP4_t3=1
     except ValueError:
         BP4_t3=1  # means absent, this site is not in splicing consensus regions
@@ -1820,7 +2806,7 @@ def check_BP4(line,Funcanno_flgs,Allels_flgs):
     return(BP4)
 
 
-def check_BP5(line,Funcanno_flgs,Allels_flgs,morbidmap_dict):
+def check_BP5(row,morbidmap_dict):
     '''
     Variant found in a case with an alternate molecular basis for disease
     check the genes whether are for mutilfactor disorder
@@ -1840,16 +2826,15 @@ def check_BP5(line,Funcanno_flgs,Allels_flgs,morbidmap_dict):
     BP5=0; 
     return(BP5)
 
-def check_BP6(line,Funcanno_flgs,Allels_flgs):
+def check_BP6(row):
     '''
     Reputable source recently reports variant as benign, but the evidence is not available to the 
     laboratory to perform an independent evaluation; Check the ClinVar column to see whether this 
     is "benign". 
     '''
     BP6=0
-    cls=line.split('\t')
 
-    line_tmp2=cls[Funcanno_flgs['CLINSIG']]
+    line_tmp2=row.clinsig
     if line_tmp2 != '.':
         cls3=line_tmp2.split(';')
         clinvar_bp=cls3[0]
@@ -1858,7 +2843,7 @@ def check_BP6(line,Funcanno_flgs,Allels_flgs):
 
     return(BP6)
 
-def check_BP7(line,Funcanno_flgs,Allels_flgs):
+def check_BP7(row):
     '''
     A synonymous (silent) variant for which splicing prediction algorithms predict no impact to the 
     splice consensus sequence nor the creation of a new splice site AND the nucleotide is not highly 
@@ -1868,22 +2853,17 @@ def check_BP7(line,Funcanno_flgs,Allels_flgs):
     BP7_t1=0
     BP7_t2=0
     cutoff_conserv=2 # for GERP++
-    cls=line.split('\t')
-    funcs_tmp=["synon","coding-synon"]
-    funcs_tmp2="nonsynon"
-    line_tmp=cls[Funcanno_flgs['Func.refGene']]+" "+cls[Funcanno_flgs['ExonicFunc.refGene']]
-    for fc in funcs_tmp:
-        if line_tmp.find(fc)>=0 and line_tmp.find(funcs_tmp2)<0 :
+    if row.func_class&FUNC_SYNON and not row.func_class&FUNC_NONSYNON:
     # need to wait to check the  impact to the splice from dbscSNV 
     # either score(ada and rf) >0.6 as splicealtering
-            if cls[Funcanno_flgs['dbscSNV_RF_SCORE']]=="." or  cls[Funcanno_flgs['dbscSNV_ADA_SCORE']]==".":
-                BP7_t1=1  # absent means it is not in the  splice consensus sequence
-            else:
-                if float(cls[Funcanno_flgs['dbscSNV_RF_SCORE']])<0.6 and float(cls[Funcanno_flgs['dbscSNV_ADA_SCORE']])<0.6:
-                    BP7_t1=1
+        if row.dbscsnv_rf=="." or  row.dbscsnv_ada==".":
+            BP7_t1=1  # absent means it is not in the  splice consensus sequence
+        else:
+            if float(row.dbscsnv_rf)<0.6 and float(row.dbscsnv_ada)<0.6:
+                BP7_t1=1
 # check the conservation score of gerp++ > 2
     try:
-        if float(cls[Funcanno_flgs['GERP++_RS']]) <= float(cutoff_conserv) or cls[Funcanno_flgs['GERP++_RS']] == '.' :
+        if float(row.gerp) <= float(cutoff_conserv) or row.gerp == '.' :
             BP7_t2=1
     except ValueError:
         # absent means there are gaps in the multiple alignment,so cannot have the score,not conserved
@@ -1896,7 +2876,65 @@ def check_BP7(line,Funcanno_flgs,Allels_flgs):
     return(BP7)
 
 
-def assign(BP,line,Freqs_flgs,Funcanno_flgs,Allels_flgs):
+def needing(user,check):
+    '''
+    The check with the datasets of user read before it is called, so the
+    datasets it is given are the loaded ones
+    '''
+    def check_row(row):
+        need_datasets(user)
+        return(check(row))
+    return(check_row)
+
+CRITERIA_GRAPH=[
+    (1,'variant',((1,0),),lambda row: check_BA1(row)),
+    (1,'variant',((5,0),),lambda row: check_BS1(row)),
+    (1,'variant',((3,3),),lambda row: check_PM4(row)),
+    (1,'variant',((6,2),),lambda row: check_BP3(row)),
+    (1,'variant',((4,2),),lambda row: check_PP3(row)),
+    (1,'variant',((6,3),),lambda row: check_BP4(row)),
+    (1,'variant',((6,6),),lambda row: check_BP7(row)),
+    (2,'gene',((3,1),),needing('check_PM2',lambda row: check_PM2(row,mim2gene_dict,mim2gene_dict2))),
+    (2,'gene',((4,1),),needing('check_PP2',lambda row: check_PP2(row,PP2_genes_dict))),
+    (2,'gene',((6,0),),needing('check_BP1',lambda row: check_BP1(row,BP1_genes_dict))),
+    (3,'gene',((0,0),),needing('check_PVS1',lambda row: check_PVS1(row,lof_genes_dict))),
+    (3,'gene',((3,0),),needing('check_PM1',lambda row: check_PM1(row,domain_benign_dict))),
+    (3,'variant',((2,0),(3,4)),needing('check_PS1_PM5',lambda row: check_PS1_PM5(row,aa_sites_dict))),
+    (3,'variant',((2,3),),lambda row: check_PS4(row)),
+    (3,'gene',((5,1),),lambda row: check_BS2(row)),
+]
+# PS2 PS3 PM3 PM6 PP1 PP4 BS3 BS4 BP2 BP5 are always 0, PP5 and BP6 are ignored: they are not in the graph
+CRITERIA_PENDING=[(any(slot in (0,2,3,4) for (cost,scope,codes,check) in CRITERIA_GRAPH[position:] for (slot,i) in codes),
+    any(slot in (1,5,6) for (cost,scope,codes,check) in CRITERIA_GRAPH[position:] for (slot,i) in codes)) for position in range(len(CRITERIA_GRAPH))]
+short_circuit=False
+
+def criteria_decided(PVS1,PS,PM,PP,BA1,BS,BP,pathogenic,benign,position):
+    '''
+    Whether classfyv2 gives the same class whatever the criteria of
+    CRITERIA_GRAPH from position on are, pathogenic and benign telling whether
+    a criterion of each side is set: both make it Uncertain significance,
+    Benign only grows with the benign criteria once no pathogenic one is left
+    and Pathogenic only grows with the pathogenic criteria once no benign one is left
+    '''
+    if pathogenic and benign:
+        return(True)
+    (pathogenic_pending,benign_pending)=CRITERIA_PENDING[position]
+    if not pathogenic and not pathogenic_pending:
+        return(classfyv2(PVS1,PS,PM,PP,BA1,BS,BP,None,None)=="Benign")
+    if not benign and not benign_pending:
+        return(classfyv2(PVS1,PS,PM,PP,BA1,BS,BP,None,None)=="Pathogenic")
+    return(False)
+
+def assign(BP,row):
+    '''
+    The criteria of the row in the order of CRITERIA_GRAPH, the cheapest first
+    as (cost, scope, the (slot,index) of each code as in compile_evidence, check).
+    The criteria of the 'variant' scope do not read the gene, they are checked
+    once for the genes of a line and kept in row.variant_criteria.
+    With short_circuit the evaluation stops once criteria_decided, unless the
+    exclude list or the user's evidence may change the criteria of the row;
+    the codes left unevaluated stay 0 in the output.
+    '''
     PVS1=0
     PS=[0,0,0,0,0]
     PM=[0,0,0,0,0,0,0]
@@ -1906,77 +2944,56 @@ def assign(BP,line,Freqs_flgs,Funcanno_flgs,Allels_flgs):
     BS=[0,0,0,0,0]
     BP=[0,0,0,0,0,0,0,0]
 
+    short=short_circuit
+    if short and is_exclude_snps_exist:
+        need_datasets('assign')
+        try:
+            exclude_snps_dict.lookup(row.chrom,row.start,row.start,row.ref,row.alt,strip_chr=True)
+            short=False
+        except KeyError:
+            pass
+    if short and is_user_evidence_exist:
+        try:
+            user_evidence_dict.lookup(row.chrom,row.start,row.start,row.ref,row.alt,strip_chr=True)
+            short=False
+        except KeyError:
+            pass
 
-    PVS1=check_PVS1(line,Funcanno_flgs,Allels_flgs,lof_genes_dict)
-    
-    PS1=check_PS1(line,Funcanno_flgs,Allels_flgs,aa_changes_dict)
-    PS[0]=PS1
-    PS2=check_PS2(line,Funcanno_flgs,Allels_flgs)
-    PS[1]=PS2
-    PS3=check_PS3(line,Funcanno_flgs,Allels_flgs)
-    PS[2]=PS3
-    PS4=check_PS4(line,Funcanno_flgs,Allels_flgs)
-    PS[3]=PS4
-
-    PM1=check_PM1(line,Funcanno_flgs,Allels_flgs,domain_benign_dict)
-    PM[0]=PM1
-    PM2=check_PM2(line,Freqs_flgs,Allels_flgs,Funcanno_flgs,mim2gene_dict,mim2gene_dict2)
-    PM[1]=PM2
-    PM3=check_PM3(line,Funcanno_flgs,Allels_flgs)
-    PM[2]=PM3
-    PM4=check_PM4(line,Funcanno_flgs,Allels_flgs)
-    PM[3]=PM4
-    PM5=check_PM5(line,Funcanno_flgs,Allels_flgs,aa_changes_dict)
-    PM[4]=PM5
-    PM6=check_PM6(line,Funcanno_flgs,Allels_flgs)
-    PM[5]=PM6
-
-
-    PP1=check_PP1(line,Funcanno_flgs,Allels_flgs)
-    PP[0]=PP1
-    PP2=check_PP2(line,Funcanno_flgs,Allels_flgs,PP2_genes_dict)
-    PP[1]=PP2
-    PP3=check_PP3(line,Funcanno_flgs,Allels_flgs)
-    PP[2]=PP3
-    PP4=check_PP4(line,Funcanno_flgs,Allels_flgs)
-    PP[3]=PP4
-    # PP5=check_PP5(line,Funcanno_flgs,Allels_flgs)
-    PP[4]=0 # Ignore PP5
-
-
-    BA1=check_BA1(line,Freqs_flgs,Allels_flgs)
-    
-    BS1=check_BS1(line,Freqs_flgs,Allels_flgs)
-    BS[0]=BS1
-    BS2=check_BS2(line,Freqs_flgs,Allels_flgs,Funcanno_flgs)
-    BS[1]=BS2
-    BS3=check_BS3(line,Funcanno_flgs,Allels_flgs)
-    BS[2]=BS3
-    BS4=check_BS4(line,Funcanno_flgs,Allels_flgs)
-    BS[3]=BS4
-
-    BP1=check_BP1(line,Funcanno_flgs,Allels_flgs,BP1_genes_dict)
-    BP[0]=BP1
-    BP2=check_BP2(line,Funcanno_flgs,Allels_flgs)
-    BP[1]=BP2
-    BP3=check_BP3(line,Funcanno_flgs,Allels_flgs)
-    BP[2]=BP3
-    BP4=check_BP4(line,Funcanno_flgs,Allels_flgs)
-    BP[3]=BP4
-    BP5=check_BP5(line,Funcanno_flgs,Allels_flgs,morbidmap_dict)
-    BP[4]=BP5
-    # BP6=check_BP6(line,Funcanno_flgs,Allels_flgs)
-    BP[5]=0 # Ignore BP6 
-    BP7=check_BP7(line,Funcanno_flgs,Allels_flgs)
-    BP[6]=BP7
+    criteria=[None,None,PS,PM,PP,BS,BP]
+    pathogenic=False
+    benign=False
+    for (position,(cost,scope,codes,check)) in enumerate(CRITERIA_GRAPH):
+        if short and criteria_decided(PVS1,PS,PM,PP,BA1,BS,BP,pathogenic,benign,position):
+            break
+        if scope=='variant':
+            values=row.variant_criteria.get(position)
+            if values is None:
+                values=check(row)
+                row.variant_criteria[position]=values
+        else:
+            values=check(row)
+        if len(codes)==1:
+            values=(values,)
+        for ((slot,i),value) in zip(codes,values):
+            if slot==0: PVS1=value
+            elif slot==1: BA1=value
+            else: criteria[slot][i]=value
+            if value:
+                if slot in (1,5,6): benign=True
+                else: pathogenic=True
 
-    cls=line.split('\t')
+    return(interpret(row,PVS1,PS,PM,PP,BA1,BS,BP))
+
+def interpret(row,PVS1,PS,PM,PP,BA1,BS,BP):
+    '''
+    Apply the exclude list and the user's evidence to the criteria of the row
+    and classify it, the InterVar column of the output
+    '''
     #begin process the exclude snp list. which will affect BA1 BS1 BS2
     if is_exclude_snps_exist:
-        keys=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['Ref']]+"_"+cls[Allels_flgs['Alt']]
-        keys=re.sub("[Cc][Hh][Rr]","",keys)
+        need_datasets('assign')
         try:
-            if exclude_snps_dict[keys]=="1":  
+            if exclude_snps_dict.lookup(row.chrom,row.start,row.start,row.ref,row.alt,strip_chr=True)=="1":  
                 BA1=0; 
                 BS[0]=0; 
                 BS[1]=0;
@@ -1985,62 +3002,421 @@ def assign(BP,line,Freqs_flgs,Funcanno_flgs,Allels_flgs):
         else:
             pass
     #begin process the user's evidence file
+    grades=(0,0,0,0,0)
     if is_user_evidence_exist:
-        keys=cls[Allels_flgs['Chr']]+"_"+cls[Allels_flgs['Start']]+"_"+cls[Allels_flgs['Ref']]+"_"+cls[Allels_flgs['Alt']]
-        keys=re.sub("[Cc][Hh][Rr]","",keys)
         try:
-            evds=user_evidence_dict[keys] #PS1=1;PM1=1;BA1=1;PVS1 PP BS BP
-            for evd in evds.split(';'):
-                evd_t=evd.split('=')
-                if(len(evd_t)>1 and (not re.findall('grade', evd_t[0], flags=re.IGNORECASE)) ):
-                    if int(evd_t[1])<=1:
-                        #print ("%s %s %s " %(keys,evd_t[1],evd_t[0]))
-                        if(evd_t[0]=="PVS1"): PVS1=evd_t[1]
-                        if(evd_t[0]=="BA1"): BA1=evd_t[1]
-                        if(evd_t[0].find('PS')!=-1): 
-                            t=evd_t[0].find('PS'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            if(t<len(evd_t[0])-2 and tt3<=5 ): PS[tt3-1]=int(evd_t[1])
-                        if(evd_t[0].find('PM')!=-1):
-                            t=evd_t[0].find('PM'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            if(t<len(evd_t[0])-2 and tt3<=7 ): PM[tt3-1]=int(evd_t[1])
-                        if(evd_t[0].find('PP')!=-1): 
-                            t=evd_t[0].find('PP'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            if(t<len(evd_t[0])-2 and tt3<=6 ): PP[tt3-1]=int(evd_t[1])
-                        if(evd_t[0].find('BS')!=-1): 
-                            t=evd_t[0].find('BS'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            if(t<len(evd_t[0])-2 and tt3<=5 ): BS[tt3-1]=int(evd_t[1])
-                        if(evd_t[0].find('BP')!=-1):
-                            t=evd_t[0].find('BP'); 
-                            tt=evd_t[0];
-                            tt3=int(tt[t+2:t+3])
-                            if(t<len(evd_t[0])-2 and tt3<=8 ): BP[tt3-1]=int(evd_t[1])
-
-                    
+            evidence=user_evidence_dict.lookup(row.chrom,row.start,row.start,row.ref,row.alt,strip_chr=True) #PS1=1;PM1=1;BA1=1;PVS1 PP BS BP
+            (overrides,grades)=evidence_actions(evidence)
+            criteria=[None,None,PS,PM,PP,BS,BP]
+            for (slot,i,value) in overrides:
+                if slot==0: PVS1=value
+                elif slot==1: BA1=value
+                else: criteria[slot][i]=value
         except KeyError:
             pass
         else:
             pass
     # end process the user's evidence file 
 
-    cls=line.split('\t')
-    if len(cls)>1:#esp6500siv2_all 1000g2015aug_all gnomAD_genome_ALL    
-        BP_out=classfyv2(PVS1,PS,PM,PP,BA1,BS,BP,Allels_flgs,cls)
-        line_t="%s PVS1=%s PS=%s PM=%s PP=%s BA1=%s BS=%s BP=%s" %(BP_out,PVS1,PS,PM,PP,BA1,BS,BP)
+    BP_out=classfyv2(PVS1,PS,PM,PP,BA1,BS,BP,None,row,grades)
+    line_t="%s PVS1=%s PS=%s PM=%s PP=%s BA1=%s BS=%s BP=%s" %(BP_out,PVS1,PS,PM,PP,BA1,BS,BP)
 
-        #print("%s " % BP_out)
-        BP_out=line_t
-        pass
+    #print("%s " % BP_out)
+    BP_out=line_t
     #BP=BP_out
     return(BP_out)
 
+CHUNK_ROWS=20000
+
+def import_numpy():
+    '''
+    numpy, or None when it is not installed; it is imported by the columnar
+    engine only, the row engine does not pay for loading it
+    '''
+    try:
+        import numpy
+    except ImportError:
+        return(None)
+    return(numpy)
+
+def score_column(cells):
+    '''
+    The float array of the cells and the mask of the cells float() parses, the
+    criteria treat a ValueError apart from a "nan" score
+    '''
+    numpy=import_numpy()
+    values=numpy.empty(len(cells))
+    ok=numpy.ones(len(cells),dtype=bool)
+    parsed={}
+    for (i,cell) in enumerate(cells):
+        value=parsed.get(cell)
+        if value is None:
+            try:
+                value=float(cell)
+            except ValueError:
+                value=False
+            parsed[cell]=value
+        if value is False:
+            values[i]=numpy.nan
+            ok[i]=False
+        else:
+            values[i]=value
+    return(values,ok)
+
+def columnar_criteria(rows):
+    '''
+    The (PVS1,PS,PM,PP,BA1,BS,BP) of each VariantRow of a chunk as assign()
+    sets them, with the score cutoffs, the functional classes, the frequencies
+    and the gene-level evidence evaluated as array operations over the chunk.
+    The variant-level criteria are evaluated once per line and the gene-level
+    evidence once per distinct gene, both indexed by an integer code per row;
+    PS4 and BS2 look up the keys of the chunk at once with get_batch, the
+    other criteria reading the variant datasets call their check_* on the rows
+    they can apply to. Needs numpy, see write_columnar.
+    '''
+    numpy=import_numpy()
+    n=len(rows)
+    # the rows of the genes of a line follow each other and share their variant
+    variants=[]
+    vcodes=[]
+    for row in rows:
+        if not variants or variants[-1] is not row.variant:
+            variants.append(row.variant)
+        vcodes.append(len(variants)-1)
+    vcodes=numpy.array(vcodes,dtype=numpy.int64)
+    def column(name,dtype=object):
+        return(numpy.array([getattr(row,name) for row in variants],dtype=dtype))
+    func=column('func_class',numpy.int64)
+    missense=(func&FUNC_MISSENSE)!=0
+    synon=((func&FUNC_SYNON)!=0)&((func&FUNC_NONSYNON)==0)
+    (metasvm,metasvm_ok)=score_column(column('metasvm'))
+    (gerp,gerp_ok)=score_column(column('gerp'))
+    (rf,rf_ok)=score_column(column('dbscsnv_rf'))
+    (ada,ada_ok)=score_column(column('dbscsnv_ada'))
+    rmsk_absent=column('rmsk')=='.'
+    interpro_absent=column('interpro')=='.'
+    splicing=(rf>0.6)|(rf_ok&(ada>0.6)) #either score(ada and rf) >0.6 as splicealtering
+
+    # the variant-level criteria, once per line
+    (BA1,BS1,rare)=(numpy.array(flags,dtype=bool) for flags in zip(*frequency_kernel().evaluate_batch([row.freq_values for row in variants])))
+    absent=column('freqs_absent',bool)
+    PS1=numpy.zeros(len(variants),dtype=bool)
+    PM5=numpy.zeros(len(variants),dtype=bool)
+    need_datasets('check_PS1_PM5')
+    for i in numpy.flatnonzero(missense).tolist():
+        (PS1[i],PM5[i])=check_PS1_PM5(variants[i],aa_sites_dict)
+    need_datasets('check_PS4')
+    PS4=numpy.array(PS4_snps_dict.get_batch([(row.chrom,row.start,row.end,row.ref,row.alt) for row in variants]),dtype=object)=="1"
+    PM4=((func&(FUNC_INFRAME_INDEL|FUNC_STOPLOSS))!=0)&(rmsk_absent|((func&FUNC_STOPLOSS)!=0))
+    PP3_t1=numpy.where(metasvm_ok,metasvm>0.0,((func&FUNC_SYNON)==0)|((func&FUNC_CODING_SYNON)==0))
+    PP3=(PP3_t1.astype(int)+(gerp>2)+splicing)>=2
+    BP3=((func&(FUNC_INFRAME_INDEL|FUNC_NONFRAME_SUB))!=0)&~rmsk_absent&interpro_absent
+    BP4_t1=numpy.where(metasvm_ok,metasvm<0,synon)
+    BP4_t2=~gerp_ok|(gerp<=2)
+    BP4_t3=~rf_ok|((rf<=0.6)&(~ada_ok|(ada<=0.6)))
+    BP4=BP4_t1&BP4_t2&BP4_t3
+    rf_dot=column('dbscsnv_rf')=='.'
+    ada_dot=column('dbscsnv_ada')=='.'
+    BP7_t1=synon&(rf_dot|ada_dot|((rf<0.6)&(ada<0.6)))
+    BP7=BP7_t1&(~gerp_ok|(gerp<=2))
+    # the scores check_BP7 fails to parse raise there, so do they here
+    for i in numpy.flatnonzero(synon&~rf_dot&~ada_dot&~(rf_ok&(~(rf<0.6)|ada_ok))).tolist():
+        BP7[i]=check_BP7(variants[i])
+    (func,missense,splicing,interpro_absent,rare,absent,BA1,BS1,PS1,PM5,PS4,PM4,PP3,BP3,BP4,BP7)=(flags[vcodes] for flags in
+        (func,missense,splicing,interpro_absent,rare,absent,BA1,BS1,PS1,PM5,PS4,PM4,PP3,BP3,BP4,BP7))
+
+    # the gene-level criteria, once per gene of a line
+    gene_codes={}
+    codes=numpy.array([gene_codes.setdefault((row.gene,row.ens_gene),len(gene_codes)) for row in rows],dtype=numpy.int64)
+    genes=[gene_record(gene,ens_gene) for (gene,ens_gene) in gene_codes]
+    def gene_flags(flag):
+        return(numpy.array([flag(gene) for gene in genes],dtype=bool)[codes])
+    lof=gene_flags(lambda gene: gene.lof=='1')
+    pp2=gene_flags(lambda gene: gene.pp2=='1')
+    bp1=gene_flags(lambda gene: gene.bp1=='1')
+    pm2_recessive=gene_flags(lambda gene: int(gene.pm2_mim)>0 and gene.pm2_recessive=="1")
+    bs2=gene_flags(lambda gene: gene.bs2_mim is not None and gene.bs2_adultonset is None and (gene.bs2_recessive=="1" or gene.bs2_domin=="1"))
+
+    PM2=absent|(pm2_recessive&rare)
+    # PVS1 is checked on the transcripts only where the class and the gene allow it
+    PVS1=numpy.zeros(n,dtype=bool)
+    need_datasets('check_PVS1')
+    need_datasets('check_PM1')
+    candidates=((func&FUNC_LOF)!=0)&((func&FUNC_NONFRAME)==0)&lof&~(((func&FUNC_SPLIC)!=0)&~splicing)
+    for i in numpy.flatnonzero(candidates).tolist():
+        PVS1[i]=check_PVS1(rows[i],lof_genes_dict)
+    PM1=numpy.zeros(n,dtype=bool)
+    for i in numpy.flatnonzero(missense&~interpro_absent).tolist():
+        PM1[i]=check_PM1(rows[i],domain_benign_dict)
+    PP2=missense&pp2
+    BS2=numpy.zeros(n,dtype=bool)
+    need_datasets('check_BS2')
+    candidates=numpy.flatnonzero(bs2).tolist()
+    keys=[(rows[i].chrom,rows[i].start,rows[i].end)+bs2_alleles(rows[i].ref,rows[i].alt) for i in candidates]
+    for (i,genotypes) in zip(candidates,BS2_snps_dict.get_batch(keys,(None,None))):
+        BS2[i]=check_BS2(rows[i],genotypes)
+    BP1=missense&bp1
+
+    criteria=[]
+    for (pvs1,ps1,ps4,pm1,pm2,pm4,pm5,pp2,pp3,ba1,bs1,bs2,bp1,bp3,bp4,bp7) in zip(PVS1.tolist(),PS1.tolist(),PS4.tolist(),PM1.tolist(),
+            PM2.tolist(),PM4.tolist(),PM5.tolist(),PP2.tolist(),PP3.tolist(),BA1.tolist(),BS1.tolist(),BS2.tolist(),BP1.tolist(),
+            BP3.tolist(),BP4.tolist(),BP7.tolist()):
+        criteria.append((int(pvs1),[int(ps1),0,0,int(ps4),0],[int(pm1),int(pm2),0,int(pm4),int(pm5),0,0],[0,int(pp2),int(pp3),0,0,0],
+            int(ba1),[int(bs1),int(bs2),0,0,0],[int(bp1),0,int(bp3),int(bp4),0,0,int(bp7),0]))
+    return(criteria)
+
+
+FUNC_LOF=1
+FUNC_NONFRAME=2
+FUNC_SPLIC=4
+FUNC_MISSENSE=8
+FUNC_SYNON=16
+FUNC_CODING_SYNON=32
+FUNC_NONSYNON=64
+FUNC_INFRAME_INDEL=128
+FUNC_NONFRAME_SUB=256
+FUNC_STOPLOSS=512
+FUNC_CLASSES=[(FUNC_LOF,("nonsense","frameshift","splic","stopgain")),(FUNC_NONFRAME,("nonframe",)),(FUNC_SPLIC,("splic",)),
+    (FUNC_MISSENSE,("missense","nonsynony")),(FUNC_SYNON,("synon",)),(FUNC_CODING_SYNON,("coding-synon",)),(FUNC_NONSYNON,("nonsynon",)),
+    (FUNC_INFRAME_INDEL,("nonframeshift insertion","nonframeshift deletion")),(FUNC_NONFRAME_SUB,("nonframeshift substitution",)),
+    (FUNC_STOPLOSS,("stoploss",))]
+func_classes={}
+
+def func_class(funcs):
+    '''
+    The FUNC_* bits of the substrings of "Func.refGene ExonicFunc.refGene" the
+    criteria search, memoized as the distinct values are few
+    '''
+    mask=func_classes.get(funcs)
+    if mask is None:
+        mask=0
+        for (bit,names) in FUNC_CLASSES:
+            for name in names:
+                if funcs.find(name)>=0:
+                    mask|=bit
+                    break
+        func_classes[funcs]=mask
+    return(mask)
+
+FREQ_COLUMNS=['1000g2015aug_all','esp6500siv2_all','gnomAD_genome_ALL','gnomAD_genome_AFR','gnomAD_genome_AMR',
+    'gnomAD_genome_EAS','gnomAD_genome_FIN','gnomAD_genome_NFE','gnomAD_genome_OTH','gnomAD_genome_ASJ']
+BA1_COLUMNS=['1000g2015aug_all','esp6500siv2_all','gnomAD_genome_ALL']
+freq_kernel=None
+
+def freq_value(freq):
+    '''
+    The frequency of a cell of the annovar output, NaN when it is absent (".") or not a number
+    '''
+    try:
+        return(float(freq))
+    except ValueError:
+        return(float('nan'))
+
+class FrequencyKernel(object):
+    '''
+    BA1, BS1 and the recessive test of PM2 from the frequencies of a row in the
+    order of FREQ_COLUMNS, NaN for the absent ones, compared once against a
+    cutoff per population: BA1 is any of BA1_COLUMNS >0.05, BS1 any >= the
+    disorder cutoff of the population and rare (PM2 of a recessive gene) none
+    >=0.005. evaluate_batch does the same for a chunk of rows, with numpy when
+    it is installed.
+    '''
+    def __init__(self,bs1_cutoffs,ba1_cutoff=0.05,rare_cutoff=0.005):
+        self.ba1_cutoffs=[ba1_cutoff if key in BA1_COLUMNS else float('inf') for key in FREQ_COLUMNS]
+        self.bs1_cutoffs=list(bs1_cutoffs)
+        self.rare_cutoffs=[rare_cutoff]*len(FREQ_COLUMNS)
+        self.cutoffs=list(zip(self.ba1_cutoffs,self.bs1_cutoffs,self.rare_cutoffs))
+
+    def evaluate(self,values):
+        BA1=0
+        BS1=0
+        rare=1
+        for (value,(ba1,bs1,rare_cutoff)) in zip(values,self.cutoffs):
+            if value>ba1: BA1=1
+            if value>=bs1: BS1=1
+            if value>=rare_cutoff: rare=0
+        return((BA1,BS1,rare))
+
+    def evaluate_batch(self,rows):
+        numpy=import_numpy()
+        if numpy is None:
+            return([self.evaluate(values) for values in rows])
+        values=numpy.array(rows,dtype=float).reshape(len(rows),len(FREQ_COLUMNS))
+        BA1=(values>numpy.array(self.ba1_cutoffs)).any(axis=1)
+        BS1=(values>=numpy.array(self.bs1_cutoffs)).any(axis=1)
+        rare=~(values>=numpy.array(self.rare_cutoffs)).any(axis=1)
+        return(list(zip(BA1.astype(int).tolist(),BS1.astype(int).tolist(),rare.astype(int).tolist())))
+
+def frequency_kernel():
+    '''
+    The FrequencyKernel of the config: disorder_cutoff for BS1, overridden per
+    population by disorder_cutoff_pops as "gnomAD_genome_AFR:0.02,esp6500siv2_all:0.01"
+    '''
+    global freq_kernel
+    if freq_kernel is None:
+        cutoff=0.005 # disorder cutoff
+        try:
+            cutoff=float(paras['disorder_cutoff']) # user's disorder cutoff
+        except ValueError:
+            cutoff=0.005
+        cutoffs=dict((key,cutoff) for key in FREQ_COLUMNS)
+        for item in re.split("[,;]",paras.get('disorder_cutoff_pops') or ''):
+            if item.strip()=='': continue
+            pop_cutoff=item.split(':')
+            try:
+                if pop_cutoff[0].strip() not in cutoffs: raise ValueError
+                cutoffs[pop_cutoff[0].strip()]=float(pop_cutoff[1])
+            except (ValueError,IndexError):
+                print("Warning: Skip the disorder cutoff %s in config.ini, the format is population:cutoff of %s" % (item,",".join(FREQ_COLUMNS)))
+        freq_kernel=FrequencyKernel([cutoffs[key] for key in FREQ_COLUMNS])
+    return(freq_kernel)
+
+def frequency_criteria(row):
+    '''
+    (BA1,BS1,rare) of the row, evaluated by the kernel on the first use
+    '''
+    if row.freq_criteria is None:
+        row.freq_criteria=frequency_kernel().evaluate(row.freq_values)
+    return(row.freq_criteria)
+
+ROW_COLUMNS=['Chr','Start','End','Ref','Alt','Func.refGene','ExonicFunc.refGene','AAChange.refGene','Gene','Gene.ensGene',
+    'AAChange.ensGene','AAChange.knownGene','CLINSIG','avsnp147','dbscSNV_RF_SCORE','dbscSNV_ADA_SCORE','GERP++_RS',
+    'Interpro_domain','rmsk','SIFT_score','MetaSVM_score','CADD_raw','CADD_phred','Otherinfo']
+
+class VariantRow(object):
+    '''
+    The columns of a line of the annovar output read by the criteria and the
+    output, in the order of ROW_COLUMNS, followed by the frequencies in the
+    order of FREQ_COLUMNS. The line is split once instead of once per criterion;
+    func_class holds the FUNC_* bits of Func.refGene and ExonicFunc.refGene,
+    freq_values the frequencies parsed by freq_value and freqs_absent whether
+    all of them are ".". The rows of the genes of a line made by for_gene share
+    the variant, the row of the whole line, and its variant_criteria. cells
+    holds the values as given; raw is None, or the cells as bytes when read by
+    mmap_row_parser, then the columns of PASSTHROUGH_COLUMNS are left as bytes.
+    '''
+    __slots__=('chrom','start','end','ref','alt','func','exonic_func','aachange','gene','ens_gene',
+        'aachange_ens','aachange_known','clinsig','avsnp','dbscsnv_rf','dbscsnv_ada','gerp',
+        'interpro','rmsk','sift','metasvm','cadd_raw','cadd_phred','otherinfo','freqs','func_class',
+        'freq_values','freqs_absent','freq_criteria','variant','variant_criteria','cells','raw')
+
+    def __init__(self,values):
+        (self.chrom,self.start,self.end,self.ref,self.alt,self.func,self.exonic_func,self.aachange,self.gene,self.ens_gene,
+            self.aachange_ens,self.aachange_known,self.clinsig,self.avsnp,self.dbscsnv_rf,self.dbscsnv_ada,self.gerp,
+            self.interpro,self.rmsk,self.sift,self.metasvm,self.cadd_raw,self.cadd_phred,self.otherinfo)=values[:len(ROW_COLUMNS)]
+        self.freqs=values[len(ROW_COLUMNS):]
+        self.func_class=func_class(self.func+" "+self.exonic_func)
+        self.freq_values=[freq_value(freq) for freq in self.freqs]
+        self.freqs_absent=self.freqs.count('.')==len(self.freqs)
+        self.freq_criteria=None
+        self.variant=self
+        self.variant_criteria={}
+        self.cells=values
+        self.raw=None
+
+    def for_gene(self,gene):
+        '''
+        The row of one of the genes of the line
+        '''
+        row=VariantRow.__new__(VariantRow)
+        for name in VariantRow.__slots__:
+            setattr(row,name,getattr(self,name))
+        row.gene=gene
+        return(row)
+
+    def genes(self):
+        '''
+        The rows of the genes of the line, split on "," and ";"
+        '''
+        genes=re.split("[,;]",self.gene)
+        if len(genes)==1:
+            return([self])
+        return([self.for_gene(gene) for gene in genes])
+
+def row_parser(Freqs_flgs,Funcanno_flgs,Allels_flgs):
+    '''
+    The function parsing a line of the annovar output into a VariantRow, from
+    the column indices found in the header by search_key_index
+    '''
+    indices=[]
+    for key in ROW_COLUMNS:
+        indices.append(Allels_flgs.get(key,Funcanno_flgs.get(key,0)))
+    for key in FREQ_COLUMNS:
+        indices.append(Freqs_flgs.get(key,0))
+    projection=operator.itemgetter(*indices)
+    def parse(line):
+        return(VariantRow(projection(line.split('\t'))))
+    return(parse)
+
+PASSTHROUGH_COLUMNS=['AAChange.ensGene','avsnp147','SIFT_score','CADD_raw','CADD_phred','Otherinfo']
+text_encoding=locale.getpreferredencoding(False)
+
+MMAP_RELEASE_BYTES=16<<20
+
+def mmap_lines(fh):
+    '''
+    The lines of a file opened in binary mode as bytes, read through mmap and
+    without the line end. The pages read are released every MMAP_RELEASE_BYTES
+    where madvise is available, so the mapping of a large file does not stay
+    resident behind the reader.
+    '''
+    try:
+        data=mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)
+    except ValueError: # empty file
+        return
+    release=hasattr(data,'madvise') and hasattr(mmap,'MADV_DONTNEED')
+    if release and hasattr(mmap,'MADV_SEQUENTIAL'):
+        data.madvise(mmap.MADV_SEQUENTIAL)
+    released=0
+    try:
+        for line in iter(data.readline,b''):
+            if line.endswith(b'\n'):
+                line=line[:-1]
+            if line.endswith(b'\r'):
+                line=line[:-1]
+            yield(line)
+            if release and data.tell()-released>=MMAP_RELEASE_BYTES:
+                end=data.tell()-data.tell()%mmap.PAGESIZE
+                data.madvise(mmap.MADV_DONTNEED,released,end-released)
+                released=end
+    finally:
+        data.close()
+
+def mmap_row_parser(Freqs_flgs,Funcanno_flgs,Allels_flgs,otherinf_pos):
+    '''
+    Like row_parser, for the bytes lines of mmap_lines: the Gene column is
+    added to the cells as gene_lines does, before otherinf_pos or at the end
+    when it is None. Only the cells the criteria read are decoded, the cells
+    of PASSTHROUGH_COLUMNS are kept as bytes and row.raw holds all of them for
+    IntervarWriter.
+    '''
+    indices=[]
+    for key in ROW_COLUMNS:
+        indices.append(Allels_flgs.get(key,Funcanno_flgs.get(key,0)))
+    for key in FREQ_COLUMNS:
+        indices.append(Freqs_flgs.get(key,0))
+    projection=operator.itemgetter(*indices)
+    keys=ROW_COLUMNS+FREQ_COLUMNS
+    decoded=[i for (i,key) in enumerate(keys) if key not in PASSTHROUGH_COLUMNS]
+    decoded_cells=operator.itemgetter(*decoded)
+    # the decoded cells followed by the raw ones, back in the order of keys
+    order=operator.itemgetter(*[decoded.index(i) if i in decoded else len(decoded)+i for i in range(len(keys))])
+    def parse(line):
+        cls=line.split(b'\t')
+        if otherinf_pos is None:
+            cls.append(cls[6])
+        else:
+            cls.insert(otherinf_pos,cls[6])
+        cls.append(b'')
+        if cls[0][:3].lower()==b'chr':
+            cls[0]=cls[0][3:]
+        raw=projection(cls)
+        values=b'\t'.join(decoded_cells(raw)).decode(text_encoding).split('\t')
+        values.extend(raw)
+        row=VariantRow(order(values))
+        row.raw=raw
+        return(row)
+    return(parse)
 
 def search_key_index(line,dict):
     cls=line.split('\t')
@@ -2056,83 +3432,271 @@ def search_key_index(line,dict):
                     break
     return
 
+# the columns of the .intervar output: the name, the template of the cell and
+# the sources filling it, columns of the annovar output or INTERVAR_VALUES
+INTERVAR_COLUMNS=[('Chr','%s',('Chr',)),('Start','%s',('Start',)),('End','%s',('End',)),('Ref','%s',('Ref',)),('Alt','%s',('Alt',)),
+    ('Ref.Gene','%s',('gene',)),('Func.refGene','%s',('Func.refGene',)),('ExonicFunc.refGene','%s',('ExonicFunc.refGene',)),
+    ('Gene.ensGene','%s',('Gene.ensGene',)),('avsnp147','%s',('avsnp147',)),('AAChange.ensGene','%s',('AAChange.ensGene',)),
+    ('AAChange.refGene','%s',('AAChange.refGene',)),('Clinvar','clinvar: %s ',('clinvar',)),('InterVar and Evidence',' InterVar: %s ',('intervar',)),
+    ('Freq_gnomAD_genome_ALL','%s',('gnomAD_genome_ALL',)),('Freq_esp6500siv2_all','%s',('esp6500siv2_all',)),
+    ('Freq_1000g2015aug_all','%s',('1000g2015aug_all',)),('CADD_raw','%s',('CADD_raw',)),('CADD_phred','%s',('CADD_phred',)),
+    ('SIFT_score','%s',('SIFT_score',)),('GERP++_RS','%s',('GERP++_RS',)),('phyloP46way_placental','.',()),
+    ('dbscSNV_ADA_SCORE','%s',('dbscSNV_ADA_SCORE',)),('dbscSNV_RF_SCORE','%s',('dbscSNV_RF_SCORE',)),('Interpro_domain','%s',('Interpro_domain',)),
+    ('AAChange.knownGene','%s',('AAChange.knownGene',)),('rmsk','%s',('rmsk',)),('MetaSVM_score','%s',('MetaSVM_score',)),
+    ('Freq_gnomAD_genome_POPs','AFR:%s,AMR:%s,EAS:%s,FIN:%s,NFE:%s,OTH:%s,ASJ:%s',tuple(FREQ_COLUMNS[3:])),
+    ('OMIM','%s',('omim',)),('Phenotype_MIM','%s',('pheno_mim',)),('OrphaNumber','%s',('orpha',)),('Orpha','%s',('orpha_details',)),
+    ('Otherinfo','%s',('otherinfo',))]
+INTERVAR_VALUES=['gene','clinvar','intervar','omim','pheno_mim','orpha','orpha_details','otherinfo']
+
+class IntervarWriter(object):
+    '''
+    Write the header and the rows to the .intervar output, as text or as bytes
+    for the rows read by mmap_row_parser. The template of the line and the
+    projection of its values, the cells of the row followed by INTERVAR_VALUES,
+    are compiled once from INTERVAR_COLUMNS, without the Otherinfo column
+    unless otherinfo. The lines are written in blocks of CHUNK_ROWS.
+    '''
+    def __init__(self,fw,pheno_annotation,otherinfo,encoded):
+        columns=INTERVAR_COLUMNS
+        if not otherinfo:
+            columns=INTERVAR_COLUMNS[:-1]
+        keys=ROW_COLUMNS+FREQ_COLUMNS+INTERVAR_VALUES
+        self.projection=operator.itemgetter(*[keys.index(source) for (name,template,sources) in columns for source in sources])
+        self.template='\t'.join(template for (name,template,sources) in columns)+'\n'
+        header='#'+'\t'.join(template % name if len(sources)==1 else name for (name,template,sources) in columns)+'\n'
+        self.empty=''
+        if encoded:
+            self.template=self.template.encode()
+            header=header.encode(text_encoding)
+            self.empty=b''
+        (self.gene_cell,self.clinsig_cell,self.otherinfo_cell)=[ROW_COLUMNS.index(key) for key in ('Gene','CLINSIG','Otherinfo')]
+        self.fw=fw
+        self.pheno_annotation=pheno_annotation
+        self.lines=[header]
+
+    def write(self,row,intervar_bp):
+        if row.raw is None:
+            clinvar_bp="UNK"
+            if row.clinsig != '.':
+                clinvar_bp=row.clinsig.split(';')[0]
+            OMIM=gene_record(row.gene,row.ens_gene).omim
+            annotation=(".","","")
+            if self.pheno_annotation:
+                annotation=omim_annotation(OMIM)
+            values=row.cells+(row.gene,clinvar_bp,intervar_bp,OMIM)+annotation+(row.otherinfo.replace('\t',';'),)
+        else:
+            raw=row.raw
+            gene=raw[self.gene_cell]
+            if row.gene is not row.variant.gene:
+                gene=row.gene.encode(text_encoding)
+            clinvar_bp=b"UNK"
+            if raw[self.clinsig_cell] != b'.':
+                clinvar_bp=raw[self.clinsig_cell].split(b';')[0]
+            values=raw+(gene,clinvar_bp,intervar_bp.encode(text_encoding))+self.annotation(row)+(raw[self.otherinfo_cell].replace(b'\t',b';'),)
+        self.lines.append(self.template % self.projection(values))
+        if len(self.lines)>=CHUNK_ROWS:
+            self.flush()
+        return
+
+    def annotation(self,row):
+        '''
+        The OMIM, Phenotype_MIM, OrphaNumber and Orpha columns of the row as
+        bytes, encoded once per MIM number in encoded_annotations
+        '''
+        OMIM=gene_record(row.gene,row.ens_gene).omim
+        try:
+            return(encoded_annotations[OMIM])
+        except KeyError:
+            pass
+        annotation=(OMIM,".","","")
+        if self.pheno_annotation:
+            annotation=(OMIM,)+omim_annotation(OMIM)
+        if len(encoded_annotations)>=OMIM_ANNOTATIONS_MAX:
+            encoded_annotations.clear()
+        encoded_annotations[OMIM]=tuple(value.encode(text_encoding) for value in annotation)
+        return(encoded_annotations[OMIM])
+
+    def flush(self):
+        if self.lines:
+            self.fw.write(self.empty.join(self.lines))
+            self.lines=[]
+        return
+
+def write_columnar(writer,rows):
+    '''
+    Interpret a chunk of rows with columnar_criteria and write them with the
+    IntervarWriter, row by row with assign when numpy is not installed
+    '''
+    if import_numpy() is None:
+        for row in rows:
+            writer.write(row,assign("UNK",row))
+        return
+    for (row,criteria) in zip(rows,columnar_criteria(rows)):
+        writer.write(row,interpret(row,*criteria))
+    return
+
+IO_BLOCKS=2 # the blocks of CHUNK_ROWS lines read ahead of the interpretation and left to write behind it
+
+def prefetch_lines(lines):
+    '''
+    The lines of the iterator read ahead by a thread in blocks of CHUNK_ROWS,
+    at most IO_BLOCKS blocks ahead; an error of the reading is raised here
+    '''
+    blocks=queue.Queue(IO_BLOCKS)
+    def read():
+        try:
+            block=[]
+            for line in lines:
+                block.append(line)
+                if len(block)>=CHUNK_ROWS:
+                    blocks.put(block)
+                    block=[]
+            blocks.put(block)
+            blocks.put(None)
+        except Exception as e:
+            blocks.put(e)
+    thread=threading.Thread(target=read)
+    thread.daemon=True
+    thread.start()
+    while True:
+        block=blocks.get()
+        if block is None:
+            break
+        if isinstance(block,Exception):
+            raise block
+        for line in block:
+            yield(line)
+    thread.join()
+
+class BlockWriter(object):
+    '''
+    Wrap the output file: the blocks written by IntervarWriter are written
+    by a thread at most IO_BLOCKS blocks behind; an error of the writing is
+    raised by the next write or by close
+    '''
+    def __init__(self,fw):
+        self.fw=fw
+        self.blocks=queue.Queue(IO_BLOCKS)
+        self.error=None
+        self.thread=threading.Thread(target=self.drain)
+        self.thread.daemon=True
+        self.thread.start()
+
+    def drain(self):
+        while True:
+            block=self.blocks.get()
+            if block is None:
+                return
+            if self.error is None:
+                try:
+                    self.fw.write(block)
+                except Exception as e:
+                    self.error=e
+
+    def write(self,data):
+        if self.error is not None:
+            raise self.error
+        self.blocks.put(data)
+
+    def close(self):
+        self.blocks.put(None)
+        self.thread.join()
+        self.fw.close()
+        if self.error is not None:
+            raise self.error
+
 def my_inter_var(annovar_outfile):
-    newoutfile=annovar_outfile+".grl_p"
+    '''
+    Interpret the lines of gene_lines of the annovar output and write the
+    .intervar output, return the number of lines and of the rows of their
+    genes, both with the header
+    '''
+    global short_circuit
     newoutfile2=annovar_outfile+".intervar"
 
-    Freqs_flgs={'1000g2015aug_all':0,'esp6500siv2_all':0,'gnomAD_genome_ALL':0,'gnomAD_genome_AFR':0,'gnomAD_genome_AMR':0,'gnomAD_genome_EAS':0,'gnomAD_genome_FIN':0,'gnomAD_genome_NFE':0,'gnomAD_genome_OTH':0,'gnomAD_genome_ASJ':0}
+    Freqs_flgs=dict((key,0) for key in FREQ_COLUMNS)
     Funcanno_flgs={'Func.refGene':0,'ExonicFunc.refGene':0,'AAChange.refGene':0,'Gene':0,'Gene damage prediction (all disease-causing genes)':0,'CLNDBN':0,'CLNACC':0,'CLNDSDB':0,'dbscSNV_ADA_SCORE':0,'dbscSNV_RF_SCORE':0,'GERP++_RS':0,'LoFtool_percentile':0,'Interpro_domain':0,'rmsk':0,'SIFT_score':0,'phyloP46way_placental':0,'Gene.ensGene':0,'CLINSIG':0,'CADD_raw':0,'CADD_phred':0,'avsnp147':0,'AAChange.ensGene':0,'AAChange.knownGene':0,'MetaSVM_score':0,'Otherinfo':0}
     Allels_flgs={'Chr':0,'Start':0,'End':0,'Ref':0,'Alt':0}
 # gnomAD_genome_ALL esp6500siv2_all   1000g2015aug_all  SIFT_score    CADD_raw    CADD_phred  GERP++_RS   phyloP46way_placental  dbscSNV_ADA_SCORE   dbscSNV_RF_SCORE   Interpro_domain
 
+    reader_mmap=re.findall('mmap',paras.get('reader','text'), flags=re.IGNORECASE)
     try:
-        fh=open(newoutfile, "r")
-        fw=open(newoutfile2, "w")
-        strs=fh.read()
+        if reader_mmap:
+            fh=open(annovar_outfile, "rb")
+            fw=open(newoutfile2, "wb")
+            lines=mmap_lines(fh)
+        else:
+            fh=open(annovar_outfile, "r")
+            fw=open(newoutfile2, "w")
+            lines=gene_lines(fh)
+        if re.findall('true',paras.get('threaded_io','FALSE'), flags=re.IGNORECASE):
+            lines=prefetch_lines(lines)
+            fw=BlockWriter(fw)
+        sum=0
         line_sum=0;
         print("Notice: Begin the variants interpretation by InterVar ")
-        if re.findall('true',paras['otherinfo'], flags=re.IGNORECASE)  :
-            fw.write("#%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\tclinvar: %s \t InterVar: %s \t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % ("Chr","Start","End","Ref","Alt","Ref.Gene","Func.refGene","ExonicFunc.refGene", "Gene.ensGene","avsnp147","AAChange.ensGene","AAChange.refGene","Clinvar","InterVar and Evidence","Freq_gnomAD_genome_ALL", "Freq_esp6500siv2_all","Freq_1000g2015aug_all", "CADD_raw","CADD_phred","SIFT_score","GERP++_RS","phyloP46way_placental","dbscSNV_ADA_SCORE", "dbscSNV_RF_SCORE", "Interpro_domain","AAChange.knownGene","rmsk","MetaSVM_score","Freq_gnomAD_genome_POPs","OMIM","Phenotype_MIM","OrphaNumber","Orpha","Otherinfo"  ))
-        else:
-            fw.write("#%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\tclinvar: %s \t InterVar: %s \t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % ("Chr","Start","End","Ref","Alt","Ref.Gene","Func.refGene","ExonicFunc.refGene", "Gene.ensGene","avsnp147","AAChange.ensGene","AAChange.refGene","Clinvar","InterVar and Evidence","Freq_gnomAD_genome_ALL", "Freq_esp6500siv2_all","Freq_1000g2015aug_all", "CADD_raw","CADD_phred","SIFT_score","GERP++_RS","phyloP46way_placental","dbscSNV_ADA_SCORE", "dbscSNV_RF_SCORE", "Interpro_domain","AAChange.knownGene","rmsk","MetaSVM_score","Freq_gnomAD_genome_POPs","OMIM","Phenotype_MIM","OrphaNumber","Orpha"  ))
-
-        for line in strs.split('\n'):
+        need_datasets('OMIM')
+        pheno_annotation=re.findall('true',paras.get('pheno_annotation','TRUE'), flags=re.IGNORECASE)
+        if pheno_annotation:
+            need_datasets('Phenotype_MIM')
+            need_datasets('OrphaNumber')
+            need_datasets('Orpha')
+        otherinfo=re.findall('true',paras['otherinfo'], flags=re.IGNORECASE)
+        columnar=re.findall('columnar',paras.get('engine','row'), flags=re.IGNORECASE)
+        if columnar and import_numpy() is None:
+            print("Warning: numpy is not installed, the variants are interpreted row by row instead of by the columnar engine")
+            columnar=[]
+        short_circuit=bool(re.findall('true',paras.get('short_circuit','FALSE'),flags=re.IGNORECASE))
+        writer=IntervarWriter(fw,pheno_annotation,otherinfo,reader_mmap)
+        chunk=[]
+
+        for line in lines:
             BP="UNK" # the inter of pathogenetic/benign
-            clinvar_bp="UNK"
-            cls=line.split('\t')
-            if len(cls)<2: break
+            if line_sum==0 and reader_mmap:
+                # the header goes through gene_lines, the other lines through mmap_row_parser
+                if line.find(b'\t')<0: continue
+                cls=line.decode(text_encoding).split('\t')
+                otherinf_pos=None
+                if otherinfo:
+                    otherinf_pos=otherinfo_position(cls)
+                line=next(gene_lines(['\t'.join(cls)]))
+            elif reader_mmap and line.find(b'\t')<0:
+                continue
+            sum=sum+1
             if line_sum==0:
                 search_key_index(line,Freqs_flgs)
                 search_key_index(line,Funcanno_flgs)
                 search_key_index(line,Allels_flgs)
-
-            else:
-                #begin check the BP status from clinvar
-                line_tmp2=cls[Funcanno_flgs['CLINSIG']]
-                if line_tmp2 != '.':
-                    cls3=line_tmp2.split(';')
-                    clinvar_bp=cls3[0]
-                    
-                intervar_bp=assign(BP,line,Freqs_flgs,Funcanno_flgs,Allels_flgs)
-                Freq_gnomAD_genome_POPs="AFR:"+cls[Freqs_flgs['gnomAD_genome_AFR']]+",AMR:"+cls[Freqs_flgs['gnomAD_genome_AMR']]+",EAS:"+cls[Freqs_flgs['gnomAD_genome_EAS']]+",FIN:"+cls[Freqs_flgs['gnomAD_genome_FIN']]+",NFE:"+cls[Freqs_flgs['gnomAD_genome_NFE']]+",OTH:"+cls[Freqs_flgs['gnomAD_genome_OTH']]+",ASJ:"+cls[Freqs_flgs['gnomAD_genome_ASJ']]
-                OMIM="." 
-                mim2=mim2gene_dict2.get(cls[Funcanno_flgs['Gene']],".")
-                mim1=mim2gene_dict.get(cls[Funcanno_flgs['Gene.ensGene']],".")
-                if(mim1 !="."):
-                   OMIM=mim1
-                if(mim2 !="."):
-                   OMIM=mim2
-                Pheno_MIM=mim_pheno_dict.get(OMIM,".")
-                orpha="";
-                orpha_details="";
-                # .;442835;;306;;.;
-                for ort2 in Pheno_MIM.split(';'):
-                    ort3=mim_orpha_dict.get(ort2,".")
-                    if(ort3 !="."):
-                        orpha=ort3+orpha
-                for ort4 in orpha.split(';'):
-                    if len(ort4)>0:
-                         orpha_details=orpha_details+orpha_dict.get(ort4,".")+"~"
-                        
-
-                if re.findall('true',paras['otherinfo'], flags=re.IGNORECASE)  :
-                    cls[Funcanno_flgs['Otherinfo']]=cls[Funcanno_flgs['Otherinfo']].replace('\t', ';')
-                    fw.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\tclinvar: %s \t InterVar: %s \t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (cls[Allels_flgs['Chr']],cls[Allels_flgs['Start']],cls[Allels_flgs['End']],cls[Allels_flgs['Ref']],cls[Allels_flgs['Alt']],cls[Funcanno_flgs['Gene']],cls[Funcanno_flgs['Func.refGene']],cls[Funcanno_flgs['ExonicFunc.refGene']], cls[Funcanno_flgs['Gene.ensGene']],cls[Funcanno_flgs['avsnp147']],cls[Funcanno_flgs['AAChange.ensGene']],cls[Funcanno_flgs['AAChange.refGene']],clinvar_bp,intervar_bp,cls[Freqs_flgs['gnomAD_genome_ALL']], cls[Freqs_flgs['esp6500siv2_all']], cls[Freqs_flgs['1000g2015aug_all']], cls[Funcanno_flgs['CADD_raw']],cls[Funcanno_flgs['CADD_phred']],cls[Funcanno_flgs['SIFT_score']],  cls[Funcanno_flgs['GERP++_RS']],".", cls[Funcanno_flgs['dbscSNV_ADA_SCORE']], cls[Funcanno_flgs['dbscSNV_RF_SCORE']], cls[Funcanno_flgs['Interpro_domain']],cls[Funcanno_flgs['AAChange.knownGene']],cls[Funcanno_flgs['rmsk']],cls[Funcanno_flgs['MetaSVM_score']],Freq_gnomAD_genome_POPs,OMIM,Pheno_MIM,orpha,orpha_details,cls[Funcanno_flgs['Otherinfo']]   ))
+                if reader_mmap:
+                    parse=mmap_row_parser(Freqs_flgs,Funcanno_flgs,Allels_flgs,otherinf_pos)
                 else:
-                    fw.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\tclinvar: %s \t InterVar: %s \t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (cls[Allels_flgs['Chr']],cls[Allels_flgs['Start']],cls[Allels_flgs['End']],cls[Allels_flgs['Ref']],cls[Allels_flgs['Alt']],cls[Funcanno_flgs['Gene']],cls[Funcanno_flgs['Func.refGene']],cls[Funcanno_flgs['ExonicFunc.refGene']], cls[Funcanno_flgs['Gene.ensGene']],cls[Funcanno_flgs['avsnp147']],cls[Funcanno_flgs['AAChange.ensGene']],cls[Funcanno_flgs['AAChange.refGene']],clinvar_bp,intervar_bp,cls[Freqs_flgs['gnomAD_genome_ALL']], cls[Freqs_flgs['esp6500siv2_all']], cls[Freqs_flgs['1000g2015aug_all']], cls[Funcanno_flgs['CADD_raw']],cls[Funcanno_flgs['CADD_phred']],cls[Funcanno_flgs['SIFT_score']],  cls[Funcanno_flgs['GERP++_RS']],".", cls[Funcanno_flgs['dbscSNV_ADA_SCORE']], cls[Funcanno_flgs['dbscSNV_RF_SCORE']], cls[Funcanno_flgs['Interpro_domain']],cls[Funcanno_flgs['AAChange.knownGene']],cls[Funcanno_flgs['rmsk']],cls[Funcanno_flgs['MetaSVM_score']],Freq_gnomAD_genome_POPs,OMIM,Pheno_MIM,orpha,orpha_details  ))
+                    parse=row_parser(Freqs_flgs,Funcanno_flgs,Allels_flgs)
 
-                #print("%s\t%s %s" % (line,clinvar_bp,intervar_bp))
+                line_sum=line_sum+1
 
-            line_sum=line_sum+1
+            else:
+                rows=parse(line).genes()
+                if columnar:
+                    chunk.extend(rows)
+                    if len(chunk)>=CHUNK_ROWS:
+                        write_columnar(writer,chunk)
+                        chunk=[]
+                else:
+                    for row in rows:
+                        writer.write(row,assign(BP,row))
+                line_sum=line_sum+len(rows)
+        if chunk:
+            write_columnar(writer,chunk)
+        writer.flush()
 
     except IOError:
-        print("Error: can\'t readi/write the annovar output files %s" % (newoutfile,newoutfile2))
+        print("Error: can\'t read/write the annovar output files %s %s" % (annovar_outfile,newoutfile2))
         sys.exit()
         return
     else:
         fh.close()
         fw.close()
-    return(line_sum)
+    return((sum,line_sum))
 
 
 def main():
@@ -2178,6 +3742,22 @@ def main():
             help="The  database location/dir for the InterVar dataset files", metavar="intervardb")
     group.add_option("-s", "--evidence_file", dest="evidence_file", action="store",
             help="User specified Evidence file for each variant", metavar="your_evidence_file")
+    group.add_option("--skip_pheno_annotation", action="store_true", dest="skip_pheno_annotation",
+            help="Leave the Phenotype_MIM, OrphaNumber and Orpha columns empty, the mim_pheno, mim_orpha and orpha datasets are not read")
+    group.add_option("--kb_mode", dest="kb_mode", action="store",
+            help="How the datasets of the snapshot are held: memory (dicts in each process), mmap (looked up in place in the snapshot, shared by concurrent runs), merge (mmap, the variant datasets walked along the sorted input) or window (memory, the variant datasets read one chromosome at a time)", metavar="memory")
+    group.add_option("--engine", dest="engine", action="store",
+            help="How the criteria are evaluated: row (one variant at a time) or columnar (chunks of variants as numpy arrays, same output)", metavar="row")
+    group.add_option("--reader", dest="reader", action="store",
+            help="How the ANNOVAR output is read: text (decoded line by line) or mmap (bytes read through mmap, only the columns of the criteria decoded, same output)", metavar="text")
+    group.add_option("--short_circuit", action="store_true", dest="short_circuit",
+            help="Stop checking the criteria of a variant once its class can not change, the criteria left unchecked are printed as 0 (row engine)")
+    group.add_option("--threaded_io", action="store_true", dest="threaded_io",
+            help="Read the ANNOVAR output ahead and write the output behind the interpretation in two threads, for slow or network filesystems")
+    group.add_option("--keep_grl_p", action="store_true", dest="keep_grl_p",
+            help="Also write the ANNOVAR output with the Gene column as [$$prefix]_multianno.txt.grl_p, it is not needed by the interpretation")
+    group.add_option("--build_kb", action="store_true", dest="build_kb",
+            help="Parse the InterVar dataset files into the binary snapshot of the buildver and exit, later runs load the snapshot instead of the files")
     parser.add_option_group(group)
     group = optparse.OptionGroup(parser, "   How to add your own Evidence for each Variant",
     """ Prepare your own evidence  file as tab-delimited,the line format:
@@ -2256,6 +3836,20 @@ def main():
     if options.evidence_file != None:
         paras['evidence_file']=options.evidence_file
         print("Warning: You provided your own evidence file [ %s ] for the InterVar." % options.evidence_file)
+    if options.kb_mode != None:
+        paras['kb_mode']=options.kb_mode
+    if options.engine != None:
+        paras['engine']=options.engine
+    if options.reader != None:
+        paras['reader']=options.reader
+    if options.skip_pheno_annotation == True:
+        paras['pheno_annotation']='FALSE'
+    if options.short_circuit == True:
+        paras['short_circuit']='TRUE'
+    if options.keep_grl_p == True:
+        paras['keep_grl_p']='TRUE'
+    if options.threaded_io == True:
+        paras['threaded_io']='TRUE'
     if options.database_intervar != None:
         paras['database_intervar']=options.database_intervar
         paras['lof_genes'] = paras['database_intervar']+'/PVS1.LOF.genes'
@@ -2275,6 +3869,7 @@ def main():
         paras['ps4_snps'] = paras['database_intervar']+'/PS4.variants'
         paras['bs2_snps'] = paras['database_intervar']+'/BS2_hom_het'
         paras['exclude_snps'] = paras['database_intervar']+'/ext.variants'
+        paras['kb_snapshot'] = paras['database_intervar']+'/intervar_kb'
 
     # Update database for specific assembly
     paras['database_locat'] = paras['database_locat']+'/'+str(paras['buildver'])+'/humandb'
@@ -2289,6 +3884,7 @@ def main():
     paras['ps4_snps'] = paras['ps4_snps']+'.'+paras['buildver']
     paras['bs2_snps'] = paras['bs2_snps']+'.'+paras['buildver']
     paras['exclude_snps'] = paras['exclude_snps']+'.'+paras['buildver']
+    paras['kb_snapshot'] = paras['kb_snapshot']+'.'+paras['buildver']
     paras['skip_annovar'] = False;
 
     if options.skip_annovar == True:
@@ -2319,6 +3915,10 @@ def main():
             if options.skip_annovar != True:
                 sys.exit()
 
+    if options.build_kb == True:
+        build_kb()
+        sys.exit()
+
 
     if not os.path.isfile(paras['inputfile']):
         print("Error: Your input file [ %s ] is not here,please check the path of your input file." % paras['inputfile'])
@@ -2351,8 +3951,9 @@ def main():
     out_annf=0; 
     start_time = time.time()
     for annovar_outfile  in glob.iglob(paras['outfile']+"*."+paras['buildver']+"_multianno.txt"):
-        sum1=check_genes(annovar_outfile)
-        sum2=my_inter_var(annovar_outfile)
+        if re.findall('true',paras.get('keep_grl_p','FALSE'), flags=re.IGNORECASE):
+            check_genes(annovar_outfile)
+        (sum1,sum2)=my_inter_var(annovar_outfile)
         out_annf=out_annf+1; 
 
         outfile=annovar_outfile+".intervar"
@@ -2365,6 +3966,7 @@ def main():
             some_file_fail=some_file_fail+1 
             print ("Warning: The InterVar seems not run correctly, please check your inputs and options in configure file")
 
+    print_bloom_stats()
     print("process annovar result took %s seconds", time.time() - start_time)
 
     if inputft.lower() == 'vcf_m' :
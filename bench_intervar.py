@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+'''
+Benchmark of the variant-keyed datasets of InterVar: memory and lookup time of
+the "chr_start_end_ref_alt" string dict used before and of VariantKeyTable.
+With -a, benchmark of the text and mmap readers of the ANNOVAR output instead:
+the time to parse its lines into rows, and the time and peak memory of InterVar
+run on it with --reader=text and --reader=mmap.
+
+usage: python bench_intervar.py [-n variants] [-q queries] [-a multianno [-b buildver] [-t intervardb]]
+'''
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from optparse import OptionParser
+
+import Intervar as iv
+
+
+def random_variants(n, seed=1):
+    rng = random.Random(seed)
+    chroms = [str(i) for i in range(1, 23)] + ["X", "Y"]
+    variants = set()
+    while len(variants) < n:
+        pos = str(rng.randint(1, 249000000))
+        ref = rng.choice("ACGT")
+        alt = rng.choice([nt for nt in "ACGT" if nt != ref])
+        variants.add((rng.choice(chroms), pos, pos, ref, alt))
+    return sorted(variants)
+
+
+def measure(build):
+    # timed without tracemalloc, which slows the allocations down unevenly
+    start_time = time.time()
+    dataset = build()
+    build_time = time.time() - start_time
+    del dataset
+    tracemalloc.start()
+    dataset = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (dataset, size, build_time)
+
+
+def parse_rows(anvfile, reader):
+    start_time = time.time()
+    rows = 0
+    if reader == "mmap":
+        fh = open(anvfile, "rb")
+        lines = iv.mmap_lines(fh)
+    else:
+        fh = open(anvfile, "r")
+        lines = iv.gene_lines(fh)
+    parse = None
+    for line in lines:
+        if parse is None:
+            flgs = [dict((key, 0) for key in iv.FREQ_COLUMNS), dict((key, 0) for key in iv.ROW_COLUMNS), {}]
+            if reader == "mmap":
+                cls = line.decode(iv.text_encoding).split("\t")
+                header = next(iv.gene_lines(["\t".join(cls)]))
+                for dict_ in flgs:
+                    iv.search_key_index(header, dict_)
+                parse = iv.mmap_row_parser(flgs[0], flgs[1], flgs[2], iv.otherinfo_position(cls))
+            else:
+                for dict_ in flgs:
+                    iv.search_key_index(line, dict_)
+                parse = iv.row_parser(flgs[0], flgs[1], flgs[2])
+        elif line.find(b"\t" if reader == "mmap" else "\t") >= 0:
+            parse(line)
+            rows += 1
+    fh.close()
+    return (rows, time.time() - start_time)
+
+
+def run_intervar(anvfile, reader, options, tmpdir):
+    prefix = os.path.join(tmpdir, "bench")
+    outfile = prefix + "." + options.buildver + "_multianno.txt"
+    if not os.path.exists(outfile):
+        os.symlink(os.path.abspath(anvfile), outfile)
+    script = os.path.join(os.path.dirname(os.path.abspath(iv.__file__)), "Intervar.py")
+    command = [sys.executable, script, "-b", options.buildver, "-i", outfile, "--input_type=AVinput", "-o", prefix,
+               "-t", options.database_intervar, "-d", os.path.join(tmpdir, "humandb"), "--skip_annovar", "--reader=" + reader]
+    start_time = time.time()
+    with open(os.path.join(tmpdir, reader + ".log"), "w") as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, cwd=tmpdir)
+        (pid, status, usage) = os.wait4(process.pid, 0)
+    run_time = time.time() - start_time
+    if status != 0 or not os.path.isfile(outfile + ".intervar"):
+        print("Error: InterVar failed with --reader=%s, see %s" % (reader, log.name))
+        sys.exit(1)
+    os.rename(outfile + ".intervar", os.path.join(tmpdir, reader + ".intervar"))
+    return (run_time, usage.ru_maxrss / 1e3)
+
+
+def bench_readers(options):
+    iv.paras["otherinfo"] = "TRUE"
+    print("%-10s %10s %10s %12s %10s" % ("reader", "rows", "parse s", "InterVar s", "peak MB"))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        run_intervar(options.annovar, "text", options, tmpdir) # builds the dataset snapshot
+        for reader in ["text", "mmap"]:
+            (rows, parse_time) = parse_rows(options.annovar, reader)
+            (run_time, peak) = run_intervar(options.annovar, reader, options, tmpdir)
+            print("%-10s %10d %10.2f %12.2f %10.1f" % (reader, rows, parse_time, run_time, peak))
+        with open(os.path.join(tmpdir, "text.intervar"), "rb") as fh, open(os.path.join(tmpdir, "mmap.intervar"), "rb") as fh2:
+            if fh.read() != fh2.read():
+                print("Error: the outputs of the readers differ")
+                sys.exit(1)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    parser = OptionParser(usage=__doc__.strip().splitlines()[-1])
+    parser.add_option("-n", "--variants", type="int", default=1000000, help="number of variants in the dataset")
+    parser.add_option("-q", "--queries", type="int", default=200000, help="number of lookups, half of them hits")
+    parser.add_option("-a", "--annovar", help="benchmark the readers of this ANNOVAR output instead")
+    parser.add_option("-b", "--buildver", default="hg19", help="the buildver of the ANNOVAR output")
+    parser.add_option("-t", "--database_intervar", default="intervardb", help="the InterVar dataset dir")
+    (options, args) = parser.parse_args()
+    if options.annovar:
+        options.database_intervar = os.path.abspath(options.database_intervar)
+        bench_readers(options)
+        return
+
+    variants = random_variants(options.variants)
+    rng = random.Random(2)
+    queries = rng.sample(variants, options.queries // 2) + random_variants(options.queries - options.queries // 2, seed=3)
+    rng.shuffle(queries)
+
+    def build_dict():
+        return dict(("_".join(key), "1") for key in variants)
+
+    def build_table():
+        table = iv.VariantKeyTable()
+        for key in variants:
+            table.add(key, "1")
+        return table.finish()
+
+    (str_dict, dict_size, dict_build) = measure(build_dict)
+    (table, table_size, table_build) = measure(build_table)
+
+    start_time = time.time()
+    dict_hits = sum(1 for key in queries if str_dict.get("_".join(key)) is not None)
+    dict_lookup = time.time() - start_time
+    start_time = time.time()
+    table_hits = sum(1 for key in queries if table.get(key) is not None)
+    table_lookup = time.time() - start_time
+    start_time = time.time()
+    batch_hits = sum(1 for value in table.get_batch(queries) if value is not None)
+    batch_lookup = time.time() - start_time
+    if not dict_hits == table_hits == batch_hits:
+        print("Error: the lookups disagree %d %d %d" % (dict_hits, table_hits, batch_hits))
+        sys.exit(1)
+
+    print("%d variants, %d queries (%d hits)" % (len(variants), len(queries), dict_hits))
+    print("%-22s %10s %10s %12s" % ("", "MB", "build s", "lookup s"))
+    print("%-22s %10.1f %10.2f %12.3f" % ("string dict", dict_size / 1e6, dict_build, dict_lookup))
+    print("%-22s %10.1f %10.2f %12.3f" % ("VariantKeyTable", table_size / 1e6, table_build, table_lookup))
+    print("%-22s %10s %10s %12.3f" % ("VariantKeyTable batch", "", "", batch_lookup))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,742 @@
+import contextlib
+import gc
+import gzip
+import io
+import os
+import pickle
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import warnings
+import Intervar as iv
+
+DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "intervardb")
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def setup_paras(tmpdir, buildver="hg19"):
+    bs2 = os.path.join(tmpdir, "BS2_hom_het." + buildver)
+    with gzip.open(bs2, "wt") as fw:
+        fw.write("1 1000 A G 1 0\n")
+        fw.write("2 2000 C T 0 1\n")
+    iv.paras.clear()
+    iv.paras.update(
+        {
+            "buildver": buildver,
+            "evidence_file": "None",
+            "lof_genes": DB + "/PVS1.LOF.genes." + buildver,
+            "ps1_aa": DB + "/PS1.AA.change.patho." + buildver,
+            "pm1_domain": DB + "/PM1_domains_with_benigns." + buildver,
+            "mim2gene": DB + "/mim2gene.txt",
+            "pp2_genes": DB + "/PP2.genes." + buildver,
+            "bp1_genes": DB + "/BP1.genes." + buildver,
+            "ps4_snps": DB + "/PS4.variants." + buildver,
+            "exclude_snps": DB + "/ext.variants." + buildver,
+            "mim_recessive": DB + "/mim_recessive.txt",
+            "mim_domin": DB + "/mim_domin.txt",
+            "mim_adultonset": DB + "/mim_adultonset.txt",
+            "knowngenecanonical": DB + "/knownGeneCanonical.txt." + buildver,
+            "bs2_snps": bs2,
+            "mim_pheno": DB + "/mim_pheno.txt",
+            "mim_orpha": DB + "/mim_orpha.txt",
+            "orpha": DB + "/orpha.txt.utf8",
+            "kb_snapshot": os.path.join(tmpdir, "intervar_kb." + buildver),
+        }
+    )
+
+
+def as_dict(dataset):
+    if isinstance(dataset, dict):
+        return dict(dataset)
+    return dict(dataset.items())
+
+
+def clear_datasets():
+    for source, names, reader, users in iv.KB_SOURCES:
+        for name in names:
+            if hasattr(getattr(iv, name), "close"):
+                getattr(iv, name).close()
+            setattr(iv, name, {})
+    iv.loaded_datasets.clear()
+    iv.ready_users.clear()
+    iv.gene_records.clear()
+
+
+class TestDatasetSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        setup_paras(self.tmpdir)
+        clear_datasets()
+
+    def tearDown(self):
+        clear_datasets()
+        shutil.rmtree(self.tmpdir)
+
+    def test_snapshot_round_trip(self):
+        iv.build_kb()
+        self.assertTrue(os.path.isfile(iv.paras["kb_snapshot"]))
+        parsed = dict((name, as_dict(getattr(iv, name))) for source, names, reader, users in iv.KB_SOURCES for name in names)
+        clear_datasets()
+        self.assertTrue(iv.open_kb_snapshot())
+        for source, names, reader, users in iv.KB_SOURCES:
+            iv.load_dataset(source)
+        for name, dataset in parsed.items():
+            self.assertEqual(as_dict(getattr(iv, name)), dataset, name)
+
+    def test_snapshot_built_by_the_script(self):
+        main = sys.modules["__main__"]
+        canonical = iv.CanonicalTranscripts()
+        canonical.add("uc001aaa.3", 3, 1000)
+        for module in ["__main__", "Intervar"]:
+            iv.CanonicalTranscripts.__module__ = module
+            main.CanonicalTranscripts = iv.CanonicalTranscripts
+            try:
+                data = pickle.dumps(canonical, pickle.HIGHEST_PROTOCOL)
+            finally:
+                iv.CanonicalTranscripts.__module__ = iv.__name__
+                del main.CanonicalTranscripts
+            self.assertIn(module.encode(), data)
+            self.assertTrue(iv.kb_loads(data).last_exon_or_tail("uc001aaa.3", "exon3", None))
+
+    def test_snapshot_rebuilt_when_source_changes(self):
+        iv.build_kb()
+        st = os.stat(iv.paras["bs2_snps"])
+        os.utime(iv.paras["bs2_snps"], ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        clear_datasets()
+        self.assertFalse(iv.open_kb_snapshot())
+        self.assertEqual(iv.kb_stale, iv.paras["kb_snapshot"])
+        iv.read_datasets()
+        self.assertEqual(iv.kb_index[0], iv.paras["kb_snapshot"])
+        self.assertEqual(iv.loaded_datasets, set())
+        self.assertEqual(len(iv.orpha_dict), 0)
+        iv.need_datasets("check_BS2")
+        self.assertEqual(iv.BS2_snps_dict[("1", "1000", "1000", "A", "G")], ("1", "0"))
+        clear_datasets()
+        self.assertTrue(iv.open_kb_snapshot())
+
+    def test_snapshot_in_user_cache(self):
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.tmpdir, "cache")
+        try:
+            with open(os.path.join(self.tmpdir, "readonly"), "w"):
+                pass
+            iv.paras["kb_snapshot"] = os.path.join(self.tmpdir, "readonly", "intervar_kb.hg19")
+            iv.build_kb()
+            clear_datasets()
+            self.assertTrue(iv.open_kb_snapshot())
+            self.assertTrue(iv.kb_index[0].startswith(os.path.join(self.tmpdir, "cache", "intervar") + os.sep))
+        finally:
+            del os.environ["XDG_CACHE_HOME"]
+
+    def test_datasets_read_on_first_use(self):
+        for build in [False, True]:
+            if build:
+                iv.build_kb()
+                clear_datasets()
+            iv.read_datasets()
+            self.assertEqual(iv.loaded_datasets, set())
+            self.assertEqual(iv.kb_index is not None, build)
+            iv.need_datasets("check_BS2")
+            self.assertEqual(
+                iv.loaded_datasets, set(["mim2gene", "mim_recessive", "mim_domin", "mim_adultonset", "bs2_snps"])
+            )
+            self.assertEqual(iv.BS2_snps_dict[("1", "1000", "1000", "A", "G")], ("1", "0"))
+            self.assertEqual(iv.orpha_dict, {})
+            self.assertFalse(os.path.isfile(iv.paras["kb_snapshot"]) and not build)
+
+    def test_bs2_either_strand(self):
+        iv.read_datasets()
+        iv.need_datasets("check_BS2")
+        self.assertEqual(len(iv.BS2_snps_dict), 2)
+        for ref, alt in [("C", "T"), ("G", "A")]:
+            self.assertEqual(iv.BS2_snps_dict[("2", "2000", "2000") + iv.bs2_alleles(ref, alt)], ("0", "1"))
+        self.assertEqual(iv.bs2_alleles("-", "AG"), ("-", "AG"))
+
+    def test_mmap_tables_match_dicts(self):
+        iv.build_kb()
+        parsed = dict((name, as_dict(getattr(iv, name))) for source, names, reader, users in iv.KB_SOURCES for name in names)
+        clear_datasets()
+        iv.paras["kb_mode"] = "mmap"
+        iv.read_datasets()
+        for source, names, reader, users in iv.KB_SOURCES:
+            iv.load_dataset(source)
+        for name, dataset in parsed.items():
+            table = getattr(iv, name)
+            self.assertEqual(len(table), len(dataset), name)
+            for key, value in dataset.items():
+                self.assertEqual(table[key], value)
+            if isinstance(table, iv.VariantKeyTable):
+                missing = ("1", "1", "1", "A", "C")
+            elif isinstance(table, iv.DomainIndex):
+                self.assertIsInstance(table.pairs, iv.SortedCodes)
+                missing = ("1", "no such gene", "no such domain")
+            else:
+                if isinstance(table, iv.CanonicalTranscripts):
+                    self.assertIsInstance(table.index, iv.BufferKeys)
+                elif isinstance(table, iv.OrphaDetails):
+                    self.assertIsInstance(table.spans, iv.BufferSpans)
+                else:
+                    self.assertIsInstance(table, iv.MmapTable)
+                missing = "no such key"
+            self.assertNotIn(missing, table)
+            self.assertEqual(table.get(missing, "."), ".")
+        iv.kb_mmap = None
+
+
+class TestWindowedTables(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        setup_paras(self.tmpdir)
+        clear_datasets()
+
+    def tearDown(self):
+        clear_datasets()
+        shutil.rmtree(self.tmpdir)
+
+    def test_window_tables_match(self):
+        iv.build_kb()
+        parsed = dict((name, as_dict(getattr(iv, name))) for name in ["aa_sites_dict", "PS4_snps_dict", "BS2_snps_dict"])
+        clear_datasets()
+        iv.paras["kb_mode"] = "window"
+        iv.read_datasets()
+        for name, dataset in parsed.items():
+            iv.need_datasets({"aa_sites_dict": "check_PS1_PM5", "PS4_snps_dict": "check_PS4", "BS2_snps_dict": "check_BS2"}[name])
+            table = getattr(iv, name)
+            self.assertIsInstance(table, iv.WindowedTable)
+            self.assertEqual(len(table), len(dataset), name)
+            keys = sorted(dataset, key=lambda key: (iv.CHROM_CODES.get(key[0], 0), key))
+            self.assertEqual(table.get_batch(keys), [dataset[key] for key in keys])
+            for key in keys[:200]:
+                self.assertEqual(table[key], dataset[key])
+            self.assertEqual(as_dict(table), dataset)
+        self.assertIsInstance(iv.mim2gene_dict, dict)
+
+
+class TestGeneRecord(unittest.TestCase):
+    def setUp(self):
+        clear_datasets()
+        iv.ready_users.add("gene_record")
+        iv.mim2gene_dict.update({"ENSG1": "100", "ENSG2": "200"})
+        iv.mim2gene_dict2.update({"GENEA": "300", "GENEB": "400"})
+        iv.mim_recessive_dict.update({"100": "1", "400": "1"})
+        iv.mim_adultonset_dict.update({"200": "1"})
+        iv.lof_genes_dict["GENEA"] = "1"
+
+    def tearDown(self):
+        clear_datasets()
+
+    def test_mim_priorities(self):
+        gene = iv.gene_record("GENEA", "ENSG1")
+        self.assertEqual((gene.pm2_mim, gene.bs2_mim, gene.omim), ("100", "100", "300"))
+        self.assertEqual((gene.lof, gene.pm2_recessive, gene.bs2_recessive, gene.bs2_domin), ("1", "1", "1", None))
+        gene = iv.gene_record("GENEB", ".")
+        self.assertEqual((gene.pm2_mim, gene.bs2_mim, gene.omim), ("400", None, "400"))
+        self.assertEqual((gene.lof, gene.pm2_recessive, gene.bs2_recessive), (None, "1", None))
+        gene = iv.gene_record(".", "ENSG2")
+        self.assertEqual((gene.pm2_mim, gene.bs2_adultonset, gene.omim), ("200", "1", "200"))
+        gene = iv.gene_record(".", ".")
+        self.assertEqual((gene.pm2_mim, gene.pm2_recessive, gene.bs2_mim, gene.omim), (0, None, None, "."))
+        self.assertIs(iv.gene_record("GENEA", "ENSG1"), iv.gene_record("GENEA", "ENSG1"))
+
+
+class TestPS1PM5(unittest.TestCase):
+    def setUp(self):
+        clear_datasets()
+        iv.ready_users.add("check_PS1_PM5")
+        self.sites = iv.VariantKeyTable()
+        self.sites.add(("1", "100", "100", "", ""), (("C", "W"), ("T", "R")))
+        self.sites.finish()
+        header = ["Func.refGene", "ExonicFunc.refGene", "AAChange.refGene", "dbscSNV_RF_SCORE", "Chr", "Start", "End", "Ref", "Alt"]
+        allels = {"Chr": 0, "Start": 0, "End": 0, "Ref": 0, "Alt": 0}
+        funcanno = {"Func.refGene": 0, "ExonicFunc.refGene": 0, "AAChange.refGene": 0, "dbscSNV_RF_SCORE": 0, "dbscSNV_ADA_SCORE": 0}
+        iv.search_key_index("\t".join(header + ["."]), allels)
+        iv.search_key_index("\t".join(header + ["."]), funcanno)
+        self.parse = iv.row_parser({}, funcanno, allels)
+
+    def tearDown(self):
+        clear_datasets()
+
+    def check(self, alt, aa, func="nonsynonymous SNV"):
+        line = "\t".join(["exonic", func, "G1:NM_1:exon2:c.A5%s:%s" % (alt, aa), ".", "1", "100", "100", "A", alt])
+        return iv.check_PS1_PM5(self.parse(line), self.sites)
+
+    def test_same_and_other_change(self):
+        self.assertEqual(self.check("G", "p.Q5W"), (1, 0))
+        self.assertEqual(self.check("G", "p.Q5H"), (0, 1))
+        self.assertEqual(self.check("C", "p.Q5W"), (0, 0))
+        self.assertEqual(self.check("G", "p.Q5W", "synonymous SNV"), (0, 0))
+
+
+class TestFuncClass(unittest.TestCase):
+    def test_classes(self):
+        self.assertEqual(iv.func_class("exonic nonsynonymous SNV"), iv.FUNC_MISSENSE | iv.FUNC_SYNON | iv.FUNC_NONSYNON)
+        self.assertEqual(iv.func_class("exonic synonymous SNV"), iv.FUNC_SYNON)
+        self.assertEqual(iv.func_class("exonic;splicing frameshift deletion"), iv.FUNC_LOF | iv.FUNC_SPLIC)
+        self.assertEqual(iv.func_class("exonic nonframeshift deletion"), iv.FUNC_LOF | iv.FUNC_NONFRAME | iv.FUNC_INFRAME_INDEL)
+        self.assertEqual(iv.func_class("intronic ."), 0)
+        self.assertIn("intronic .", iv.func_classes)
+
+
+class TestFrequencyKernel(unittest.TestCase):
+    def tearDown(self):
+        iv.freq_kernel = None
+
+    def test_population_cutoffs(self):
+        saved = dict(iv.paras)
+        try:
+            iv.paras["disorder_cutoff"] = "0.01"
+            iv.paras["disorder_cutoff_pops"] = "gnomAD_genome_AFR:0.2"
+            iv.freq_kernel = None
+            kernel = iv.frequency_kernel()
+        finally:
+            iv.paras.clear()
+            iv.paras.update(saved)
+        self.assertEqual(kernel.bs1_cutoffs[iv.FREQ_COLUMNS.index("gnomAD_genome_AFR")], 0.2)
+        self.assertEqual(kernel.bs1_cutoffs[iv.FREQ_COLUMNS.index("gnomAD_genome_ALL")], 0.01)
+        nan = float("nan")
+        rows = [
+            [nan] * 10,
+            [0.06] + [nan] * 9,
+            [nan] * 3 + [0.1] + [nan] * 6,
+            [nan] * 3 + [0.3] + [0.004] * 6,
+            [nan] * 9 + [0.5],
+        ]
+        expected = [(0, 0, 1), (1, 1, 0), (0, 0, 0), (0, 1, 0), (0, 1, 0)]
+        self.assertEqual([kernel.evaluate(values) for values in rows], expected)
+        self.assertEqual(kernel.evaluate_batch(rows), expected)
+
+
+class TestColumnarEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        setup_paras(self.tmpdir)
+        iv.paras["disorder_cutoff"] = "0.01"
+        clear_datasets()
+        iv.freq_kernel = None
+        iv.read_datasets()
+
+    def tearDown(self):
+        clear_datasets()
+        iv.freq_kernel = None
+        shutil.rmtree(self.tmpdir)
+
+    def random_rows(self):
+        rng = random.Random(5)
+        with open(iv.paras["ps1_aa"]) as fh:
+            sites = [line.split("\t") for line in fh.read().split("\n")[:200] if line]
+        genes = ["BRCA1", "TTN", "CFTR", "NOVEL1", "."]
+        exonic = ["nonsynonymous SNV", "synonymous SNV", "stopgain", "stoploss", "frameshift deletion",
+                  "nonframeshift insertion", "nonframeshift substitution", "."]
+        scores = [".", "nan", "x", "0.1", "0.7", "-0.5", "2.5", "0.6"]
+        header = iv.ROW_COLUMNS + iv.FREQ_COLUMNS
+        flgs = dict((key, header.index(key)) for key in header)
+        parse = iv.row_parser(flgs, flgs, flgs)
+        rows = []
+        for i in range(500):
+            site = rng.choice(sites)
+            cells = dict((key, rng.choice(scores)) for key in header)
+            cells.update({"Chr": site[0], "Start": site[1], "End": site[2], "Ref": site[3], "Alt": rng.choice("ACGT"),
+                          "Func.refGene": rng.choice(["exonic", "splicing", "exonic;splicing", "intronic"]),
+                          "ExonicFunc.refGene": rng.choice(exonic), "Gene": rng.choice(genes), "Gene.ensGene": ".",
+                          "AAChange.refGene": "G:NM_1:exon2:c.A5G:" + site[7], "AAChange.knownGene": ".",
+                          "rmsk": rng.choice([".", "Name=AluY"]), "Interpro_domain": rng.choice([".", "Zinc finger"]),
+                          "GERP++_RS": rng.choice(scores), "CLINSIG": "."})
+            for key in iv.FREQ_COLUMNS:
+                cells[key] = rng.choice([".", ".", "0.001", "0.008", "0.2", "nan"])
+            if "synonymous SNV" == cells["ExonicFunc.refGene"]:
+                cells["dbscSNV_RF_SCORE"] = rng.choice([".", "0.1", "0.9"])
+                cells["dbscSNV_ADA_SCORE"] = rng.choice([".", "0.1", "0.9"])
+            rows.append(parse("\t".join(cells[key] for key in header)))
+        return rows
+
+    @unittest.skipIf(iv.import_numpy() is None, "numpy is not installed")
+    def test_same_criteria_as_assign(self):
+        rows = self.random_rows()
+        expected = [iv.assign("UNK", row) for row in rows]
+        self.assertEqual([iv.interpret(row, *criteria) for row, criteria in zip(rows, iv.columnar_criteria(rows))], expected)
+
+    def test_rows_without_numpy(self):
+        rows = self.random_rows()
+        expected = io.StringIO()
+        writer = iv.IntervarWriter(expected, [], [], False)
+        for row in rows:
+            writer.write(row, iv.assign("UNK", row))
+        writer.flush()
+        text = io.StringIO()
+        import_numpy = iv.import_numpy
+        iv.import_numpy = lambda: None
+        try:
+            writer = iv.IntervarWriter(text, [], [], False)
+            iv.write_columnar(writer, rows)
+            writer.flush()
+            self.assertEqual(iv.frequency_kernel().evaluate_batch([row.freq_values for row in rows]),
+                             [iv.frequency_kernel().evaluate(row.freq_values) for row in rows])
+        finally:
+            iv.import_numpy = import_numpy
+        self.assertEqual(text.getvalue(), expected.getvalue())
+
+    def test_numpy_not_loaded_on_import(self):
+        script = "import sys; import Intervar; print('numpy' in sys.modules)"
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=os.path.dirname(DB))
+        self.assertEqual(output.split()[-1], b"False")
+
+    def test_genes_of_a_line(self):
+        rows = self.random_rows()
+        for row in rows:
+            row.gene = row.gene + ";CFTR,TTN"
+        expanded = [gene_row for row in rows for gene_row in row.genes()]
+        self.assertEqual(len(expanded), 3 * len(rows))
+        expected = []
+        for row in expanded:
+            single = row.for_gene(row.gene)
+            single.variant = single
+            single.variant_criteria = {}
+            expected.append(iv.assign("UNK", single))
+        self.assertEqual([iv.assign("UNK", row) for row in expanded], expected)
+        self.assertIs(expanded[1].variant_criteria, expanded[2].variant_criteria)
+        if iv.import_numpy() is not None:
+            self.assertEqual([iv.interpret(row, *criteria) for row, criteria in zip(expanded, iv.columnar_criteria(expanded))], expected)
+
+    def test_short_circuit_same_class(self):
+        rows = self.random_rows()
+        expected = [iv.assign("UNK", row).split(" PVS1=")[0] for row in rows]
+        iv.short_circuit = True
+        try:
+            classes = [iv.assign("UNK", row).split(" PVS1=")[0] for row in rows]
+        finally:
+            iv.short_circuit = False
+        self.assertEqual(classes, expected)
+        self.assertIn("Uncertain significance", classes)
+        self.assertIn("Benign", classes)
+
+
+class TestOmimAnnotation(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        setup_paras(self.tmpdir)
+        clear_datasets()
+        iv.read_datasets()
+        iv.need_datasets("Phenotype_MIM")
+        iv.need_datasets("OrphaNumber")
+        iv.need_datasets("Orpha")
+
+    def tearDown(self):
+        clear_datasets()
+        shutil.rmtree(self.tmpdir)
+
+    def test_orpha_details_read_from_file(self):
+        details = {}
+        with open(iv.paras["orpha"]) as fh:
+            for line in fh.read().split("\n"):
+                cls = line.split("\t")
+                if len(cls) > 1:
+                    details[cls[0]] = cls[1]
+        self.assertEqual(dict(iv.orpha_dict.items()), details)
+        self.assertEqual(iv.orpha_dict.get("no such orpha", "."), ".")
+
+    def test_orpha_details_leave_no_file_open(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", ResourceWarning)
+            orpha = next(iter(iv.orpha_dict.spans))
+            self.assertEqual(iv.orpha_dict[orpha], iv.orpha_dict.get(orpha))
+            iv.orpha_dict.close()
+            iv.orpha_dict = {}
+            gc.collect()
+        self.assertEqual([w for w in caught if issubclass(w.category, ResourceWarning)], [])
+
+    def test_annotation_memo(self):
+        (pheno_mim, orpha, orpha_details) = iv.omim_annotation("100650")
+        self.assertEqual(pheno_mim, iv.mim_pheno_dict["100650"])
+        self.assertIs(iv.omim_annotation("100650")[2], orpha_details)
+        self.assertEqual(iv.omim_annotation("."), (".", "", ""))
+
+
+class TestCheckGenes(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.anvfile = os.path.join(self.tmpdir, "in.hg19_multianno.txt")
+        with open(self.anvfile, "w") as fw:
+            fw.write("Chr\tStart\tEnd\tRef\tAlt\tFunc.refGene\tGene.refGene\tCLNSIG\tOtherinfo1\tOtherinfo2\n")
+            fw.write("chr1\t100\t100\tA\tG\texonic\tBRCA1;TTN\t.\thet\t30\n")
+            fw.write("2\t200\t200\tC\tT\tintronic\tCFTR\tBenign\thom\t40\n")
+
+    def tearDown(self):
+        iv.paras.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def grl_p(self, otherinfo):
+        iv.paras["otherinfo"] = otherinfo
+        self.assertEqual(iv.check_genes(self.anvfile), 3)
+        with open(self.anvfile + ".grl_p") as fh:
+            return fh.read().split("\n")
+
+    def test_one_line_per_variant(self):
+        lines = self.grl_p("FALSE")
+        self.assertEqual(lines[0], "Chr\tStart\tEnd\tRef\tAlt\tFunc.refGene\tGene.refGene\tCLINSIG\tOtherinfo1\tOtherinfo2\tGene\t")
+        self.assertEqual(lines[1], "1\t100\t100\tA\tG\texonic\tBRCA1;TTN\t.\thet\t30\tBRCA1;TTN\t")
+        self.assertEqual(len(lines), 4)
+        lines = self.grl_p("TRUE")
+        self.assertEqual(lines[0], "Chr\tStart\tEnd\tRef\tAlt\tFunc.refGene\tGene.refGene\tCLINSIG\tOtherinfo1\tGene\tOtherinfo2\t")
+        self.assertEqual(lines[2], "2\t200\t200\tC\tT\tintronic\tCFTR\tBenign\thom\tCFTR\t40\t")
+
+    def test_mmap_reader_same_rows(self):
+        iv.paras["otherinfo"] = "TRUE"
+        with open(self.anvfile, "a") as fw:
+            fw.write("chrX\t300\t300\tG\tA\texonic\tDMD\t.\thet\t50\r\n")
+        flgs = [dict((key, 0) for key in iv.FREQ_COLUMNS), dict((key, 0) for key in iv.ROW_COLUMNS), {}]
+        with open(self.anvfile) as fh:
+            lines = list(iv.gene_lines(fh))
+        for dict_ in flgs:
+            iv.search_key_index(lines[0], dict_)
+        parse = iv.row_parser(*flgs)
+        expected = [parse(line) for line in lines[1:]]
+        with open(self.anvfile, "rb") as fh:
+            raw_lines = list(iv.mmap_lines(fh))
+        self.assertEqual(raw_lines[3], b"chrX\t300\t300\tG\tA\texonic\tDMD\t.\thet\t50")
+        cls = raw_lines[0].decode().split("\t")
+        parse = iv.mmap_row_parser(flgs[0], flgs[1], flgs[2], iv.otherinfo_position(cls))
+        rows = [parse(line) for line in raw_lines[1:]]
+        for row, text_row in zip(rows, expected):
+            cells = [getattr(text_row, name) for name in iv.VariantRow.__slots__[: len(iv.ROW_COLUMNS)]] + list(text_row.freqs)
+            self.assertEqual([cell.decode() for cell in row.raw], cells)
+            self.assertEqual((row.chrom, row.gene, row.freqs), (text_row.chrom, text_row.gene, text_row.freqs))
+            self.assertEqual(row.otherinfo, text_row.otherinfo.encode())
+
+    def test_intervar_writer(self):
+        iv.paras["otherinfo"] = "TRUE"
+        flgs = [dict((key, 0) for key in iv.FREQ_COLUMNS), dict((key, 0) for key in iv.ROW_COLUMNS), {}]
+        with open(self.anvfile) as fh:
+            lines = list(iv.gene_lines(fh))
+        for dict_ in flgs:
+            iv.search_key_index(lines[0], dict_)
+        rows = iv.row_parser(*flgs)(lines[1]).genes()
+        with open(self.anvfile, "rb") as fh:
+            raw_lines = list(iv.mmap_lines(fh))
+        parse = iv.mmap_row_parser(flgs[0], flgs[1], flgs[2], iv.otherinfo_position(raw_lines[0].decode().split("\t")))
+        raw_rows = parse(raw_lines[1]).genes()
+        text = io.StringIO()
+        writer = iv.IntervarWriter(text, [], ["true"], False)
+        for row in rows:
+            writer.write(row, "Uncertain significance PVS1=0")
+        writer.flush()
+        encoded = io.BytesIO()
+        writer = iv.IntervarWriter(encoded, [], ["true"], True)
+        for row in raw_rows:
+            writer.write(row, "Uncertain significance PVS1=0")
+        writer.flush()
+        self.assertEqual(encoded.getvalue().decode(), text.getvalue())
+        lines = text.getvalue().split("\n")
+        self.assertEqual(lines[0].split("\t")[12:14], ["clinvar: Clinvar ", " InterVar: InterVar and Evidence "])
+        cells = lines[2].split("\t")
+        self.assertEqual(len(cells), len(iv.INTERVAR_COLUMNS))
+        self.assertEqual(cells[:6] + cells[12:14], ["1", "100", "100", "A", "G", "TTN", "clinvar: UNK ", " InterVar: Uncertain significance PVS1=0 "])
+        self.assertEqual([cell.split(":")[0] for cell in cells[28].split(",")], ["AFR", "AMR", "EAS", "FIN", "NFE", "OTH", "ASJ"])
+        self.assertEqual(cells[-1], "het")
+
+    def test_threaded_io(self):
+        iv.paras["otherinfo"] = "TRUE"
+        with open(self.anvfile) as fh:
+            expected = list(iv.gene_lines(fh))
+        with open(self.anvfile) as fh:
+            self.assertEqual(list(iv.prefetch_lines(iv.gene_lines(fh))), expected)
+        with self.assertRaises(ValueError):
+            list(iv.prefetch_lines(int(line) for line in ["1", "x"]))
+        outfile = os.path.join(self.tmpdir, "out.txt")
+        fw = iv.BlockWriter(open(outfile, "w"))
+        for line in expected:
+            fw.write(line + "\n")
+        fw.close()
+        with open(outfile) as fh:
+            self.assertEqual(fh.read(), "".join(line + "\n" for line in expected))
+
+
+class TestEvidence(unittest.TestCase):
+    def test_compile_evidence(self):
+        (overrides, grades) = iv.compile_evidence("PM1=1;BS2=1;BP3=0;PS5=1;GRADE_PM1=1")
+        self.assertEqual(overrides, ((2, 4, 1), (3, 0, 1), (5, 1, 1), (6, 2, 0)))
+        self.assertEqual(grades, (1, -1, 0, 0, 0))
+        (overrides, grades) = iv.compile_evidence("PVS1=1;BA1=0;PP1=1;PP1=0;GRADE_BS1=3;GRADE_PP2=2;")
+        self.assertEqual(overrides, ((0, 0, "1"), (1, 0, "0"), (4, 0, 0)))
+        self.assertEqual(grades, (0, 1, -1, -1, 1))
+
+    def test_bad_evidence_fails_on_its_variant(self):
+        self.assertRaises(ValueError, iv.compile_evidence, "PS1=x")
+        self.assertRaises(ValueError, iv.evidence_actions, "PS1=x")
+        compiled = iv.compile_evidence("PS1=1")
+        self.assertIs(iv.evidence_actions(compiled), compiled)
+
+
+class TestCanonicalTranscripts(unittest.TestCase):
+    def test_last_exon_or_tail(self):
+        transcripts = iv.CanonicalTranscripts()
+        transcripts.add("uc1", 5, 1000)
+        self.assertTrue(transcripts.last_exon_or_tail("uc1", "exon5", 100.0))
+        self.assertFalse(transcripts.last_exon_or_tail("uc1", "exon4", 950.0))
+        self.assertTrue(transcripts.last_exon_or_tail("uc1", "exon4", 951.0))
+        self.assertFalse(transcripts.last_exon_or_tail("uc1", "exon4", None))
+        self.assertFalse(transcripts.last_exon_or_tail("uc2", "exon5", 999.0))
+        self.assertEqual(transcripts["uc1"], (5, 1000))
+
+
+class TestVariantKeys(unittest.TestCase):
+    def test_pack_round_trip(self):
+        for key in [("1", "12345", "12345", "A", "G"), ("X", "1", "1", "-", "TTAC"), ("MT", "16569", "16569", "ACGTAC", "-")]:
+            self.assertEqual(iv.unpack_variant(iv.pack_variant(*key)), key)
+        self.assertNotEqual(iv.pack_variant("1", "100", "100", "A", "AA"), iv.pack_variant("1", "100", "100", "AA", "A"))
+
+    def test_unpackable_keys_overflow(self):
+        table = iv.VariantKeyTable()
+        keys = [
+            ("1", "100", "100", "A", "G"),
+            ("1", "100", "101", "AT", "-"),
+            ("GL000192.1", "5", "5", "C", "T"),
+            ("2", "0100", "0100", "C", "T"),
+            ("3", "7", "7", "ACGTACG", "A"),
+            ("4", "8", "8", "N", "A"),
+            ("5", "9", "9", "", "C"),
+        ]
+        for i, key in enumerate(keys):
+            table.add(key, str(i % 2))
+        table.finish()
+        self.assertEqual(len(table), len(keys))
+        self.assertEqual(dict(table.items()), dict((key, str(i % 2)) for i, key in enumerate(keys)))
+        self.assertEqual(table.get_batch(keys + [("2", "100", "100", "C", "T")], "."), [str(i % 2) for i in range(len(keys))] + ["."])
+        self.assertRaises(KeyError, table.__getitem__, ("2", "100", "100", "C", "T"))
+
+    def test_values_read_in_place(self):
+        table = iv.VariantKeyTable()
+        values = ["1", ("0", "1"), (), ("",), (("A", "E"), ("T", "I")), ((), ("G",)), (1, "x")]
+        for i, value in enumerate(values):
+            table.add(("1", str(100 + i), str(100 + i), "A", "G"), value)
+        table.add(("1", "100", "101", "AT", "-"), ("0", "0"))
+        table.finish()
+        buffer = table.to_bytes()
+        in_place = iv.VariantKeyTable.from_buffer(buffer, 0)
+        self.assertIsInstance(in_place.values, iv.BufferValues)
+        self.assertEqual(list(in_place.values), table.values)
+        self.assertEqual(dict(in_place.items()), dict(table.items()))
+
+    def test_merge_find_matches_bisect(self):
+        table = iv.VariantKeyTable()
+        for chrom in ["1", "2", "X"]:
+            for pos in range(100, 3000, 7):
+                table.add((chrom, str(pos), str(pos), "A", "G"), chrom + str(pos))
+        table.finish()
+        queries = [(chrom, str(pos), str(pos), "A", "G") for chrom in ["1", "2", "3", "X"] for pos in range(90, 3010, 3)]
+        expected = [table.get(key) for key in queries]
+        shuffled = list(queries)
+        random.Random(1).shuffle(shuffled)
+        iv.kb_merge = True
+        try:
+            self.assertEqual([table.get(key) for key in queries], expected)
+            self.assertEqual([table.get(key) for key in shuffled], [expected[queries.index(key)] for key in shuffled])
+        finally:
+            iv.kb_merge = False
+
+    def test_bloom_lookup(self):
+        table = iv.VariantKeyTable()
+        for pos in range(1000, 2000):
+            table.add(("1", str(pos), str(pos), "A", "G"), "1")
+        table.add(("GL000192.1", "5", "5", "C", "T"), "2")
+        table.add(("3", "10", "12", "ACG", "-"), "3")
+        table.finish()
+        for pos in range(1000, 2000):
+            self.assertEqual(table.lookup("chr1", str(pos), str(pos), "A", "G", strip_chr=True), "1")
+        self.assertEqual(table.lookup("GL000192.1", "5", "5", "C", "T"), "2")
+        self.assertEqual(table.lookup("CHR3", "10", "12", "ACG", "-", strip_chr=True), "3")
+        self.assertRaises(KeyError, table.lookup, "chr1", "1000", "1000", "A", "G")
+        for pos in range(5000, 15000):
+            self.assertRaises(KeyError, table.lookup, "2", str(pos), str(pos), "A", "G")
+        (lookups, passed, found) = table.stats
+        self.assertEqual(found, 1002)
+        self.assertLess(passed - found, 500)
+
+
+class TestMain(unittest.TestCase):
+    """
+    main() on tests/data: an ANNOVAR output of 72 lines picked to give every
+    class and most criteria, with the BS2_hom_het and the evidence file of its
+    variants; in.hg19_multianno.txt.intervar is the output of the original
+    InterVar.py on them
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmpdir, "db")
+        os.mkdir(self.db)
+        for name in os.listdir(DB):
+            if not name.startswith("intervar_kb."):
+                os.symlink(os.path.join(DB, name), os.path.join(self.db, name))
+        shutil.copy(os.path.join(DATA, "BS2_hom_het.hg19"), self.db)
+        self.anvfile = os.path.join(self.tmpdir, "in.hg19_multianno.txt")
+        shutil.copy(os.path.join(DATA, "in.hg19_multianno.txt"), self.anvfile)
+        self.avinput = os.path.join(self.tmpdir, "in.avinput")
+        with open(self.avinput, "w") as fw:
+            fw.write("1\t1\t1\tA\tG\n")
+
+    def tearDown(self):
+        clear_datasets()
+        iv.paras.clear()
+        iv.freq_kernel = None
+        iv.kb_mmap = None
+        shutil.rmtree(self.tmpdir)
+
+    def main(self, *options):
+        for outfile in [self.anvfile + ".intervar", self.anvfile + ".grl_p"]:
+            if os.path.exists(outfile):
+                os.remove(outfile)
+        clear_datasets()
+        for name in ["PS4_snps_dict", "BS2_snps_dict", "exclude_snps_dict"]:
+            setattr(iv, name, iv.VariantKeyTable())
+        iv.paras.clear()
+        iv.freq_kernel = None
+        argv = sys.argv
+        sys.argv = ["Intervar.py", "-b", "hg19", "-i", self.avinput, "--input_type=AVinput", "-o", os.path.join(self.tmpdir, "in"),
+                    "-t", self.db, "-d", os.path.join(self.tmpdir, "humandb"), "-s", os.path.join(DATA, "evidence.txt"),
+                    "--skip_annovar"] + list(options)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                iv.main()
+        except SystemExit:
+            pass
+        finally:
+            sys.argv = argv
+
+    def intervar(self, *options):
+        self.main(*options)
+        with open(self.anvfile + ".intervar", "rb") as fh:
+            return fh.read()
+
+    def expected(self):
+        with open(os.path.join(DATA, "in.hg19_multianno.txt.intervar"), "rb") as fh:
+            return fh.read()
+
+    def test_same_output_in_every_mode(self):
+        expected = self.expected()
+        self.assertEqual(len(expected.split(b"\n")), 92)
+        for name in [b"Pathogenic", b"Likely pathogenic", b"Uncertain significance", b"Likely benign", b"Benign"]:
+            self.assertIn(b" InterVar: " + name + b" PVS1=", expected)
+        self.assertEqual(self.intervar(), expected)
+        self.main("--build_kb")
+        for options in [["--engine=columnar"], ["--reader=mmap"], ["--threaded_io"], ["--kb_mode=memory"], ["--kb_mode=mmap"],
+                        ["--kb_mode=merge"], ["--kb_mode=window"], ["--engine=columnar", "--reader=mmap", "--threaded_io", "--kb_mode=merge"]]:
+            self.assertEqual(self.intervar(*options), expected, options)
+
+    def test_short_circuit_same_class(self):
+        expected = re.sub(b" PVS1=[^\t]*", b"", self.expected())
+        for options in [["--short_circuit"], ["--short_circuit", "--engine=columnar"]]:
+            self.assertEqual(re.sub(b" PVS1=[^\t]*", b"", self.intervar(*options)), expected, options)
+
+    def test_grl_p_only_when_kept(self):
+        self.main()
+        self.assertFalse(os.path.exists(self.anvfile + ".grl_p"))
+        self.main("--keep_grl_p")
+        with open(self.anvfile + ".grl_p") as fh:
+            self.assertEqual(len(fh.read().split("\n")), 73)
+
+
+if __name__ == "__main__":
+    unittest.main()